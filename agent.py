@@ -5,15 +5,27 @@ import random
 from dotenv import load_dotenv
 
 from livekit import agents
-from livekit.agents import AgentSession, Agent, RoomInputOptions
+from livekit.agents import AgentSession, Agent, RoomInputOptions, RunContext, StopResponse, function_tool, metrics
 from livekit.plugins import (
     openai,
     noise_cancellation,
     silero,
 )
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
-from livekit import api
+from livekit import api, rtc
 import json
+import time
+
+from agent_pool import build_components, prewarm, WARM_POOL_SIZE
+from call_outcomes import OutcomeReporter, OUTCOME_INSTRUCTIONS, REPORTABLE_OUTCOMES, sip_failure_event
+from ivr import IVRNavigator, IVR_ENABLED, DTMF_CODES, cached_path, dial_dtmf
+from hold_detector import HoldDetector, HOLD_DETECTION_ENABLED, is_hold_message, mentions_hold
+from context_budget import ContextBudget, CONTEXT_TOKEN_BUDGET
+from preemptive import PreemptiveDrafter, PREEMPTIVE_GENERATION, use_builtin
+from worker_load import (
+    WorkerLoad, ensure_lag_monitor, run_workers, start_capacity_server,
+    WORKER_LOAD_THRESHOLD, WORKER_PROCESSES, WORKER_HTTP_PORT_BASE,
+)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -23,10 +35,78 @@ print("Agent script starting...")
 
 # Define your agent's core behavior
 class Assistant(Agent):
-    def __init__(self, script) -> None:
-        super().__init__(instructions=script)
+    def __init__(self, script, reporter=None, ivr=None) -> None:
+        super().__init__(instructions=script + OUTCOME_INSTRUCTIONS if reporter else script)
+        self.reporter = reporter
+        self.ivr = ivr
+        # Set once the clinic's audio is being monitored
+        self.hold = None
+        # Keeps per-turn prompt size flat on long calls
+        self.context_budget = ContextBudget() if CONTEXT_TOKEN_BUDGET > 0 else None
+        # Drafts replies from stable interim transcripts before the turn is final,
+        # unless the session does that itself
+        self.drafter = PreemptiveDrafter(self) if PREEMPTIVE_GENERATION and not use_builtin() else None
         print("Assistant agent initialized.")
 
+    async def on_user_turn_completed(self, turn_ctx, new_message) -> None:
+        # Hold announcements get no reply: the whole turn is one, or it mentions hold and the
+        # audio says hold too. Automated menus are answered with DTMF directly
+        text = new_message.text_content or ""
+        on_hold = is_hold_message(text) or (mentions_hold(text) and self.hold and self.hold.looks_like_hold())
+        if on_hold or (self.ivr and await self.ivr.handle_turn(text)):
+            if self.drafter:
+                self.drafter.discard()
+            raise StopResponse()
+
+        if self.context_budget:
+            trimmed = self.context_budget.apply(turn_ctx)
+            turn_ctx.items[:] = trimmed.items
+            await self.update_chat_ctx(trimmed)
+
+    async def llm_node(self, chat_ctx, tools, model_settings):
+        # Commit a preemptive draft when this turn is the one it was drafted for
+        draft = self.drafter.take(chat_ctx, tools) if self.drafter else None
+        if draft:
+            async for chunk in draft.stream():
+                yield chunk
+            return
+        async for chunk in Agent.default.llm_node(self, chat_ctx, tools, model_settings):
+            yield chunk
+
+    @function_tool()
+    async def report_outcome(
+        self,
+        context: RunContext,
+        outcome: str,
+        appointment_date: str = "",
+        appointment_time: str = "",
+        confirmation_number: str = "",
+        reason: str = "",
+    ):
+        """Report the outcome of this call as soon as it is known.
+
+        Args:
+            outcome: "booked", "declined", "voicemail", "invalid_number" or "do_not_call"
+            appointment_date: Date of the booked appointment
+            appointment_time: Time of the booked appointment
+            confirmation_number: Confirmation number given by the office, if any
+            reason: Why the appointment could not be booked (e.g. "fax machine", "not in service")
+        """
+        if outcome not in REPORTABLE_OUTCOMES:
+            return f"Unknown outcome '{outcome}'. Use one of: {', '.join(REPORTABLE_OUTCOMES)}."
+        if self.reporter is None:
+            return "Outcome noted. Politely wrap up the call."
+        reported = await self.reporter.report(
+            outcome,
+            appointment_date=appointment_date,
+            appointment_time=appointment_time,
+            confirmation_number=confirmation_number,
+            reason=reason,
+        )
+        if not reported:
+            return f"The outcome was already reported as '{self.reporter.final}'."
+        return "Outcome recorded. Politely wrap up the call."
+
 
 # Function to create an outbound call (dispatches an agent)
 # This function is not directly used when the agent is run for playground testing,
@@ -35,6 +115,8 @@ class Assistant(Agent):
 # The entrypoint function is called when a job is assigned to this worker
 async def entrypoint(ctx: agents.JobContext):
     print(f"Entrypoint called for job {ctx.job.id} in room {ctx.room.name}")
+    # Event-loop lag of this job process feeds the worker's reported load
+    ensure_lag_monitor()
     
     llama_model = os.getenv("LLAMA_MODEL")
     llama_base_url = os.getenv("LLAMA_OPENAI_BASE_URL")
@@ -49,36 +131,74 @@ async def entrypoint(ctx: agents.JobContext):
             ctx.shutdown()
             return
     phone_number = dial_info.get("phone_number")
+    # Keyed in once the call connects, unless a cached IVR path already gets past the menu
+    extension = dial_info.get("extension")
+    call_id = dial_info.get("call_id")
+    reporter = OutcomeReporter(call_id, ctx.room) if call_id else None
+
+    ivr = None
+    if phone_number and IVR_ENABLED:
+        async def send_dtmf(digit):
+            await ctx.room.local_participant.publish_dtmf(code=DTMF_CODES[digit], digit=digit)
+
+        ivr = IVRNavigator(phone_number, send_dtmf, cached_path(phone_number) or extension)
+        if ivr.cached_digits:
+            print(f"IVR: keying in '{ivr.cached_digits}' for {phone_number}")
     script = dial_info.get("script", "Hello, this is your AI assistant. How can I help you today?")
     print(script)
 
     if not all([llama_model, llama_base_url, llama_api_key]):
         print("CRITICAL ERROR: LLAMA_MODEL, LLAMA_OPENAI_BASE_URL, or LLAMA_OPENAI_API_KEY environment variables are not set.")
         print("Please ensure your .env file is correctly configured for the LLM. Shutting down agent.")
+        if reporter:
+            await reporter.report("failed", reason="agent LLM not configured")
         ctx.shutdown() # Shutdown if LLM config is missing, as the agent won't function
         return
 
+    # Take pre-built components from the warm pool when the worker has one
+    pool = ctx.proc.userdata.get("pool")
+    bundle = pool.acquire() if pool else None
+
     try:
-        print("Initializing AgentSession components...")
-        session = AgentSession(
-            stt=openai.STT(model="gpt-4o-transcribe", language="en"),
-            llm=openai.LLM(model=llama_model, base_url=llama_base_url, api_key=llama_api_key),
-            tts=openai.TTS(model="gpt-4o-mini-tts", voice="ash", instructions="Speak in a friendly and conversational tone.",),
-            vad=silero.VAD.load(),
-            turn_detection=MultilingualModel(),
-        )
+        if bundle:
+            print("Using warm AgentSession components from the pool.")
+            components = bundle["components"]
+            # Open upstream connections now; they finish while the call is ringing
+            pool.warm_connections(bundle)
+        else:
+            print("Initializing AgentSession components...")
+            components = build_components(ctx.proc.userdata.get("vad"))
+        # livekit-agents' own preemptive generation, where available, replaces PreemptiveDrafter
+        session = AgentSession(**components, **({"preemptive_generation": True} if use_builtin() else {}))
         print("AgentSession components initialized successfully.")
     except Exception as e:
         print(f"CRITICAL ERROR: Failed to initialize AgentSession or its plugins: {e}")
         print("Please check your LLM/STT/TTS API keys, models, and network connectivity. Shutting down agent.")
+        if reporter:
+            await reporter.report("failed", reason=f"agent session failed: {e}")
         ctx.shutdown()
         return
 
+    assistant = Assistant(script=script, reporter=reporter, ivr=ivr)
+
+    # LLM tokens, STT audio and TTS characters used on this call, for cost accounting
+    usage_collector = metrics.UsageCollector()
+
+    @session.on("metrics_collected")
+    def _on_metrics_collected(ev):
+        usage_collector.collect(ev.metrics)
+
+    if assistant.drafter:
+        @session.on("user_input_transcribed")
+        def _on_interim_transcript(ev):
+            assistant.drafter.on_transcript(ev.transcript, ev.is_final)
+
     try:
         print("Starting AgentSession and connecting agent to room...")
+        session_started = time.perf_counter()
         await session.start(
             room=ctx.room,
-            agent=Assistant(script=script),
+            agent=assistant,
             room_input_options=RoomInputOptions(
                 noise_cancellation=noise_cancellation.BVCTelephony(), 
             ),
@@ -90,6 +210,8 @@ async def entrypoint(ctx: agents.JobContext):
     except Exception as e:
         print(f"CRITICAL ERROR: Failed to start AgentSession or connect to room: {e}")
         print("Agent may not appear in the playground. Shutting down agent.")
+        if reporter:
+            await reporter.report("failed", reason=f"agent could not join the room: {e}")
         ctx.shutdown()
         return
 
@@ -99,8 +221,41 @@ async def entrypoint(ctx: agents.JobContext):
     
 
     
+    hold = None
+
+    # Answer-to-first-audio: time from the SIP answer until the agent first speaks
+    call_timing = {"answered_at": None, "first_audio_ms": None}
+
+    @session.on("agent_state_changed")
+    def _on_agent_state_changed(ev):
+        if ev.new_state == "speaking" and call_timing["answered_at"] and call_timing["first_audio_ms"] is None:
+            call_timing["first_audio_ms"] = (time.perf_counter() - call_timing["answered_at"]) * 1000
+            print(f"Answer-to-first-audio: {call_timing['first_audio_ms']:.0f} ms")
+
     if phone_number:
         sip_participant_identity = phone_number 
+
+        if HOLD_DETECTION_ENABLED:
+            hold = HoldDetector(session)
+            assistant.hold = hold
+
+            @ctx.room.on("track_subscribed")
+            def _on_track_subscribed(track, publication, participant):
+                if participant.identity == sip_participant_identity and track.kind == rtc.TrackKind.KIND_AUDIO:
+                    hold.watch(track)
+
+            @session.on("user_input_transcribed")
+            def _on_user_input_transcribed(ev):
+                if ev.is_final:
+                    hold.on_transcript(ev.transcript)
+
+        if reporter:
+            @ctx.room.on("participant_disconnected")
+            def _on_participant_disconnected(participant):
+                # The clinic hung up before the agent reported an outcome
+                if participant.identity == sip_participant_identity:
+                    asyncio.create_task(reporter.report("hung_up"))
+
         print(f"Attempting to create SIP participant for phone number: {phone_number}")
 
         try:
@@ -117,16 +272,25 @@ async def entrypoint(ctx: agents.JobContext):
                 sip_call_to=phone_number,
                 participant_identity=sip_participant_identity,
                 wait_until_answered=True, 
+                # Known IVR path or extension for this clinic, keyed in as soon as the call connects
+                dtmf=dial_dtmf(ivr.cached_digits if ivr else extension),
             ))
+            call_timing["answered_at"] = time.perf_counter()
             print(f"SIP call to {phone_number} picked up successfully.")
+            if reporter:
+                await reporter.report("answered")
         except api.TwirpError as e:
             print(f"CRITICAL ERROR: Failed to create SIP participant for {phone_number}: {e.message}")
             print(f"SIP status code: {e.metadata.get('sip_status_code')}, Status: {e.metadata.get('sip_status')}")
             print("Please check your SIP Trunk ID, phone number, and LiveKit SIP configuration. Shutting down agent.")
+            if reporter:
+                await reporter.report(sip_failure_event(e.metadata.get('sip_status_code')), reason=e.message)
             ctx.shutdown()
             return 
         except Exception as e:
             print(f"An unexpected error occurred during SIP participant creation: {e}")
+            if reporter:
+                await reporter.report("failed", reason=str(e))
             ctx.shutdown()
             return
 
@@ -141,11 +305,59 @@ async def entrypoint(ctx: agents.JobContext):
     await ctx.room.wait_closed()
     print("Agent session closed.")
 
+    if reporter:
+        await reporter.report("hung_up")
+    if ivr:
+        print(f"IVR stats: {ivr.stats}")
+    if assistant.context_budget:
+        print(f"Context budget stats: {assistant.context_budget.stats}")
+
+    usage = usage_collector.get_summary()
+    ended = time.perf_counter()
+    call_metrics = {
+        "session_seconds": round(ended - session_started, 1),
+        "call_seconds": round(ended - call_timing["answered_at"], 1) if call_timing["answered_at"] else 0,
+        "answer_to_first_audio_ms": round(call_timing["first_audio_ms"]) if call_timing["first_audio_ms"] is not None else None,
+        "llm_prompt_tokens": usage.llm_prompt_tokens,
+        "llm_completion_tokens": usage.llm_completion_tokens,
+        "stt_audio_seconds": round(usage.stt_audio_duration, 1),
+        "tts_characters": usage.tts_characters_count,
+    }
+    if hold:
+        await hold.aclose()
+        call_metrics.update(hold.metrics())
+    if assistant.drafter:
+        assistant.drafter.discard()
+        call_metrics.update(assistant.drafter.metrics())
+    print(f"Call metrics: {call_metrics}")
+    if reporter:
+        await reporter.report("metrics", metrics=call_metrics)
+
 
 if __name__ == "__main__":
+    import sys
+    worker_index = os.getenv("WORKER_INDEX")
+    if WORKER_PROCESSES > 1 and worker_index is None:
+        # Supervisor: run WORKER_PROCESSES workers of this script on this host
+        sys.exit(run_workers(os.path.abspath(__file__), sys.argv[1:]))
+
+    extra_options = {}
+    if worker_index is not None:
+        # One health-check port per worker process on the host
+        extra_options["port"] = WORKER_HTTP_PORT_BASE + int(worker_index)
+    else:
+        start_capacity_server()
+    if WARM_POOL_SIZE is not None:
+        # Otherwise livekit's default number of prewarmed idle job processes
+        extra_options["num_idle_processes"] = WARM_POOL_SIZE
     worker_options = agents.WorkerOptions(
         entrypoint_fnc=entrypoint, 
-        agent_name="Medicall Assistant"
+        prewarm_fnc=prewarm,
+        agent_name="Medicall Assistant",
+        # Sessions, CPU and event-loop lag; no new jobs at or above the threshold
+        load_fnc=WorkerLoad(int(worker_index or 0)),
+        load_threshold=WORKER_LOAD_THRESHOLD,
+        **extra_options,
     )
     print(f"Starting LiveKit Agent CLI. Configured agent_name: '{worker_options.agent_name}'") 
     
@@ -0,0 +1,96 @@
+"""
+Warm agent pool for the LiveKit worker.
+
+Building an AgentSession from scratch on every dispatch (loading Silero
+VAD, constructing STT/LLM/TTS clients and the turn detector, opening their
+upstream connections) happens while the clinic's phone is ringing or, worse,
+after it has been answered. In warm pool mode:
+
+  - each idle job process livekit keeps around is prewarmed by prewarm()
+    with the VAD model and a ready-built component bundle
+  - entrypoint() takes the bundle, opens its upstream connections while the
+    SIP call is still ringing, and binds it to the new room/script
+
+livekit runs one job per process and never hands a finished process a new
+job, so bundles are used once and not returned. The number of idle
+processes is livekit's own default unless WARM_POOL_SIZE is set
+(WorkerOptions.num_idle_processes).
+
+Answer-to-first-audio latency (SIP answer until the agent first speaks) is
+reported with each call's metrics.
+"""
+import os
+
+from livekit.plugins import openai, silero
+from livekit.plugins.turn_detector.multilingual import MultilingualModel
+
+WARM_POOL_ENABLED = os.getenv("WARM_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+# Idle job processes to keep; None leaves livekit's default
+WARM_POOL_SIZE = int(os.environ["WARM_POOL_SIZE"]) if os.getenv("WARM_POOL_SIZE") else None
+
+
+def build_components(vad=None):
+    """STT/LLM/TTS/VAD/turn detector for one AgentSession, or None if the LLM isn't configured"""
+    llama_model = os.getenv("LLAMA_MODEL")
+    llama_base_url = os.getenv("LLAMA_OPENAI_BASE_URL")
+    llama_api_key = os.getenv("LLAMA_OPENAI_API_KEY")
+    if not all([llama_model, llama_base_url, llama_api_key]):
+        return None
+
+    return {
+        "stt": openai.STT(model="gpt-4o-transcribe", language="en"),
+        "llm": openai.LLM(model=llama_model, base_url=llama_base_url, api_key=llama_api_key),
+        "tts": openai.TTS(model="gpt-4o-mini-tts", voice="ash", instructions="Speak in a friendly and conversational tone.",),
+        "vad": vad or silero.VAD.load(),
+        "turn_detection": MultilingualModel(),
+    }
+
+
+class WarmSessionPool:
+    """A pre-built session component bundle for the job this process will run"""
+
+    def __init__(self, vad):
+        self.vad = vad
+        self.bundle = None
+
+    def _new_bundle(self):
+        components = build_components(self.vad)
+        if components is None:
+            return None
+        return {"components": components, "warmed": False}
+
+    def fill(self):
+        self.bundle = self._new_bundle()
+        if self.bundle is None:
+            print("Warm pool not filled: LLAMA_MODEL, LLAMA_OPENAI_BASE_URL or LLAMA_OPENAI_API_KEY missing")
+        else:
+            print("Warm pool ready with a session bundle")
+
+    def acquire(self):
+        """The prewarmed bundle, or a freshly built one if there is none"""
+        bundle, self.bundle = self.bundle, None
+        return bundle or self._new_bundle()
+
+    def warm_connections(self, bundle):
+        """Open upstream connections ahead of the first turn (runs while the call rings)"""
+        if bundle["warmed"]:
+            return
+        for name in ("stt", "llm", "tts"):
+            prewarm = getattr(bundle["components"][name], "prewarm", None)
+            if prewarm:
+                try:
+                    prewarm()
+                except Exception as e:
+                    print(f"Could not prewarm {name}: {e}")
+        bundle["warmed"] = True
+
+
+def prewarm(proc):
+    """WorkerOptions.prewarm_fnc: load models and build the pool before any job arrives"""
+    print("Prewarming agent process...")
+    vad = silero.VAD.load()
+    proc.userdata["vad"] = vad
+    if WARM_POOL_ENABLED:
+        pool = WarmSessionPool(vad)
+        pool.fill()
+        proc.userdata["pool"] = pool
@@ -0,0 +1,221 @@
+"""
+Per-request cost and resource accounting.
+
+Every upstream call (Llama extraction and query parsing, SerpAPI pages,
+LiveKit agent dispatch) is recorded with the id of the API request that
+made it, the units it used, its estimated cost and its wall time. Calls
+placed by the agent report their own usage (SIP minutes, STT seconds, TTS
+characters, LLM tokens) with the per-call metrics event, and are tied back
+to the request that dispatched them through the call id.
+
+Records go to SQLite (ACCOUNTING_DB); rollups() and cost_per_booking()
+answer "what did this request / call / service cost" and "what does a
+booking cost". Unit prices are list-price defaults, overridable per env var.
+"""
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+ACCOUNTING_DB = os.getenv("ACCOUNTING_DB", "accounting.db")
+
+# USD per unit; set these to your contract rates
+UNIT_PRICES = {
+    "llama_prompt_tokens": float(os.getenv("COST_LLAMA_PROMPT_PER_MTOK", "0.27")) / 1e6,
+    "llama_completion_tokens": float(os.getenv("COST_LLAMA_COMPLETION_PER_MTOK", "0.85")) / 1e6,
+    "serp_searches": float(os.getenv("COST_SERP_PER_SEARCH", "0.015")),
+    "dispatches": 0.0,
+    "agent_minutes": float(os.getenv("COST_LIVEKIT_AGENT_PER_MIN", "0.01")),
+    "sip_minutes": float(os.getenv("COST_SIP_PER_MIN", "0.01")),
+    "stt_seconds": float(os.getenv("COST_STT_PER_MIN", "0.006")) / 60,
+    "tts_characters": float(os.getenv("COST_TTS_PER_MCHAR", "12")) / 1e6,
+}
+
+# Id of the API request being handled, set by the request middleware
+current_request_id = contextvars.ContextVar("current_request_id", default=None)
+
+_lock = threading.Lock()
+_initialized = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_id TEXT,
+    call_id TEXT,
+    service TEXT NOT NULL,
+    units TEXT NOT NULL,
+    cost_usd REAL NOT NULL,
+    wall_ms REAL NOT NULL,
+    ok INTEGER NOT NULL,
+    booked INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_request ON usage (request_id);
+CREATE INDEX IF NOT EXISTS usage_call ON usage (call_id);
+CREATE INDEX IF NOT EXISTS usage_created ON usage (created_at);
+"""
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(ACCOUNTING_DB, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _initialized = True
+    return conn
+
+
+def cost_of(units):
+    return sum(UNIT_PRICES.get(name, 0.0) * (value or 0) for name, value in units.items())
+
+
+def record_usage(service, units, wall_ms=0.0, ok=True, call_id=None, request_id=None, booked=False):
+    """
+    Record one upstream call
+
+    Args:
+        service (str): e.g. "llama_extraction", "serpapi", "livekit_dispatch", "agent_session"
+        units (dict): Units used, keyed like UNIT_PRICES ({"serp_searches": 1})
+        wall_ms (float): Wall time of the call
+        call_id (str): Outbound call this usage belongs to, if any
+        request_id (str): Defaults to the current API request
+    """
+    request_id = request_id or current_request_id.get()
+    try:
+        with _lock:
+            conn = _connect()
+            try:
+                with conn:
+                    if request_id is None and call_id:
+                        # Agent-side usage: inherit the request that dispatched the call
+                        row = conn.execute(
+                            "SELECT request_id FROM usage WHERE call_id = ? AND request_id IS NOT NULL LIMIT 1",
+                            (call_id,),
+                        ).fetchone()
+                        request_id = row[0] if row else None
+                    conn.execute(
+                        "INSERT INTO usage (request_id, call_id, service, units, cost_usd, wall_ms, ok, booked, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (request_id, call_id, service, json.dumps(units), cost_of(units),
+                         round(wall_ms, 1), int(ok), int(booked), time.time()),
+                    )
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Accounting unavailable, usage not recorded: {e}")
+
+
+@contextmanager
+def track(service, **units):
+    """
+    Time an upstream call and record it on exit:
+
+        with track("serpapi", serp_searches=1) as usage:
+            ...
+            usage["units"]["serp_searches"] += 1
+    """
+    usage = {"units": dict(units), "ok": True, "call_id": None}
+    started = time.perf_counter()
+    try:
+        yield usage
+    except Exception:
+        usage["ok"] = False
+        raise
+    finally:
+        record_usage(service, usage["units"], (time.perf_counter() - started) * 1000,
+                     ok=usage["ok"], call_id=usage["call_id"])
+
+
+def llama_units(response_data):
+    """Token units from a Llama API response's "metrics" list"""
+    units = {}
+    for metric in (response_data or {}).get("metrics", []):
+        if metric.get("metric") == "num_prompt_tokens":
+            units["llama_prompt_tokens"] = metric.get("value", 0)
+        elif metric.get("metric") == "num_completion_tokens":
+            units["llama_completion_tokens"] = metric.get("value", 0)
+    return units
+
+
+def record_call_usage(call, metrics):
+    """Usage reported by the agent for one call (the per-call metrics event)"""
+    call_seconds = metrics.get("call_seconds") or 0
+    units = {
+        "agent_minutes": round(metrics.get("session_seconds", call_seconds) / 60, 3),
+        "sip_minutes": round(call_seconds / 60, 3),
+        "stt_seconds": metrics.get("stt_audio_seconds", 0),
+        "tts_characters": metrics.get("tts_characters", 0),
+        "llama_prompt_tokens": metrics.get("llm_prompt_tokens", 0),
+        "llama_completion_tokens": metrics.get("llm_completion_tokens", 0),
+    }
+    booked = (call.get("outcome") or {}).get("status") == "booked"
+    record_usage("agent_session", units, call_seconds * 1000, call_id=call["call_id"], booked=booked)
+
+
+GROUPS = {"request": "request_id", "call": "call_id", "service": "service"}
+
+
+def rollups(group_by="request", since=None, limit=100):
+    """Cost, wall time, units and bookings per request, call or service"""
+    column = GROUPS[group_by]
+    since = since or 0
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {column}, service, units, cost_usd, wall_ms, ok, booked FROM usage "
+                "WHERE created_at >= ? ORDER BY created_at",
+                (since,),
+            ).fetchall()
+        finally:
+            conn.close()
+
+    groups = {}
+    for key, service, units, cost, wall_ms, ok, booked in rows:
+        group = groups.setdefault(key or "untagged", {
+            group_by: key, "cost_usd": 0.0, "wall_ms": 0.0, "calls": 0, "errors": 0,
+            "bookings": 0, "units": {}, "wall_ms_by_service": {},
+        })
+        group["cost_usd"] += cost
+        group["wall_ms"] += wall_ms
+        group["calls"] += 1
+        group["errors"] += 0 if ok else 1
+        group["bookings"] += booked
+        group["wall_ms_by_service"][service] = round(group["wall_ms_by_service"].get(service, 0.0) + wall_ms, 1)
+        for name, value in json.loads(units).items():
+            group["units"][name] = round(group["units"].get(name, 0) + (value or 0), 3)
+
+    result = sorted(groups.values(), key=lambda g: g["cost_usd"], reverse=True)[:limit]
+    for group in result:
+        group["cost_usd"] = round(group["cost_usd"], 5)
+        group["wall_ms"] = round(group["wall_ms"], 1)
+    return result
+
+
+def cost_per_booking(since=None):
+    """Total spend / bookings, and the average cost of the requests that booked"""
+    since = since or 0
+    with _lock:
+        conn = _connect()
+        try:
+            total, bookings = conn.execute(
+                "SELECT COALESCE(SUM(cost_usd), 0), COALESCE(SUM(booked), 0) FROM usage WHERE created_at >= ?",
+                (since,),
+            ).fetchone()
+            booked_requests = conn.execute(
+                "SELECT COALESCE(SUM(cost_usd), 0), COUNT(DISTINCT request_id) FROM usage WHERE created_at >= ? "
+                "AND request_id IN (SELECT request_id FROM usage WHERE booked = 1 AND request_id IS NOT NULL)",
+                (since,),
+            ).fetchone()
+        finally:
+            conn.close()
+    return {
+        "total_cost_usd": round(total, 4),
+        "bookings": bookings,
+        "cost_per_booking_usd": round(total / bookings, 4) if bookings else None,
+        "avg_cost_of_booking_requests_usd": round(booked_requests[0] / booked_requests[1], 4) if booked_requests[1] else None,
+    }
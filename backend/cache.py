@@ -0,0 +1,403 @@
+"""
+Caches used by the API: per-process TTLCaches, optionally backed by a
+store shared across uvicorn workers (see TieredCache).
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.time() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def expires_in(self, key):
+        """Seconds until the entry expires, or None if absent; doesn't count as a hit or miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            remaining = entry[0] - time.time()
+            return remaining if remaining > 0 else None
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# Shared tier --------------------------------------------------------------
+#
+# Each uvicorn worker has its own TTLCaches, so without a shared tier every
+# worker warms up separately and N workers make N upstream calls for the
+# same key. SHARED_CACHE_URL selects a store all workers on a host (SQLite
+# in WAL mode) or a fleet (Redis, or anything speaking its protocol) share:
+#
+#   sqlite:///path/to/shared_cache.db   (default)
+#   redis://host:6379/0
+#   none                                (in-process only)
+#
+# Values must be JSON-serializable.
+
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "sqlite:///shared_cache.db")
+SHARED_CACHE_LOCK_TTL = float(os.getenv("SHARED_CACHE_LOCK_TTL", "30"))
+
+
+class SQLiteStore:
+    """Shared entries and single-flight locks in a SQLite database (WAL mode)"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS cache_locks (
+        key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._initialized:
+            with self._lock:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(self.SCHEMA)
+                self._initialized = True
+        return conn
+
+    def get(self, key):
+        """(value, seconds left) or None"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1] - time.time()
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+            if random.random() < 0.01:
+                conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        finally:
+            conn.close()
+
+    def acquire(self, key, owner, ttl):
+        """Take the compute lock for key unless another live owner holds it"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM cache_locks WHERE key = ? AND expires_at <= ?", (key, time.time()))
+            taken = conn.execute(
+                "INSERT OR IGNORE INTO cache_locks (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, time.time() + ttl),
+            ).rowcount == 1
+            conn.execute("COMMIT")
+            return taken
+        finally:
+            conn.close()
+
+    def release(self, key, owner):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM cache_locks WHERE key = ? AND owner = ?", (key, owner))
+        finally:
+            conn.close()
+
+
+class RedisStore:
+    """
+    Shared entries and single-flight locks in Redis. Takes a redis-py client,
+    or anything with the same get/set/ttl/eval methods (e.g. a local stand-in).
+    """
+
+    # Delete the lock only if we still own it
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SHARED_CACHE_URL points at Redis but the redis package is not installed (pip install redis)")
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        raw = self.client.get(key)
+        if raw is None:
+            return None
+        return json.loads(raw), max(self.client.ttl(key), 1)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def acquire(self, key, owner, ttl):
+        return bool(self.client.set(f"lock:{key}", owner, nx=True, px=int(ttl * 1000)))
+
+    def release(self, key, owner):
+        self.client.eval(self.RELEASE_SCRIPT, 1, f"lock:{key}", owner)
+
+
+class MemoryStore:
+    """The shared-store interface within one process, for state that needs a store when none is configured"""
+
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                self._entries.pop(key, None)
+                return None
+            return json.loads(entry[0]), entry[1] - time.time()
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            # Stored serialized so callers never share mutable state, as with the real stores
+            self._entries[key] = (json.dumps(value), time.time() + ttl)
+            if random.random() < 0.01:
+                now = time.time()
+                for stale in [k for k, (_, expires) in self._entries.items() if expires <= now]:
+                    del self._entries[stale]
+
+    def acquire(self, key, owner, ttl):
+        with self._lock:
+            holder = self._locks.get(key)
+            if holder and holder[1] > time.time():
+                return False
+            self._locks[key] = (owner, time.time() + ttl)
+            return True
+
+    def release(self, key, owner):
+        with self._lock:
+            if self._locks.get(key, (None,))[0] == owner:
+                del self._locks[key]
+
+
+def shared_store_from_url(url=SHARED_CACHE_URL):
+    """The shared store for SHARED_CACHE_URL, or None for in-process caching only"""
+    if not url or url.lower() == "none":
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore.from_url(url)
+    raise ValueError(f"Unsupported SHARED_CACHE_URL: {url}")
+
+
+_default_store = None
+
+
+def shared_store():
+    """The process-wide store for SHARED_CACHE_URL, created on first use"""
+    global _default_store
+    if _default_store is None:
+        _default_store = shared_store_from_url()
+    return _default_store
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TieredCache:
+    """
+    A TTLCache in front of a shared store, with single-flight get_or_compute:
+    one thread per process and one process across workers computes a missing
+    key while the others wait for its result. Works in-process only when the
+    store is None, and falls back to in-process caching if the store fails.
+    """
+
+    def __init__(self, namespace, local, store=None, lock_ttl=SHARED_CACHE_LOCK_TTL):
+        self.namespace = namespace
+        self.local = local
+        self.store = store
+        self.lock_ttl = lock_ttl
+        self.ttl = local.ttl
+        self.shared_hits = 0
+        self.computes = 0
+        self.coalesced = 0
+        self.store_errors = 0
+        self._flights = {}
+        self._guard = threading.Lock()
+
+    def _shared_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _shared(self, method, *args):
+        """Call the shared store, treating errors as a miss / no-op"""
+        try:
+            return getattr(self.store, method)(*args)
+        except Exception as e:
+            self.store_errors += 1
+            print(f"Shared cache {method} failed for {self.namespace}: {e}")
+            return None
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not None or self.store is None:
+            return default if value is None else value
+        entry = self._shared("get", self._shared_key(key))
+        if entry is None:
+            return default
+        value, remaining = entry
+        self.shared_hits += 1
+        self.local.set(key, value, ttl=min(self.local.ttl, remaining))
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, ttl=ttl)
+        if self.store is not None:
+            self._shared("set", self._shared_key(key), value, ttl or self.ttl)
+
+    def expires_in(self, key):
+        remaining = self.local.expires_in(key)
+        if remaining is None and self.store is not None:
+            entry = self._shared("get", self._shared_key(key))
+            remaining = entry[1] if entry else None
+        return remaining
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """
+        Cached value for key, or compute() it once across threads and workers.
+        A None result from compute() is returned but not cached. Waiting threads
+        re-raise the computing thread's exception, and compute for themselves if
+        it takes longer than lock_ttl.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._guard:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if not flight.done.wait(self.lock_ttl):
+                # The computing thread is stuck; don't hand back a result it never produced
+                value = self.get(key)
+                return value if value is not None else self._compute(key, compute, ttl)
+            if flight.error is not None:
+                raise flight.error
+            self.coalesced += 1
+            return flight.value
+
+        try:
+            flight.value = self._compute_across_workers(key, compute, ttl)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._guard:
+                del self._flights[key]
+            flight.done.set()
+
+    def _compute_across_workers(self, key, compute, ttl):
+        if self.store is None:
+            return self._compute(key, compute, ttl)
+
+        shared_key, owner = self._shared_key(key), uuid.uuid4().hex
+        delay = 0.02
+        while True:
+            taken = self._shared("acquire", shared_key, owner, self.lock_ttl)
+            if taken is None:
+                # Store unavailable: compute in this worker
+                return self._compute(key, compute, ttl)
+            if taken:
+                try:
+                    # Another worker may have filled it while we waited for the lock
+                    value = self.get(key)
+                    return value if value is not None else self._compute(key, compute, ttl)
+                finally:
+                    self._shared("release", shared_key, owner)
+
+            # Another worker is computing it; its lock expires if it dies
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            value = self.get(key)
+            if value is not None:
+                self.coalesced += 1
+                return value
+
+    def _compute(self, key, compute, ttl):
+        self.computes += 1
+        value = compute()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    def __len__(self):
+        return len(self.local)
+
+    def stats(self):
+        return {
+            **self.local.stats(),
+            "shared_store": type(self.store).__name__ if self.store is not None else None,
+            "shared_hits": self.shared_hits,
+            "computes": self.computes,
+            "coalesced": self.coalesced,
+            "store_errors": self.store_errors,
+        }
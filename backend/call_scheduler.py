@@ -0,0 +1,339 @@
+"""
+Office-hours-aware call scheduling.
+
+Calls to clinics that are likely closed are held in a time-windowed
+priority queue and released when the clinic's next calling window opens.
+Windows come from the SerpAPI operating_hours of each place (falling back
+to CALL_DEFAULT_HOURS on weekdays), in the clinic's time zone as inferred
+from its address or the patient's location, minus the configurable
+lunch hour and start/end-of-day buffers.
+
+Scheduled calls live in the shared store (SHARED_CACHE_URL), so every
+uvicorn worker answers /scheduled-calls/{job_id} the same way and pending
+calls survive a restart. Every worker polls the store's queue; a due call
+is claimed under its lock, so exactly one worker dials it.
+"""
+import asyncio
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from cache import MemoryStore
+from normalization import location_timezone
+
+CALL_DEFAULT_TIMEZONE = os.getenv("CALL_DEFAULT_TIMEZONE", "America/New_York")
+CALL_DEFAULT_HOURS = os.getenv("CALL_DEFAULT_HOURS", "9:00-17:00")
+CALL_AVOID_LUNCH = os.getenv("CALL_AVOID_LUNCH", "true").lower() in ("1", "true", "yes")
+CALL_LUNCH_HOURS = os.getenv("CALL_LUNCH_HOURS", "12:00-13:00")
+CALL_START_OF_DAY_BUFFER_MIN = int(os.getenv("CALL_START_OF_DAY_BUFFER_MIN", "15"))
+CALL_END_OF_DAY_BUFFER_MIN = int(os.getenv("CALL_END_OF_DAY_BUFFER_MIN", "30"))
+CALL_MIN_WINDOW_MIN = int(os.getenv("CALL_MIN_WINDOW_MIN", "10"))
+SCHEDULER_MAX_JOBS = int(os.getenv("SCHEDULER_MAX_JOBS", "10000"))
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", "5"))
+SCHEDULER_JOB_TTL = int(os.getenv("SCHEDULER_JOB_TTL", str(14 * 86400)))
+SCHEDULER_LOCK_TTL = 10.0
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+_clock_re = re.compile(r"^(\d{1,2})(?::(\d{2}))?\s*([ap])?\.?m?\.?$", re.I)
+
+
+def _parse_clock(text):
+    """'8', '8:30', '5 PM', '12:30pm' -> (minutes after midnight ignoring meridiem, meridiem or None)"""
+    match = _clock_re.match(text.strip())
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    return (hour % 12) * 60 + minute, meridiem.lower() if meridiem else None
+
+
+def _to_minutes(clock, meridiem):
+    return clock + (720 if meridiem == "p" else 0)
+
+
+def parse_range(text):
+    """'8 AM–5 PM', '1–5 PM', '9:00-17:00' -> (open minute, close minute) or None"""
+    parts = re.split(r"\s*[–—-]\s*|\s+to\s+", text.strip())
+    if len(parts) != 2:
+        return None
+    start, end = _parse_clock(parts[0]), _parse_clock(parts[1])
+    if not start or not end:
+        return None
+
+    # 24h clock ("9:00-17:00") has no meridiem and hours above 12
+    raw_end_hour = int(re.match(r"\d+", parts[1].strip()).group(0))
+    if end[1] is None and start[1] is None and raw_end_hour > 12:
+        raw_start_hour = int(re.match(r"\d+", parts[0].strip()).group(0))
+        return raw_start_hour * 60 + start[0] % 60, raw_end_hour * 60 + end[0] % 60
+
+    end_meridiem = end[1] or "p"
+    close = _to_minutes(end[0], end_meridiem)
+    if start[1]:
+        opening = _to_minutes(start[0], start[1])
+    else:
+        # "1–5 PM" shares the closing meridiem unless that would open after closing ("11–2 PM")
+        opening = _to_minutes(start[0], end_meridiem)
+        if opening >= close:
+            opening = _to_minutes(start[0], "a")
+    if close == 0:
+        # Closing at midnight ("8 PM–12 AM")
+        close = 24 * 60
+    return (opening, close) if close > opening else None
+
+
+def parse_day_hours(text):
+    """One day's hours ('Closed', 'Open 24 hours', '8 AM–12 PM, 1–5 PM') -> list of ranges"""
+    text = str(text or "").replace("\u202f", " ").replace("\xa0", " ").strip()
+    lowered = text.lower()
+    if not text or "closed" in lowered:
+        return []
+    if "24 hours" in lowered:
+        return [(0, 24 * 60)]
+    ranges = [parse_range(part) for part in text.split(",")]
+    return [r for r in ranges if r]
+
+
+def parse_operating_hours(operating_hours):
+    """SerpAPI operating_hours dict -> {weekday index: [(open, close), ...]} or None"""
+    if not isinstance(operating_hours, dict) or not operating_hours:
+        return None
+    week = {}
+    for day, hours in operating_hours.items():
+        name = str(day).strip().lower().split()[0] if str(day).strip() else ""
+        for index, weekday in enumerate(WEEKDAYS):
+            if name.startswith(weekday[:3]):
+                week[index] = parse_day_hours(hours)
+    return week or None
+
+
+def _subtract(windows, blocked):
+    result = []
+    for start, end in windows:
+        if blocked[1] <= start or blocked[0] >= end:
+            result.append((start, end))
+            continue
+        if start < blocked[0]:
+            result.append((start, blocked[0]))
+        if blocked[1] < end:
+            result.append((blocked[1], end))
+    return result
+
+
+def call_windows(doctor):
+    """Calling windows per weekday after start/end-of-day buffers and lunch avoidance"""
+    week = parse_operating_hours(doctor.get("operating_hours"))
+    if week is None:
+        default = parse_range(CALL_DEFAULT_HOURS)
+        week = {day: [default] for day in range(5)} if default else {}
+
+    lunch = parse_range(CALL_LUNCH_HOURS) if CALL_AVOID_LUNCH else None
+    windows = {}
+    for day, ranges in week.items():
+        day_windows = [
+            (start + CALL_START_OF_DAY_BUFFER_MIN, end - CALL_END_OF_DAY_BUFFER_MIN)
+            for start, end in ranges
+        ]
+        if lunch:
+            day_windows = _subtract(day_windows, lunch)
+        windows[day] = sorted(w for w in day_windows if w[1] - w[0] >= CALL_MIN_WINDOW_MIN)
+    return windows
+
+
+def clinic_timezone(doctor, location=None):
+    return ZoneInfo(location_timezone(doctor.get("address"), location) or CALL_DEFAULT_TIMEZONE)
+
+
+def next_call_time(doctor, location=None, now=None):
+    """
+    Earliest time (UTC) the clinic is likely open for a call; `now` if it is
+    open already, None if its hours never allow a call
+    """
+    tz = clinic_timezone(doctor, location)
+    now = now or datetime.now(timezone.utc)
+    local_now = now.astimezone(tz)
+    windows = call_windows(doctor)
+    minute_now = local_now.hour * 60 + local_now.minute
+
+    for offset in range(8):
+        day = local_now + timedelta(days=offset)
+        for start, end in windows.get(day.weekday(), []):
+            if offset == 0 and minute_now >= end - CALL_MIN_WINDOW_MIN:
+                continue
+            if offset == 0 and minute_now >= start:
+                return now
+            midnight = day.replace(hour=0, minute=0, second=0, microsecond=0)
+            return (midnight + timedelta(minutes=start)).astimezone(timezone.utc)
+    return None
+
+
+class SchedulerFull(Exception):
+    """SCHEDULER_MAX_JOBS calls are already waiting for their window"""
+
+
+class CallScheduler:
+    """Holds calls in a shared release-time queue and dispatches them when due"""
+
+    QUEUE_KEY = "schedule:queue"
+
+    def __init__(self, dispatch, store=None):
+        """
+        Args:
+            dispatch (callable): Async job -> call result
+            store: Shared store (cache.SQLiteStore / RedisStore); in-process only when None
+        """
+        self.dispatch = dispatch
+        self.store = store if store is not None else MemoryStore()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._releases = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def _key(self, job_id):
+        return f"schedule:job:{job_id}"
+
+    def _locked(self, key):
+        """Take `key`'s lock in the shared store; returns the owner token"""
+        owner, delay = uuid.uuid4().hex, 0.01
+        deadline = time.monotonic() + SCHEDULER_LOCK_TTL
+        while not self.store.acquire(key, owner, SCHEDULER_LOCK_TTL):
+            if time.monotonic() > deadline:
+                # The holder died mid-update; its lock has expired by now
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        return owner
+
+    def _queue(self):
+        """[[release timestamp, priority, job_id], ...] of calls still waiting"""
+        entry = self.store.get(self.QUEUE_KEY)
+        return entry[0] if entry else []
+
+    def _save(self, job):
+        self.store.set(self._key(job["job_id"]), job, SCHEDULER_JOB_TTL)
+
+    def get(self, job_id):
+        entry = self.store.get(self._key(job_id))
+        return entry[0] if entry else None
+
+    def schedule(self, doctor_info, patient_info, insurance_info, release_at, priority=0,
+                 tenant=None, request_id=None):
+        """
+        Queue a call (blocking; run it in a thread from async code). Lower priority
+        values go first among calls due at the same time.
+
+        Raises:
+            SchedulerFull: SCHEDULER_MAX_JOBS calls are already waiting
+        """
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "scheduled",
+            "scheduled_for": release_at.isoformat(),
+            "priority": priority,
+            "tenant": tenant,
+            "request_id": request_id,
+            "doctor_info": doctor_info,
+            "patient_info": patient_info,
+            "insurance_info": insurance_info,
+        }
+        owner = self._locked(self.QUEUE_KEY)
+        try:
+            queue = self._queue()
+            if len(queue) >= SCHEDULER_MAX_JOBS:
+                raise SchedulerFull(f"{len(queue)} calls are already scheduled")
+            self._save(job)
+            queue.append([release_at.timestamp(), priority, job["job_id"]])
+            self.store.set(self.QUEUE_KEY, sorted(queue), SCHEDULER_JOB_TTL)
+        finally:
+            self.store.release(self.QUEUE_KEY, owner)
+        self._wakeup.set()
+        print(f"🗓️  Call to {doctor_info.get('title', 'Unknown')} scheduled for {job['scheduled_for']}")
+        return job
+
+    def _update(self, job_id, status, **fields):
+        """Move a scheduled job to `status` under its lock; returns the job, or None if it wasn't scheduled"""
+        owner = self._locked(self._key(job_id))
+        try:
+            job = self.get(job_id)
+            if not job or job["status"] != "scheduled":
+                return None
+            job["status"] = status
+            job.update(fields)
+            self._save(job)
+        finally:
+            self.store.release(self._key(job_id), owner)
+        self._dequeue({job_id})
+        return job
+
+    def _dequeue(self, job_ids):
+        owner = self._locked(self.QUEUE_KEY)
+        try:
+            queue = [entry for entry in self._queue() if entry[2] not in job_ids]
+            self.store.set(self.QUEUE_KEY, queue, SCHEDULER_JOB_TTL)
+        finally:
+            self.store.release(self.QUEUE_KEY, owner)
+
+    def cancel(self, job_id):
+        """Cancel a call that is still waiting (blocking)"""
+        return self._update(job_id, "cancelled") is not None
+
+    def queued(self):
+        """Calls still waiting for their window (blocking)"""
+        jobs = (self.get(job_id) for _, _, job_id in self._queue())
+        return [job for job in jobs if job and job["status"] == "scheduled"]
+
+    def _claim_due(self, now):
+        """Claim this worker's share of the due calls; returns (claimed jobs, next release timestamp)"""
+        claimed, gone = [], set()
+        queue = self._queue()
+        for release_ts, _, job_id in queue:
+            if release_ts > now:
+                break
+            job = self._update(job_id, "dialing", released_at=datetime.now(timezone.utc).isoformat())
+            if job:
+                claimed.append(job)
+            else:
+                # Cancelled, expired or claimed by another worker
+                gone.add(job_id)
+        if gone:
+            self._dequeue(gone)
+        upcoming = [entry[0] for entry in queue if entry[0] > now]
+        return claimed, min(upcoming) if upcoming else None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            try:
+                claimed, next_release = await asyncio.to_thread(self._claim_due, now)
+            except Exception as e:
+                print(f"Call scheduler could not read its queue: {e}")
+                claimed, next_release = [], None
+            for job in claimed:
+                task = asyncio.create_task(self._release(job))
+                self._releases.add(task)
+                task.add_done_callback(self._releases.discard)
+
+            # Other workers' new calls are picked up on the next poll
+            timeout = SCHEDULER_POLL_SECONDS
+            if next_release is not None:
+                timeout = min(timeout, max(next_release - now, 0))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _release(self, job):
+        try:
+            job["result"] = await self.dispatch(job)
+            job["status"] = "completed"
+        except Exception as e:
+            job["status"] = "error"
+            job["result"] = {"status": "error", "message": f"Call failed: {str(e)}"}
+            print(f"❌ Scheduled call {job['job_id']} failed: {e}")
+        await asyncio.to_thread(self._save, job)
@@ -0,0 +1,219 @@
+"""
+Live call state, driven by outcome events from the agent.
+
+The agent reports how each call is going (answered, booked, declined,
+voicemail, ...) to POST /call-outcomes as soon as it knows. Each event
+updates the call's state here and wakes anything waiting on it:
+long-polling API clients, the fair-share scheduler slot held for the call,
+and subscribers such as the provider outcome index. Calls queued for a
+scheduler slot start out "queued" and move to "dispatched" once the agent
+is dispatched, so clients can follow a call from the moment it's accepted.
+
+Call states live in the shared store (SHARED_CACHE_URL), so an outcome
+event that lands on a different uvicorn worker than the one that
+dispatched the call still finds the call's clinic, insurer and plan, and
+every worker answers /calls/{id} the same way. Events for one call are
+applied under the store's lock; whichever worker applies the terminal
+event runs the subscribers, once. Waiters in the applying worker wake
+immediately, waiters in other workers within CALL_STATE_POLL_SECONDS.
+"""
+import asyncio
+import os
+import time
+import uuid
+
+from cache import MemoryStore
+
+CALL_STATE_TTL = int(os.getenv("CALL_STATE_TTL", str(7 * 86400)))
+CALL_STATE_POLL_SECONDS = float(os.getenv("CALL_STATE_POLL_SECONDS", "1"))
+CALL_STATE_LOCK_TTL = 10.0
+
+# Events the agent may report; every one but "answered" and "metrics" ends the call
+OUTCOME_EVENTS = {"answered", "booked", "declined", "voicemail", "invalid_number", "do_not_call",
+                  "no_answer", "busy", "hung_up", "failed", "metrics"}
+TERMINAL_EVENTS = OUTCOME_EVENTS - {"answered", "metrics"}
+
+DETAIL_FIELDS = ["appointment_date", "appointment_time", "confirmation_number", "reason", "notes"]
+
+
+class CallStateStore:
+    """Call states in a shared store, with per-call waiters and outcome subscribers"""
+
+    def __init__(self, store=None, ttl=CALL_STATE_TTL):
+        """
+        Args:
+            store: Shared store (cache.SQLiteStore / RedisStore); in-process only when None
+            ttl (int): Seconds a call's state is kept after its last update
+        """
+        self.store = store if store is not None else MemoryStore()
+        self.ttl = ttl
+        self._waiters = {}
+        self._subscribers = []
+
+    def _key(self, call_id):
+        return f"call:{call_id}"
+
+    def _save(self, call):
+        self.store.set(self._key(call["call_id"]), call, self.ttl)
+
+    def create(self, call_id, doctor_info=None, insurer=None, tenant=None, room=None, plan_type=None,
+               status="dispatched"):
+        call = {
+            "call_id": call_id,
+            "status": status,
+            "room": room,
+            "tenant": tenant,
+            "insurer": insurer,
+            "plan_type": plan_type,
+            "doctor_info": doctor_info or {},
+            "dispatched_at": time.time(),
+            "answered_at": None,
+            "ended_at": None,
+            "outcome": None,
+            "metrics": {},
+            "events": [],
+        }
+        self._save(call)
+        return call
+
+    def get(self, call_id):
+        entry = self.store.get(self._key(call_id))
+        return entry[0] if entry else None
+
+    def subscribe(self, callback):
+        """Call `callback(call, event)` for every terminal outcome"""
+        self._subscribers.append(callback)
+
+    def _locked(self, call_id):
+        """Take the call's lock in the shared store; returns the owner token"""
+        owner, delay = uuid.uuid4().hex, 0.01
+        deadline = time.monotonic() + CALL_STATE_LOCK_TTL
+        while not self.store.acquire(self._key(call_id), owner, CALL_STATE_LOCK_TTL):
+            if time.monotonic() > deadline:
+                # The holder died mid-update; its lock has expired by now
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        return owner
+
+    def apply(self, event):
+        """
+        Fold one outcome event into its call's state (blocking; run it in a thread
+        from async code)
+
+        Args:
+            event (dict): {"call_id", "event", optional detail fields and "timestamp"}
+
+        Returns:
+            dict: The updated call
+        """
+        call_id = event["call_id"]
+        owner = self._locked(call_id)
+        try:
+            call, ended = self._apply(event)
+        finally:
+            self.store.release(self._key(call_id), owner)
+
+        if ended:
+            waiter = self._waiters.pop(call_id, None)
+            if waiter:
+                loop, done = waiter
+                loop.call_soon_threadsafe(done.set)
+            for callback in self._subscribers:
+                try:
+                    callback(call, event)
+                except Exception as e:
+                    print(f"Call outcome subscriber failed for {call_id}: {e}")
+        return call
+
+    def settle_dispatch(self, call_id, result):
+        """
+        Record how a queued call's dispatch went (blocking): "dispatched" with its
+        room, or ended with the dispatch's status when nothing was dialed. An
+        undialed call says nothing about the clinic, so subscribers aren't run.
+
+        Args:
+            call_id (str): Id the call was queued under
+            result (dict): make_appointment_call's result
+
+        Returns:
+            dict: The updated call
+        """
+        owner = self._locked(call_id)
+        try:
+            call = self.get(call_id)
+            if call is None:
+                return None
+            if result.get("call_id"):
+                call["room"] = result.get("room")
+                call["test_call"] = bool(result.get("test_call"))
+                if call["status"] == "queued":
+                    call["status"] = "dispatched"
+                    call["dispatched_at"] = time.time()
+            elif not call["ended_at"]:
+                call["status"] = result.get("status") or "failed"
+                call["ended_at"] = time.time()
+                call["outcome"] = {"status": call["status"], "reason": result.get("message") or "Dispatch failed"}
+            self._save(call)
+        finally:
+            self.store.release(self._key(call_id), owner)
+
+        if call["ended_at"]:
+            waiter = self._waiters.pop(call_id, None)
+            if waiter:
+                loop, done = waiter
+                loop.call_soon_threadsafe(done.set)
+        return call
+
+    def _apply(self, event):
+        """Update and save the call's state; returns (call, whether this event ended it)"""
+        call = self.get(event["call_id"])
+        if call is None:
+            # Dispatched by another deployment, or its state has expired
+            call = self.create(event["call_id"])
+
+        name = event["event"]
+        timestamp = event.get("timestamp") or time.time()
+        ended = False
+        if name == "metrics":
+            # Per-call agent metrics (e.g. time on hold), sent when the call wraps up
+            call["metrics"].update(event.get("metrics") or {})
+        else:
+            call["events"].append({"event": name, "timestamp": timestamp, **{
+                field: event[field] for field in DETAIL_FIELDS if event.get(field)
+            }})
+            if call["ended_at"]:
+                # A late event after the call ended (e.g. hung_up after booked) is kept for the record only
+                pass
+            elif name == "answered":
+                call["status"] = "in_progress"
+                call["answered_at"] = timestamp
+            else:
+                call["status"] = name
+                call["ended_at"] = timestamp
+                call["outcome"] = {"status": name, **{field: event[field] for field in DETAIL_FIELDS if event.get(field)}}
+                if call["answered_at"]:
+                    call["outcome"]["duration_seconds"] = round(timestamp - call["answered_at"], 1)
+                ended = True
+        self._save(call)
+        return call, ended
+
+    async def wait(self, call_id, timeout=None):
+        """Wait until the call ends (or `timeout` seconds pass) and return its state"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            call = await asyncio.to_thread(self.get, call_id)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if call is None or call["ended_at"] or (remaining is not None and remaining <= 0):
+                # Other waiters on this call re-register on their next poll
+                self._waiters.pop(call_id, None)
+                return call
+
+            # Woken right away when this worker applies the outcome; otherwise poll the store
+            loop = asyncio.get_running_loop()
+            _, done = self._waiters.setdefault(call_id, (loop, asyncio.Event()))
+            step = CALL_STATE_POLL_SECONDS if remaining is None else min(CALL_STATE_POLL_SECONDS, remaining)
+            try:
+                await asyncio.wait_for(done.wait(), step)
+            except asyncio.TimeoutError:
+                pass
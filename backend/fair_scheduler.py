@@ -0,0 +1,150 @@
+"""
+Fair-share call capacity scheduler.
+
+Every outbound call takes one of CALL_CAPACITY slots (agent workers / SIP
+channels). When slots are short, waiting calls are ordered by:
+
+  1. lane: "urgent" calls always go before "normal" ones
+  2. weighted fair queuing across tenants: each tenant's calls get virtual
+     finish times spaced 1/weight apart, so a patient with a 30-clinic batch
+     gets no more than their share while others wait
+  3. per-tenant concurrency caps (CALL_TENANT_CONCURRENCY)
+
+Tenants are patients or customer accounts; weights come from
+CALL_TENANT_WEIGHTS, e.g. "clinic-partner=3,default=1".
+"""
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+
+CALL_CAPACITY = int(os.getenv("CALL_CAPACITY", "4"))
+CALL_TENANT_CONCURRENCY = int(os.getenv("CALL_TENANT_CONCURRENCY", "1"))
+CALL_TENANT_WEIGHTS = os.getenv("CALL_TENANT_WEIGHTS", "")
+
+LANES = ["urgent", "normal"]
+
+
+def parse_weights(spec):
+    weights = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            weights[name.strip()] = float(value)
+    return weights
+
+
+class FairScheduler:
+    """Weighted fair queuing with priority lanes and per-tenant caps"""
+
+    def __init__(self, capacity=CALL_CAPACITY, tenant_concurrency=CALL_TENANT_CONCURRENCY,
+                 weights=None, wait_samples=1000):
+        self.capacity = capacity
+        self.tenant_concurrency = tenant_concurrency
+        self.weights = weights if weights is not None else parse_weights(CALL_TENANT_WEIGHTS)
+        self.active = {}
+        self.waiting = {lane: [] for lane in LANES}
+        self.dispatched = 0
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._seq = itertools.count()
+        self._waits = {lane: deque(maxlen=wait_samples) for lane in LANES}
+
+    def weight(self, tenant):
+        return self.weights.get(tenant, self.weights.get("default", 1.0))
+
+    @property
+    def in_use(self):
+        return sum(self.active.values())
+
+    async def submit(self, tenant, call, lane="normal"):
+        """Wait for a fair-share slot, then run `call()` (a coroutine factory) in it"""
+        lane = lane if lane in LANES else "normal"
+        loop = asyncio.get_running_loop()
+        start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+        finish = start + 1.0 / self.weight(tenant)
+        self._last_finish[tenant] = finish
+
+        waiter = {
+            "tenant": tenant,
+            "finish": finish,
+            "seq": next(self._seq),
+            "queued_at": time.monotonic(),
+            "future": loop.create_future(),
+        }
+        self.waiting[lane].append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter["future"]
+        except asyncio.CancelledError:
+            if waiter in self.waiting[lane]:
+                self.waiting[lane].remove(waiter)
+            else:
+                self._release(tenant)
+            raise
+
+        self._waits[lane].append(time.monotonic() - waiter["queued_at"])
+        try:
+            return await call()
+        finally:
+            self._release(tenant)
+
+    def _release(self, tenant):
+        self.active[tenant] -= 1
+        if not self.active[tenant]:
+            del self.active[tenant]
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to the next eligible waiters"""
+        while self.in_use < self.capacity:
+            chosen_lane, chosen = None, None
+            for lane in LANES:
+                eligible = [
+                    w for w in self.waiting[lane]
+                    if self.active.get(w["tenant"], 0) < self.tenant_concurrency
+                ]
+                if eligible:
+                    chosen_lane = lane
+                    chosen = min(eligible, key=lambda w: (w["finish"], w["seq"]))
+                    break
+            if chosen is None:
+                return
+
+            self.waiting[chosen_lane].remove(chosen)
+            self._virtual_time = max(self._virtual_time, chosen["finish"] - 1.0 / self.weight(chosen["tenant"]))
+            self.active[chosen["tenant"]] = self.active.get(chosen["tenant"], 0) + 1
+            self.dispatched += 1
+            chosen["future"].set_result(None)
+
+    def metrics(self):
+        """Queue depth, slot usage and recent wait-time percentiles"""
+        def percentiles(samples):
+            ordered = sorted(samples)
+            if not ordered:
+                return {"count": 0, "p50_s": 0.0, "p95_s": 0.0, "max_s": 0.0}
+            pick = lambda pct: ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+            return {
+                "count": len(ordered),
+                "p50_s": round(pick(50), 3),
+                "p95_s": round(pick(95), 3),
+                "max_s": round(ordered[-1], 3),
+            }
+
+        depth_by_tenant = {}
+        for lane in LANES:
+            for waiter in self.waiting[lane]:
+                depth_by_tenant[waiter["tenant"]] = depth_by_tenant.get(waiter["tenant"], 0) + 1
+
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "tenant_concurrency": self.tenant_concurrency,
+            "dispatched": self.dispatched,
+            "queue_depth": {lane: len(self.waiting[lane]) for lane in LANES},
+            "queue_depth_by_tenant": depth_by_tenant,
+            "active_by_tenant": dict(self.active),
+            "wait_time": {lane: percentiles(self._waits[lane]) for lane in LANES},
+        }
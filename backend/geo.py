@@ -0,0 +1,311 @@
+"""
+Offline geocoding and distance ranking of providers.
+
+Nothing here calls a geocoding API:
+
+  - providers use the exact gps_coordinates SerpAPI returns for local
+    results when present, else the centroid of the ZIP code or city in
+    their address
+  - the patient's location (ZIP, "City, ST" or an address) resolves the
+    same way
+  - ZIP centroids come from GEO_ZIP_CENTROIDS when that file exists: a CSV
+    with zip,lat,lon, or the Census ZCTA Gazetteer file as downloaded
+    (tab-separated GEOID, INTPTLAT, INTPTLONG). It is not shipped with the
+    repo, so out of the box ZIPs only resolve when the address also names a
+    gazetteer city. City centroids come from the normalization gazetteer
+    (data/us_cities.csv, major cities only)
+
+Distances measured from or to a city centroid are approximate: providers
+placed only by their city are flagged distance_approximate, since every
+one of them in the patient's city would otherwise read 0.0 miles.
+
+Resolved provider coordinates are cached per provider in SQLite
+(GEO_CACHE_DB), so a clinic seen once with exact coordinates keeps them.
+Distances are computed for the whole candidate list in one vectorized
+haversine pass (numpy, with a pure-Python fallback); large lists are first
+narrowed to the geohash cells around the patient.
+"""
+import csv
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from normalization import lookup_city, normalize_location, split_state, clean_text
+from provider_index import provider_key
+
+GEO_CACHE_DB = os.getenv("GEO_CACHE_DB", "geocode_cache.db")
+GEO_ZIP_CENTROIDS = os.getenv(
+    "GEO_ZIP_CENTROIDS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "us_zip_centroids.csv")
+)
+# Candidate lists longer than this are prefiltered with the geohash index
+GEO_INDEX_MIN_CANDIDATES = int(os.getenv("GEO_INDEX_MIN_CANDIDATES", "200"))
+
+EARTH_RADIUS_MILES = 3958.8
+
+_zip_re = re.compile(r"\b(\d{5})(?:-\d{4})?\s*$")
+_address_city_re = re.compile(r",\s*([^,]+?),?\s+([A-Z]{2})\b(?:\s+\d{5}(?:-\d{4})?)?\s*$")
+
+_lock = threading.Lock()
+_initialized = False
+_zip_centroids = None
+_coords = {}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS provider_coords (
+    provider_key TEXT PRIMARY KEY,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    source TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(GEO_CACHE_DB, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(SCHEMA)
+        _initialized = True
+    return conn
+
+
+def load_zip_centroids():
+    """Map 5-digit ZIP -> (lat, lon); empty when GEO_ZIP_CENTROIDS doesn't exist"""
+    global _zip_centroids
+    if _zip_centroids is None:
+        centroids = {}
+        if os.path.exists(GEO_ZIP_CENTROIDS):
+            with open(GEO_ZIP_CENTROIDS, newline="") as f:
+                header = f.readline()
+                delimiter = "\t" if "\t" in header else ","
+                # The Census file pads its last header with spaces
+                fields = [name.strip().lower() for name in header.split(delimiter)]
+                for row in csv.DictReader(f, fieldnames=fields, delimiter=delimiter):
+                    try:
+                        key = (row.get("zip") or row.get("geoid")).strip().zfill(5)
+                        lat = float(row.get("lat") or row.get("intptlat"))
+                        lon = float(row.get("lon") or row.get("intptlong"))
+                    except (AttributeError, TypeError, ValueError):
+                        continue
+                    centroids[key] = (lat, lon)
+        if not centroids:
+            print(f"No ZIP centroids at {GEO_ZIP_CENTROIDS}; ZIP codes geocode only via their city")
+        _zip_centroids = centroids
+    return _zip_centroids
+
+
+def geocode(text):
+    """
+    Centroid for a ZIP, "City, ST" or street address
+
+    Returns:
+        tuple: ((lat, lon), "zip" or "city") or (None, None)
+    """
+    text = str(text or "").strip()
+    match = _zip_re.search(text)
+    if match and match.group(1) in load_zip_centroids():
+        return load_zip_centroids()[match.group(1)], "zip"
+
+    # "123 Main St, Boston, MA 02115" -> Boston, MA
+    match = _address_city_re.search(text)
+    if match:
+        row = lookup_city(match.group(1), match.group(2))
+        if row:
+            return (row["lat"], row["lon"]), "city"
+
+    canonical = normalize_location(text)
+    if canonical and "," in canonical:
+        city, state = split_state(clean_text(canonical))
+        row = lookup_city(city, state)
+        if row:
+            return (row["lat"], row["lon"]), "city"
+    return None, None
+
+
+def provider_coordinates(doctors, sources=None):
+    """
+    (lat, lon) or None per doctor: SerpAPI coordinates, then the cache, then the address.
+    Newly resolved coordinates are cached. If `sources` is a list, it receives
+    each doctor's source ("gps", "zip", "city" or None).
+    """
+    keys = [provider_key(doctor) for doctor in doctors]
+    missing = [key for key in set(keys) if key not in _coords]
+    if missing:
+        try:
+            with _lock:
+                conn = _connect()
+                try:
+                    for i in range(0, len(missing), 500):
+                        chunk = missing[i:i + 500]
+                        rows = conn.execute(
+                            f"SELECT provider_key, lat, lon, source FROM provider_coords "
+                            f"WHERE provider_key IN ({','.join('?' * len(chunk))})",
+                            chunk,
+                        ).fetchall()
+                        for key, lat, lon, source in rows:
+                            _coords[key] = ((lat, lon), source)
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            print(f"Geocode cache unavailable: {e}")
+
+    resolved, updates = [], []
+    for key, doctor in zip(keys, doctors):
+        gps = doctor.get("gps_coordinates") or {}
+        if gps.get("latitude") is not None and gps.get("longitude") is not None:
+            point, source = (float(gps["latitude"]), float(gps["longitude"])), "gps"
+            if _coords.get(key, (None, None))[1] != "gps":
+                updates.append((key, point, source))
+        elif key in _coords:
+            point, source = _coords[key]
+        else:
+            point, source = geocode(doctor.get("address"))
+            if point:
+                updates.append((key, point, source))
+        if point:
+            _coords[key] = (point, source)
+        else:
+            source = None
+        resolved.append(point)
+        if sources is not None:
+            sources.append(source)
+
+    if updates:
+        try:
+            with _lock:
+                conn = _connect()
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO provider_coords (provider_key, lat, lon, source, updated_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            [(key, lat, lon, source, time.time()) for key, (lat, lon), source in updates],
+                        )
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            print(f"Geocode cache unavailable: {e}")
+    return resolved
+
+
+def haversine_miles(lat, lon, lats, lons):
+    """Distances in miles from one point to many, in one vectorized pass"""
+    if np is not None:
+        lat1, lon1 = np.radians(lat), np.radians(lon)
+        lat2, lon2 = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return (2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))).tolist()
+
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    distances = []
+    for other_lat, other_lon in zip(lats, lons):
+        lat2, lon2 = math.radians(other_lat), math.radians(other_lon)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a)))
+    return distances
+
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat, lon, precision=5):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _cell_degrees(precision):
+    """(height, width) of a geohash cell in degrees"""
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** (5 * precision - lat_bits)
+
+
+# Miles per degree of latitude; longitude degrees shrink with cos(lat), taken at
+# 66 degrees north so cells are wide enough anywhere in the US
+MILES_PER_DEGREE = 69.0
+MIN_LON_SCALE = math.cos(math.radians(66))
+
+
+class GeohashIndex:
+    """Points bucketed by geohash cell, for radius queries over large candidate lists"""
+
+    def __init__(self, points, radius_miles):
+        # Cells at least as big as the radius, so the 3x3 block around the center covers it
+        self.precision = 1
+        for precision in range(2, 9):
+            height, width = _cell_degrees(precision)
+            if min(height, width * MIN_LON_SCALE) * MILES_PER_DEGREE < radius_miles:
+                break
+            self.precision = precision
+        self.cells = {}
+        for index, point in enumerate(points):
+            if point:
+                self.cells.setdefault(geohash(point[0], point[1], self.precision), []).append(index)
+
+    def candidates(self, lat, lon):
+        """Indexes of points in the center cell and its 8 neighbours"""
+        step_lat, step_lon = _cell_degrees(self.precision)
+        cells = {
+            geohash(max(-90.0, min(90.0, lat + dy * step_lat)), ((lon + dx * step_lon + 180) % 360) - 180, self.precision)
+            for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+        }
+        return sorted(index for cell in cells for index in self.cells.get(cell, []))
+
+
+def rank_by_distance(doctors, location, radius_miles=None):
+    """
+    Nearest providers first, annotated with distance_miles (and
+    distance_approximate when either end is only a city centroid); providers
+    beyond radius_miles are dropped. Providers that can't be placed keep their
+    order after the placed ones. Returns doctors unchanged if the location
+    can't be placed.
+    """
+    center, center_source = geocode(location)
+    if not center or not doctors:
+        return doctors
+
+    sources = []
+    points = provider_coordinates(doctors, sources)
+    if radius_miles and len(doctors) > GEO_INDEX_MIN_CANDIDATES:
+        candidates = set(GeohashIndex(points, radius_miles).candidates(*center))
+    else:
+        candidates = {index for index, point in enumerate(points) if point}
+
+    placed = sorted(candidates)
+    distances = haversine_miles(center[0], center[1], [points[i][0] for i in placed], [points[i][1] for i in placed])
+    nearby = []
+    for index, distance in zip(placed, distances):
+        if radius_miles and distance > radius_miles:
+            continue
+        doctors[index]["distance_miles"] = round(distance, 1)
+        if center_source == "city" or sources[index] == "city":
+            doctors[index]["distance_approximate"] = True
+        nearby.append((distance, index))
+    nearby.sort()
+
+    unplaced = [doctors[index] for index, point in enumerate(points) if not point]
+    return [doctors[index] for _, index in nearby] + unplaced
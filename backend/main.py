@@ -1,16 +1,41 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import uvicorn
+import asyncio
 import json
 import base64
+import math
+import hashlib
 import os
 import requests
 import re
 import time
-from datetime import datetime
+import uuid
+from datetime import datetime, timezone
 from typing import Optional
 import sys
 
+from cache import TTLCache, TieredCache, shared_store
+from normalization import normalize_specialty, normalize_location, normalize_insurer, canonical_search_key
+from query_parser import parse_query, query_cache
+from provider_index import rank_providers, record_call_result
+from geo import rank_by_distance
+from call_scheduler import CallScheduler, SchedulerFull, next_call_time
+from fair_scheduler import FairScheduler
+from call_state import CallStateStore, OUTCOME_EVENTS, DETAIL_FIELDS
+from prewarm import CachePrewarmer, PREWARM_TTL
+from plan_rules import filter_providers, learn_from_outcome, calls_avoided
+from results import store_results, page_results, RESULT_TTL, RESULT_PAGE_SIZE
+from accounting import (
+    current_request_id, record_usage, track, llama_units, record_call_usage,
+    rollups, cost_per_booking,
+)
+from profiling import (
+    should_profile, start_profile, finish_profile, new_request_id,
+    list_profiles, get_profile, collapsed_stacks,
+)
+
 # Load environment variables from .env file if it exists
 try:
     from dotenv import load_dotenv
@@ -29,10 +54,89 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Wrap opted-in requests (profiling header or sampling rate) in the sampling profiler"""
+    if not should_profile(request.headers):
+        return await call_next(request)
+
+    request_id = current_request_id.get() or new_request_id(request.headers)
+    profiler, started = start_profile()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        record = finish_profile(request_id, profiler, started, request.method, request.url.path, status_code)
+        print(f"Profiled {request.method} {request.url.path} as {request_id}: {record['samples']} samples in {record['duration_ms']} ms")
+
+    response.headers["X-Profile-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def tag_requests(request: Request, call_next):
+    """Tag upstream usage recorded while handling this request with its id (X-Request-ID)"""
+    request_id = new_request_id(request.headers)
+    token = current_request_id.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        current_request_id.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # API Keys
 serp_api_key = os.getenv("SERP_API_KEY")
 llama_api_key = os.getenv("LLAMA_API_KEY")
 
+# Upstream endpoints (overridable so benchmarks can point at local stand-ins)
+serp_api_url = os.getenv("SERP_API_URL", "https://serpapi.com/search")
+llama_api_url = os.getenv("LLAMA_API_URL", "https://api.llama.com/v1/chat/completions")
+
+# Provider search results, keyed by canonical (specialty, location, insurer);
+# shared across uvicorn workers through SHARED_CACHE_URL
+search_cache = TieredCache("search", TTLCache(
+    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "5000")),
+    ttl=int(os.getenv("SEARCH_CACHE_TTL", "21600"))
+), shared_store())
+
+# Insurance card extractions, keyed by the image's SHA-256. They are PHI, so they
+# stay in this process unless EXTRACTION_CACHE_SHARED opts in to the shared store
+# (which is not encrypted at rest)
+extraction_cache_shared = os.getenv("EXTRACTION_CACHE_SHARED", "false").lower() in ("1", "true", "yes")
+extraction_cache = TieredCache("extraction", TTLCache(
+    maxsize=int(os.getenv("EXTRACTION_CACHE_SIZE", "1000")),
+    ttl=int(os.getenv("EXTRACTION_CACHE_TTL", "86400"))
+), shared_store() if extraction_cache_shared else None)
+
+# Full resolved provider lists behind upload-insurance responses, paged via /results/{result_id}
+results_cache = TieredCache("results", TTLCache(
+    maxsize=int(os.getenv("RESULT_CACHE_SIZE", "2000")),
+    ttl=RESULT_TTL
+), shared_store())
+
+# Providers farther than this from the patient's location are not offered (0 = no limit)
+default_radius_miles = float(os.getenv("DEFAULT_RADIUS_MILES", "25")) or None
+
+# SerpAPI result pages fetched per provider search
+SEARCH_PAGES = 3
+
+# Token required for /admin endpoints; admin endpoints are disabled when unset
+admin_token = os.getenv("ADMIN_TOKEN")
+
+# Shared secret the agent sends with outcome events (X-Outcome-Secret); outcome events are
+# refused when unset, unless OUTCOME_WEBHOOK_INSECURE explicitly allows them (local development only)
+outcome_webhook_secret = os.getenv("OUTCOME_WEBHOOK_SECRET")
+outcome_webhook_insecure = os.getenv("OUTCOME_WEBHOOK_INSECURE", "false").lower() in ("1", "true", "yes")
+if not outcome_webhook_secret:
+    if outcome_webhook_insecure:
+        print("WARNING: OUTCOME_WEBHOOK_INSECURE is set; /call-outcomes accepts unauthenticated events (development only)")
+    else:
+        print("OUTCOME_WEBHOOK_SECRET is not set; /call-outcomes will refuse outcome events")
+
+# How long a dispatched call may hold its capacity slot without reporting an outcome
+call_outcome_timeout = float(os.getenv("CALL_OUTCOME_TIMEOUT", "900"))
+
 # Check if API keys are available
 if not llama_api_key:
     print("WARNING: LLAMA_API_KEY environment variable not set. Insurance card processing will use fallback data.")
@@ -40,9 +144,12 @@ if not serp_api_key:
     print("WARNING: SERP_API_KEY environment variable not set. Doctor search will not work.")
 
 def extract_phone(text):
-    """Extract phone number from snippet using regex"""
-    match = re.search(r'(\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})', text)
-    return match.group(1) if match else None
+    """Extract a dialable (NANP-valid) phone number from snippet, in E.164 form"""
+    for match in re.finditer(r'(\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})', text):
+        e164, _, _ = normalize_e164(match.group(1))
+        if e164:
+            return e164
+    return None
 
 def get_multiple_pages_local_results(query, max_pages=3):
     """Get multiple pages of local results to increase the number of doctors found"""
@@ -59,9 +166,10 @@ def get_multiple_pages_local_results(query, max_pages=3):
         }
         
         try:
-            response = requests.get("https://serpapi.com/search", params=params)
-            response.raise_for_status()
-            results = response.json()
+            with track("serpapi", serp_searches=1):
+                response = requests.get(serp_api_url, params=params)
+                response.raise_for_status()
+                results = response.json()
                         
             # Handle different possible response structures
             places = []
@@ -84,7 +192,16 @@ def get_multiple_pages_local_results(query, max_pages=3):
                             "title": place.get("title", "Unknown"),
                             "phone": place.get("phone", "N/A"),
                             "address": place.get("address", "N/A"),
-                            "website": place.get("links", {}).get("website", "N/A") if "links" in place else "N/A"
+                            "website": place.get("links", {}).get("website", "N/A") if "links" in place else "N/A",
+                            # Kept for the office-hours call scheduler
+                            "hours": place.get("hours", "N/A"),
+                            "operating_hours": place.get("operating_hours"),
+                            # Exact location for distance ranking, when SerpAPI has it
+                            "gps_coordinates": place.get("gps_coordinates"),
+                            # For filtering and sorting paged results
+                            "rating": place.get("rating"),
+                            "reviews": place.get("reviews"),
+                            "type": place.get("type")
                         }
                         
                         # Check if this doctor is already in our list
@@ -109,12 +226,32 @@ def search_doctors(insurance_provider, location, doctor_type):
             }
         ]
     
+    # Canonicalize so spelling variants of the same need share one query and cache entry
+    cache_key = canonical_search_key(doctor_type, location, insurance_provider)
+    doctor_type = normalize_specialty(doctor_type) or doctor_type
+    location = normalize_location(location) or location
+    insurance_provider = normalize_insurer(insurance_provider) or insurance_provider
+
+    cached = search_cache.get(cache_key)
+    search_prewarmer.record(cache_key, doctor_type, location, insurance_provider, hit=cached is not None)
+    if cached is not None:
+        print(f"Search cache hit for {cache_key}: {len(cached)} doctors")
+        return [dict(doctor) for doctor in cached]
+
+    # One upstream search per key across threads and workers; empty results aren't cached
+    doctors = search_cache.get_or_compute(
+        cache_key, lambda: fetch_doctors(insurance_provider, location, doctor_type) or None
+    )
+    return [dict(doctor) for doctor in doctors or []]
+
+def fetch_doctors(insurance_provider, location, doctor_type):
+    """Run a (normalized) provider search upstream, bypassing the cache"""
     query = f"{doctor_type} doctors accepting {insurance_provider} insurance in {location}"
     
     print(f"Searching for {query}")
     
     # Use the multi-page function to get more results
-    doctors = get_multiple_pages_local_results(query, max_pages=3)
+    doctors = get_multiple_pages_local_results(query, max_pages=SEARCH_PAGES)
     
     if not doctors:
         print("No search results found.")
@@ -123,14 +260,164 @@ def search_doctors(insurance_provider, location, doctor_type):
     print(f"Total unique doctors found: {len(doctors)}")
     return doctors
 
+def refresh_search(doctor_type, location, insurance_provider):
+    """Re-run a popular search off-peak and keep it warm through the next business day"""
+    if not serp_api_key:
+        return []
+    # Upstream usage from prewarming is accounted separately from patient requests
+    current_request_id.set("prewarm")
+    doctors = fetch_doctors(insurance_provider, location, doctor_type)
+    if doctors:
+        search_cache.set(canonical_search_key(doctor_type, location, insurance_provider), doctors, ttl=PREWARM_TTL)
+    return doctors
+
+# Refreshes the most searched (specialty, location, insurer) combinations off-peak
+search_prewarmer = CachePrewarmer(search_cache, refresh_search, searches_per_refresh=SEARCH_PAGES, store=shared_store())
+
 # Add parent directory to path to import callout functions
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import real calling functions
-from callout import make_appointment_call, batch_call_doctors, generate_call_script
-from calloutbound import create_outbound_call
+# Import real calling functions (the livekit dispatch client is loaded lazily on first call)
+from callout import make_appointment_call
+from dial_validation import check_number, normalize_e164, mark_bad, shared_numbers, BAD_NUMBER_OUTCOMES
+
+# Shares agent workers / SIP channels fairly across patients and tenants
+fair_scheduler = FairScheduler()
+
+# Live state of dispatched calls, updated by the agent's outcome events
+call_states = CallStateStore(shared_store())
+
+def record_call_outcome(call, event):
+    """Feed finished calls into the provider outcome index, clinic network knowledge and the known-bad number filter"""
+    if call.get("test_call"):
+        # Dialed CALLOUT_TEST_NUMBER, not the clinic: says nothing about the clinic or its number
+        return
+    if call["doctor_info"]:
+        record_call_result(call["doctor_info"], call["insurer"], call["outcome"])
+        learn_from_outcome(call["doctor_info"], call["insurer"], call.get("plan_type"), call["outcome"])
+        if call["outcome"]["status"] in BAD_NUMBER_OUTCOMES:
+            mark_bad(call["doctor_info"].get("phone"), call["outcome"].get("reason") or call["outcome"]["status"])
+
+call_states.subscribe(record_call_outcome)
+
+def call_lane(patient_info):
+    """Urgent requests skip ahead of routine ones"""
+    if patient_info.get("urgent") or "urgent" in str(patient_info.get("appointment_type", "")).lower():
+        return "urgent"
+    return "normal"
+
+# Strong references to queued calls' scheduler tasks until they finish
+pending_calls = set()
+
+async def dispatch_call(doctor_info, patient_info, insurance_info, tenant=None, wait=True):
+    """
+    Place a call once the fair-share scheduler grants this tenant a slot.
+    Returns as soon as the agent is dispatched; the slot stays held until the
+    agent reports how the call ended (or CALL_OUTCOME_TIMEOUT passes).
+    With wait=False, returns {"status": "queued", "call_id"} as soon as the call
+    is queued; follow it at /calls/{call_id}.
+    """
+    tenant = tenant or patient_info.get("name") or "default"
+    insurer = insurance_info.get("insurance_company")
+
+    # Pre-dial validation: rejected numbers never take a scheduler slot
+    number = check_number(doctor_info.get("phone"), doctor_info)
+    if not number["ok"]:
+        print(f"🚫 Not calling {doctor_info.get('title', 'Unknown')} at {doctor_info.get('phone')}: {number['reason']}")
+        return {"status": "invalid_number", "message": f"Not dialed: {number['reason']}", "phone": doctor_info.get("phone")}
+
+    # Plan rules: a clinic the patient's plan won't cover (or that needs a referral first) isn't worth a call
+    _, excluded = filter_providers(
+        [doctor_info], insurance_info, patient_info.get("appointment_type"),
+        has_referral=bool(patient_info.get("has_referral")), stage="dispatch"
+    )
+    if excluded:
+        reason = excluded[0]["ineligible_reason"]
+        print(f"🚫 Not calling {doctor_info.get('title', 'Unknown')}: {reason} for this plan")
+        return {"status": "ineligible", "message": f"Not dialed: {reason} for this plan", "reason": reason}
+
+    # The call is trackable at /calls/{call_id} while it waits for a slot
+    call_id = uuid.uuid4().hex
+    await asyncio.to_thread(call_states.create, call_id, doctor_info, insurer, tenant, None,
+                            insurance_info.get("plan_type"), status="queued")
+    dispatched = asyncio.get_running_loop().create_future()
+
+    async def place_call():
+        with track("livekit_dispatch", dispatches=1) as usage:
+            result = await make_appointment_call(doctor_info, patient_info, insurance_info, call_id=call_id)
+            if not isinstance(result, dict):
+                result = {"status": "failed", "message": "Dispatch failed"}
+            usage["call_id"], usage["ok"] = call_id, bool(result.get("call_id"))
+        # Outcome events update the provider index; a failed dispatch says nothing about the clinic
+        await asyncio.to_thread(call_states.settle_dispatch, call_id, result)
+        if not dispatched.done():
+            dispatched.set_result(result)
+        if result.get("call_id"):
+            await call_states.wait(call_id, call_outcome_timeout)
+        return result
+
+    def on_done(task):
+        pending_calls.discard(task)
+        if dispatched.done():
+            return
+        if task.cancelled():
+            dispatched.cancel()
+            return
+        # Failed before the agent was dispatched: end the queued call so nobody waits on it
+        error = task.exception()
+        print(f"❌ Call {call_id} to {doctor_info.get('title', 'Unknown')} failed: {error}")
+        dispatched.set_exception(error)
+        settle = asyncio.create_task(asyncio.to_thread(
+            call_states.settle_dispatch, call_id, {"status": "failed", "message": str(error)}
+        ))
+        pending_calls.add(settle)
+        settle.add_done_callback(pending_calls.discard)
+
+    task = asyncio.create_task(fair_scheduler.submit(tenant, place_call, lane=call_lane(patient_info)))
+    pending_calls.add(task)
+    task.add_done_callback(on_done)
+    if not wait:
+        # Nobody awaits the dispatch; its failures are logged and recorded on the call instead
+        dispatched.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return {"status": "queued", "call_id": call_id, "message": "Call queued; follow it at /calls/{call_id}"}
+    return await dispatched
+
+async def run_scheduled_call(job):
+    """Dispatch a call released by the office-hours scheduler"""
+    # Account the call to the request that scheduled it
+    current_request_id.set(job.get("request_id"))
+    return await dispatch_call(job["doctor_info"], job["patient_info"], job["insurance_info"], job.get("tenant"))
+
+call_scheduler = CallScheduler(dispatch=run_scheduled_call, store=shared_store())
+
+async def dial_or_schedule(doctor_info, patient_info, insurance_info, location=None, tenant=None, wait=True):
+    """Dial now if the clinic is likely open, otherwise queue the call for its next calling window"""
+    now = datetime.now(timezone.utc)
+    release_at = next_call_time(doctor_info, location, now)
+
+    if release_at is None or release_at <= now:
+        return await dispatch_call(doctor_info, patient_info, insurance_info, tenant, wait=wait)
+
+    try:
+        job = await asyncio.to_thread(call_scheduler.schedule, doctor_info, patient_info, insurance_info, release_at,
+                                      tenant=tenant, request_id=current_request_id.get())
+    except SchedulerFull as e:
+        print(f"🚫 Not scheduling call to {doctor_info.get('title', 'Unknown')}: {e}")
+        return {"status": "scheduler_full", "message": f"Not scheduled: {e}; try again later"}
+    return {
+        "status": "scheduled",
+        "message": "Clinic is likely closed; call scheduled for its next opening window",
+        "job_id": job["job_id"],
+        "scheduled_for": job["scheduled_for"]
+    }
 
 def get_insurance_card_data_from_blob(image_blob):
+    """Extract insurance card data from image blob, once per distinct image across workers"""
+    key = hashlib.sha256(image_blob).hexdigest()
+    # Failed extractions ({}) aren't cached
+    return extraction_cache.get_or_compute(key, lambda: extract_insurance_card_data(image_blob) or None) or {}
+
+def extract_insurance_card_data(image_blob):
     """Extract insurance card data from image blob using Llama API"""
     try:
         # Convert blob to base64
@@ -143,8 +430,9 @@ def get_insurance_card_data_from_blob(image_blob):
             return {}
         
         print("Making request to Llama API...")
+        started = time.perf_counter()
         response = requests.post(
-            url="https://api.llama.com/v1/chat/completions",
+            url=llama_api_url,
             headers={
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {llama_api_key}"
@@ -231,6 +519,12 @@ def get_insurance_card_data_from_blob(image_blob):
         )
         
         print(f"Llama API response status: {response.status_code}")
+        record_usage(
+            "llama_extraction",
+            llama_units(response.json()) if response.ok else {},
+            (time.perf_counter() - started) * 1000,
+            ok=response.ok
+        )
         
         if not response.ok:
             print(f"Llama API error: {response.status_code} - {response.text}")
@@ -257,11 +551,82 @@ def get_insurance_card_data_from_blob(image_blob):
         return parsed_data
         
     except Exception as e:
-        print(f"Exception in get_insurance_card_data_from_blob: {str(e)}")
+        print(f"Exception in extract_insurance_card_data: {str(e)}")
         import traceback
         traceback.print_exc()
         return {}
 
+def parse_query_with_llama(customer_query):
+    """Extract doctor type, location, date and insurer from a free-text query using Llama API"""
+    if not llama_api_key:
+        print("LLAMA_API_KEY not available, skipping LLM query parsing")
+        return {}
+
+    try:
+        started = time.perf_counter()
+        response = requests.post(
+            url=llama_api_url,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {llama_api_key}"
+            },
+            json={
+                "model": "Llama-4-Maverick-17B-128E-Instruct-FP8",
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": (
+                            "Extract the following information from this customer query and return it as JSON: "
+                            "doctor type, location, and date. If any information is not mentioned, use \"N/A\". "
+                            f"Query: \"{customer_query}\""
+                        )
+                    }
+                ],
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "QueryExtraction",
+                        "description": "Extracted information from customer query",
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                "doctor_type": {"type": "string", "description": "Type of doctor or specialist needed"},
+                                "location": {"type": "string", "description": "Location or city for the appointment"},
+                                "date": {"type": "string", "description": "Preferred date for appointment"},
+                                "insurance_provider": {"type": "string", "description": "Insurance provider mentioned"}
+                            },
+                            "required": ["doctor_type", "location", "date", "insurance_provider"]
+                        }
+                    }
+                }
+            },
+            timeout=30
+        )
+        record_usage(
+            "llama_query_parse",
+            llama_units(response.json()) if response.ok else {},
+            (time.perf_counter() - started) * 1000,
+            ok=response.ok
+        )
+
+        if not response.ok:
+            print(f"Llama API error: {response.status_code} - {response.text}")
+            return {}
+
+        content = response.json().get("completion_message", {}).get("content", {})
+        if isinstance(content, dict) and content.get("text"):
+            return json.loads(content["text"])
+        return {}
+
+    except Exception as e:
+        print(f"Exception in parse_query_with_llama: {str(e)}")
+        return {}
+
+@app.on_event("startup")
+async def start_call_scheduler():
+    call_scheduler.start()
+    search_prewarmer.start()
+
 @app.get("/")
 async def root():
     return {"message": "MediCall API is running"}
@@ -270,7 +635,8 @@ async def root():
 async def upload_insurance(
     file: UploadFile = File(...),
     query_data: str = Form(...),
-    make_call: bool = Form(False)
+    make_call: bool = Form(False),
+    x_tenant_id: Optional[str] = Header(None)
 ):
     """
     Upload insurance card image with structured query data and process the complete booking flow
@@ -287,6 +653,14 @@ async def upload_insurance(
         except json.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid JSON data")
         
+        # Search radius in miles; absent or 0 means DEFAULT_RADIUS_MILES
+        try:
+            radius_miles = float(query_json.get('radius_miles') or 0)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="radius_miles must be a number")
+        if not math.isfinite(radius_miles) or radius_miles < 0:
+            raise HTTPException(status_code=400, detail="radius_miles must be a positive number")
+        
         # Read the file content as blob
         content = await file.read()
         
@@ -312,7 +686,8 @@ async def upload_insurance(
         
         # Step 1: Extract insurance card data from the uploaded image
         print("\nEXTRACTING INSURANCE CARD DATA...")
-        insurance_details = get_insurance_card_data_from_blob(content)
+        # Blocking (upstream call, and possibly waiting on another worker's extraction): keep it off the event loop
+        insurance_details = await asyncio.to_thread(get_insurance_card_data_from_blob, content)
         
         # If insurance extraction failed, use fallback data
         if not insurance_details:
@@ -366,20 +741,60 @@ async def upload_insurance(
         print(f"Location: {location}")
         print(f"Doctor Type: {doctor_type}")
         
-        doctors = search_doctors(insurance_provider, location, doctor_type)
+        doctors = await asyncio.to_thread(search_doctors, insurance_provider, location, doctor_type)
+        
+        # Nearest clinics first, dropping any outside the patient's radius
+        doctors = rank_by_distance(doctors, location, radius_miles or default_radius_miles)
+        
+        # Call the clinics most likely to book quickly first (ties stay nearest first)
+        doctors = rank_providers(doctors, insurance_provider)
         
         patient_info = {
             "name": patient_name,
             "appointment_type": f"{doctor_type} consultation",
-            "preferred_times": query_json.get('date', 'Flexible with scheduling')
+            "preferred_times": query_json.get('date', 'Flexible with scheduling'),
+            "has_referral": str(query_json.get('has_referral', '')).lower() in ("1", "true", "yes")
         }
         
         insurance_info = {
             "insurance_company": insurance_provider,
             "member_id": insurance_details.get("member_id", "N/A"),
-            "plan_type": insurance_details.get("plan_type", "N/A")
+            "plan_type": insurance_details.get("plan_type", "N/A"),
+            "group_number": insurance_details.get("group_number")
         }
         
+        # Drop clinics the plan won't cover (network, referral) before anything is dialed
+        doctors, excluded_doctors = filter_providers(doctors, insurance_info, doctor_type, patient_info["has_referral"])
+        if excluded_doctors:
+            print(f"Plan rules excluded {len(excluded_doctors)} providers: {sorted({d['ineligible_reason'] for d in excluded_doctors})}")
+        excluded_summary = [
+            {"title": d.get("title"), "ineligible_reason": d["ineligible_reason"]} for d in excluded_doctors
+        ]
+        
+        if excluded_doctors and not doctors:
+            # Every provider found is ruled out by the plan; say so instead of inventing an appointment
+            return {
+                "message": "All providers found are excluded by your plan",
+                "status": "all_providers_excluded",
+                "excluded_doctors": excluded_summary,
+                "insurance_details": insurance_details,
+                "query_data": query_json
+            }
+        
+        # A number listed for several providers is a shared switchboard, not a practice's front desk
+        switchboards = shared_numbers(doctors)
+        for doctor in doctors:
+            number = check_number(doctor.get("phone"), doctor)
+            doctor["dialable"] = number["ok"] and number["e164"] not in switchboards
+        
+        # Keep the full list so clients can page through it without another extraction/search
+        result_id = store_results(results_cache, doctors, {
+            "doctor_type": doctor_type,
+            "location": location,
+            "insurance_provider": insurance_provider
+        })
+        first_page = page_results({"result_id": result_id, "doctors": doctors}, limit=RESULT_PAGE_SIZE)
+        
         call_result = None
         
         if not doctors:
@@ -394,8 +809,8 @@ async def upload_insurance(
                 "available_doctors": []
             }
         else:
-            # Use the first available doctor for the appointment
-            selected_doctor = doctors[0]
+            # Use the first doctor with a dialable number for the appointment
+            selected_doctor = next((d for d in doctors if d["dialable"]), doctors[0])
             appointment_details = {
                 "doctor_name": selected_doctor["title"],
                 "specialty": doctor_type,
@@ -403,13 +818,13 @@ async def upload_insurance(
                 "address": selected_doctor["address"],
                 "appointment_time": "2024-10-28T10:00:00Z",
                 "notes": f"Please bring your insurance card and a form of ID. Contact: {selected_doctor['phone']}",
-                "available_doctors": doctors[:5]  # Include first 5 doctors found
+                "available_doctors": first_page["doctors"]
             }
             
             # Step 3: Make appointment call if requested
-            if make_call and selected_doctor.get('phone') != 'N/A':
+            if make_call and selected_doctor["dialable"]:
                 print(f"\nMAKING APPOINTMENT CALL...")
-                call_result = await make_appointment_call(selected_doctor, patient_info, insurance_info)
+                call_result = await dial_or_schedule(selected_doctor, patient_info, insurance_info, location, x_tenant_id)
             elif make_call:
                 print("Cannot make call - no valid phone number available")
         
@@ -428,7 +843,11 @@ async def upload_insurance(
                 "size": file.size,
                 "blob_size": len(content)
             },
-            "query_data": query_json
+            "query_data": query_json,
+            "result_id": result_id,
+            "total_doctors": first_page["total"],
+            "next_cursor": first_page["next_cursor"],
+            "excluded_doctors": excluded_summary
         }
         
         if call_result:
@@ -436,28 +855,78 @@ async def upload_insurance(
         
         return response_data
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+@app.get("/results/{result_id}")
+async def get_results(
+    result_id: str,
+    cursor: Optional[str] = None,
+    limit: int = RESULT_PAGE_SIZE,
+    sort: str = "rank",
+    max_distance_miles: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    dialable: Optional[bool] = None,
+    q: Optional[str] = None
+):
+    """
+    Page through the providers found by an upload-insurance request (no new searches or extraction).
+    Pass next_cursor back as cursor with the same filters and sort to get the next page.
+    """
+    entry = results_cache.get(result_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Result set not found or expired")
+    try:
+        return page_results(
+            entry, cursor, limit, sort=sort, max_distance_miles=max_distance_miles,
+            min_rating=min_rating, dialable=dialable, q=q
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/parse-query")
+async def parse_query_endpoint(payload: dict):
+    """
+    Parse a free-text patient query into doctor_type/location/date/insurance_provider.
+    Common queries are handled by rules; only ambiguous ones go to the LLM.
+    """
+    query = (payload.get("query") or "").strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="query is required")
+
+    parsed = await asyncio.to_thread(parse_query, query, llm_fallback=parse_query_with_llama)
+    print(f"Parsed query via {parsed['parse_source']}: {parsed}")
+    return parsed
+
 @app.post("/make-appointment-call")
 async def make_appointment_call_endpoint(
     doctor_info: dict,
     patient_info: dict,
-    insurance_info: dict
+    insurance_info: dict,
+    respect_office_hours: bool = True,
+    location: Optional[str] = None,
+    x_tenant_id: Optional[str] = Header(None)
 ):
     """
-    Make an appointment call to a specific doctor
+    Make an appointment call to a specific doctor.
+    If the clinic is likely closed, the call is scheduled for its next opening window
+    unless respect_office_hours is false.
     """
     try:
         print("=" * 50)
         print("MAKING APPOINTMENT CALL")
         print("=" * 50)
         
-        call_result = await make_appointment_call(doctor_info, patient_info, insurance_info)
+        if respect_office_hours:
+            call_result = await dial_or_schedule(doctor_info, patient_info, insurance_info, location, x_tenant_id)
+        else:
+            call_result = await dispatch_call(doctor_info, patient_info, insurance_info, x_tenant_id)
         
         return {
-            "message": "Call completed",
+            "message": "Call dispatched" if call_result and call_result.get("call_id") else "Call completed",
             "call_result": call_result
         }
         
@@ -469,45 +938,42 @@ async def make_appointment_call_endpoint(
 async def batch_call_doctors_endpoint(
     doctors_list: list,
     patient_info: dict,
-    insurance_info: dict
+    insurance_info: dict,
+    location: Optional[str] = None,
+    x_tenant_id: Optional[str] = Header(None)
 ):
     """
-    Make calls to multiple doctors in sequence
+    Make calls to multiple doctors.
+    Calls are queued with the fair-share scheduler, so this patient's calls go out
+    CALL_TENANT_CONCURRENCY at a time without starving other patients. Clinics that
+    are likely closed are scheduled for their next opening window instead.
+    Returns once every call is queued or scheduled; follow queued calls at
+    /calls/{call_id} and scheduled ones at /scheduled-calls/{job_id}.
     """
     try:
         print("=" * 50)
         print("BATCH CALLING DOCTORS")
         print("=" * 50)
         
-        results = []
-        
-        for i, doctor in enumerate(doctors_list, 1):
-            print(f"\n{'='*50}")
-            print(f"📞 Call {i}/{len(doctors_list)}")
-            print(f"{'='*50}")
-            
+        async def call_one(i, doctor):
+            print(f"📞 Queueing call {i}/{len(doctors_list)} to {doctor.get('title', 'Unknown')}")
             try:
-                result = await make_appointment_call(doctor, patient_info, insurance_info)
+                result = await dial_or_schedule(doctor, patient_info, insurance_info, location, x_tenant_id, wait=False)
                 result["doctor_info"] = doctor
-                results.append(result)
-                
-                # Add delay between calls
-                if i < len(doctors_list):
-                    print("⏸️  Waiting before next call...")
-                    time.sleep(5)
-                    
+                return result
             except Exception as e:
-                error_result = {
+                print(f"❌ Error calling {doctor.get('title', 'Unknown')}: {e}")
+                return {
                     "status": "error",
                     "message": f"Call failed: {str(e)}",
                     "doctor_info": doctor,
                     "call_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 }
-                results.append(error_result)
-                print(f"❌ Error calling {doctor.get('title', 'Unknown')}: {e}")
+        
+        results = await asyncio.gather(*(call_one(i, doctor) for i, doctor in enumerate(doctors_list, 1)))
         
         return {
-            "message": "Batch calls completed",
+            "message": "Batch calls queued",
             "results": results
         }
         
@@ -515,6 +981,159 @@ async def batch_call_doctors_endpoint(
         print(f"Error in batch calling: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error in batch calling: {str(e)}")
 
+@app.post("/call-outcomes")
+async def call_outcome_webhook(event: dict, x_outcome_secret: Optional[str] = Header(None)):
+    """
+    Outcome events from the agent (answered, booked, declined, voicemail, hung_up, ...).
+    Updates the call's state and wakes anything waiting on it.
+    """
+    if outcome_webhook_secret:
+        if x_outcome_secret != outcome_webhook_secret:
+            raise HTTPException(status_code=403, detail="Invalid outcome secret")
+    elif not outcome_webhook_insecure:
+        raise HTTPException(status_code=503, detail="OUTCOME_WEBHOOK_SECRET is not set; outcome events are refused")
+    if not event.get("call_id") or event.get("event") not in OUTCOME_EVENTS:
+        raise HTTPException(status_code=400, detail=f"call_id and an event in {sorted(OUTCOME_EVENTS)} are required")
+
+    call = await asyncio.to_thread(call_states.apply, event)
+    if event["event"] == "metrics":
+        # Agent-side usage (SIP minutes, STT, TTS, LLM tokens) for cost accounting
+        record_call_usage(call, event.get("metrics") or {})
+    details = {field: event[field] for field in DETAIL_FIELDS if event.get(field)}
+    print(f"📣 Call {event['call_id']}: {event['event']} {details or ''}")
+    return {"call_id": call["call_id"], "status": call["status"]}
+
+@app.get("/calls/{call_id}")
+async def get_call(call_id: str):
+    """
+    Current state and event history of a dispatched call
+    """
+    call = await asyncio.to_thread(call_states.get, call_id)
+    if not call:
+        raise HTTPException(status_code=404, detail="Call not found")
+    return call
+
+@app.get("/calls/{call_id}/wait")
+async def wait_for_call(call_id: str, timeout: float = 60):
+    """
+    Long-poll until the call ends or `timeout` seconds pass, then return its state
+    """
+    call = await call_states.wait(call_id, min(max(timeout, 0), 300))
+    if not call:
+        raise HTTPException(status_code=404, detail="Call not found")
+    return call
+
+@app.get("/metrics/call-queue")
+async def call_queue_metrics():
+    """
+    Fair-share scheduler queue depth, slot usage and wait times
+    """
+    return fair_scheduler.metrics()
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """
+    Hit rates of this worker's caches, plus shared-tier hits and single-flight coalescing
+    """
+    return {
+        "search": search_cache.stats(),
+        "extraction": extraction_cache.stats(),
+        "query": query_cache.stats(),
+        "results": results_cache.stats()
+    }
+
+@app.get("/metrics/plan-rules")
+async def plan_rules_metrics(days: int = 30):
+    """
+    Providers pruned by plan rules before calling and calls refused at dispatch, per reason
+    """
+    return calls_avoided(days)
+
+@app.get("/scheduled-calls")
+async def list_scheduled_calls():
+    """
+    Calls waiting for their clinic's next opening window
+    """
+    return {"scheduled_calls": await asyncio.to_thread(call_scheduler.queued)}
+
+@app.get("/scheduled-calls/{job_id}")
+async def get_scheduled_call(job_id: str):
+    job = await asyncio.to_thread(call_scheduler.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Scheduled call not found")
+    return job
+
+@app.delete("/scheduled-calls/{job_id}")
+async def cancel_scheduled_call(job_id: str):
+    if not await asyncio.to_thread(call_scheduler.cancel, job_id):
+        raise HTTPException(status_code=404, detail="No pending scheduled call with that id")
+    return {"message": "Scheduled call cancelled", "job_id": job_id}
+
+def require_admin(x_admin_token):
+    if not admin_token or x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profiles")
+async def list_profiles_endpoint(x_admin_token: Optional[str] = Header(None)):
+    """
+    List stored request profiles, newest first
+    """
+    require_admin(x_admin_token)
+    return {"profiles": list_profiles()}
+
+@app.get("/admin/profiles/{request_id}")
+async def get_profile_endpoint(
+    request_id: str,
+    format: str = "collapsed",
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Fetch a stored profile as collapsed stacks (for flamegraph.pl/speedscope) or JSON
+    """
+    require_admin(x_admin_token)
+    record = get_profile(request_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "json":
+        return record
+    return PlainTextResponse(collapsed_stacks(record))
+
+@app.get("/admin/costs")
+async def costs_endpoint(
+    group_by: str = "request",
+    since_hours: float = 24,
+    limit: int = 100,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Upstream cost and wall time rolled up per request, call or service, plus cost per booking
+    """
+    require_admin(x_admin_token)
+    if group_by not in ("request", "call", "service"):
+        raise HTTPException(status_code=400, detail="group_by must be request, call or service")
+    since = time.time() - since_hours * 3600
+    return {
+        "summary": cost_per_booking(since),
+        "rollups": rollups(group_by, since, limit)
+    }
+
+@app.get("/admin/prewarm")
+async def prewarm_report_endpoint(since_hours: float = 24, x_admin_token: Optional[str] = Header(None)):
+    """
+    Search cache hit rate with and without prewarmed entries, and prewarmer budget usage
+    """
+    require_admin(x_admin_token)
+    return await asyncio.to_thread(search_prewarmer.report, since_hours)
+
+@app.post("/admin/prewarm")
+async def run_prewarm_endpoint(x_admin_token: Optional[str] = Header(None)):
+    """
+    Run one prewarm pass now, regardless of the off-peak window (the daily budget still applies)
+    """
+    require_admin(x_admin_token)
+    refreshed = await search_prewarmer.run_once()
+    return {"refreshed": refreshed, **await asyncio.to_thread(search_prewarmer.report)}
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
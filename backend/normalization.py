@@ -0,0 +1,346 @@
+"""
+Canonical forms for specialties, locations and insurers.
+
+"Boston, MA", "boston ma" and "Boston Massachusetts" all become
+"Boston, MA"; "ENT" and "otolaryngologist" both become "otolaryngologist";
+"Premera BCBS" and "Premera Blue Cross" both become "Premera Blue Cross".
+Insurers only match whole known names: a regional plan ("Blue Shield of
+California", "Independence Blue Cross") keeps its own name rather than
+collapsing into a generic alias.
+Search results are cached under canonical_search_key(), so these variants
+share one SerpAPI query.
+
+Locations are resolved against an offline gazetteer (data/us_cities.csv).
+"""
+import csv
+import os
+import re
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "us_cities.csv")
+
+# Canonical specialty -> phrases patients use for it
+SPECIALTIES = {
+    "primary care physician": ["primary care physician", "primary care doctor", "primary care", "pcp",
+                               "family doctor", "family physician", "family medicine", "general practitioner",
+                               "general physician", "gp", "internist", "internal medicine"],
+    "pediatrician": ["pediatrician", "paediatrician", "pediatrics", "pediatric doctor", "kids doctor",
+                     "children's doctor", "childrens doctor", "child doctor"],
+    "otolaryngologist": ["otolaryngologist", "otolaryngology", "ent", "ent doctor", "ent specialist",
+                         "ear nose and throat", "ear nose throat", "ear, nose and throat", "ear, nose, and throat"],
+    "dermatologist": ["dermatologist", "dermatology", "skin doctor"],
+    "cardiologist": ["cardiologist", "cardiology", "heart doctor", "heart specialist"],
+    "obstetrician gynecologist": ["obstetrician gynecologist", "ob/gyn", "obgyn", "ob-gyn", "ob gyn",
+                                  "gynecologist", "gynaecologist", "gynecology", "obstetrician", "women's health"],
+    "orthopedic surgeon": ["orthopedic surgeon", "orthopaedic surgeon", "orthopedist", "orthopedic doctor",
+                           "orthopedics", "bone doctor"],
+    "neurologist": ["neurologist", "neurology"],
+    "psychiatrist": ["psychiatrist", "psychiatry"],
+    "psychologist": ["psychologist", "therapist", "counselor", "counsellor"],
+    "ophthalmologist": ["ophthalmologist", "ophthalmology", "eye doctor", "eye specialist"],
+    "optometrist": ["optometrist", "optometry"],
+    "dentist": ["dentist", "dental"],
+    "orthodontist": ["orthodontist", "orthodontics"],
+    "gastroenterologist": ["gastroenterologist", "gastroenterology", "gi doctor", "stomach doctor"],
+    "endocrinologist": ["endocrinologist", "endocrinology", "diabetes doctor", "thyroid doctor"],
+    "urologist": ["urologist", "urology"],
+    "pulmonologist": ["pulmonologist", "pulmonology", "lung doctor"],
+    "rheumatologist": ["rheumatologist", "rheumatology"],
+    "allergist": ["allergist", "allergy doctor", "immunologist", "allergy and immunology"],
+    "oncologist": ["oncologist", "oncology", "cancer doctor"],
+    "nephrologist": ["nephrologist", "nephrology", "kidney doctor"],
+    "podiatrist": ["podiatrist", "podiatry", "foot doctor"],
+    "physical therapist": ["physical therapist", "physical therapy", "physiotherapist", "pt"],
+    "chiropractor": ["chiropractor", "chiropractic"],
+    "urgent care": ["urgent care", "walk-in clinic", "walk in clinic"],
+}
+
+US_STATES = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas", "CA": "California",
+    "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware", "DC": "District of Columbia",
+    "FL": "Florida", "GA": "Georgia", "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois",
+    "IN": "Indiana", "IA": "Iowa", "KS": "Kansas", "KY": "Kentucky", "LA": "Louisiana",
+    "ME": "Maine", "MD": "Maryland", "MA": "Massachusetts", "MI": "Michigan", "MN": "Minnesota",
+    "MS": "Mississippi", "MO": "Missouri", "MT": "Montana", "NE": "Nebraska", "NV": "Nevada",
+    "NH": "New Hampshire", "NJ": "New Jersey", "NM": "New Mexico", "NY": "New York",
+    "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio", "OK": "Oklahoma", "OR": "Oregon",
+    "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina", "SD": "South Dakota",
+    "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont", "VA": "Virginia",
+    "WA": "Washington", "WV": "West Virginia", "WI": "Wisconsin", "WY": "Wyoming",
+}
+
+# Predominant IANA time zone per state (split states use their most populous zone)
+STATE_TIMEZONES = {
+    "AL": "America/Chicago", "AK": "America/Anchorage", "AZ": "America/Phoenix", "AR": "America/Chicago",
+    "CA": "America/Los_Angeles", "CO": "America/Denver", "CT": "America/New_York", "DE": "America/New_York",
+    "DC": "America/New_York", "FL": "America/New_York", "GA": "America/New_York", "HI": "Pacific/Honolulu",
+    "ID": "America/Boise", "IL": "America/Chicago", "IN": "America/Indiana/Indianapolis", "IA": "America/Chicago",
+    "KS": "America/Chicago", "KY": "America/New_York", "LA": "America/Chicago", "ME": "America/New_York",
+    "MD": "America/New_York", "MA": "America/New_York", "MI": "America/Detroit", "MN": "America/Chicago",
+    "MS": "America/Chicago", "MO": "America/Chicago", "MT": "America/Denver", "NE": "America/Chicago",
+    "NV": "America/Los_Angeles", "NH": "America/New_York", "NJ": "America/New_York", "NM": "America/Denver",
+    "NY": "America/New_York", "NC": "America/New_York", "ND": "America/Chicago", "OH": "America/New_York",
+    "OK": "America/Chicago", "OR": "America/Los_Angeles", "PA": "America/New_York", "RI": "America/New_York",
+    "SC": "America/New_York", "SD": "America/Chicago", "TN": "America/Chicago", "TX": "America/Chicago",
+    "UT": "America/Denver", "VT": "America/New_York", "VA": "America/New_York", "WA": "America/Los_Angeles",
+    "WV": "America/New_York", "WI": "America/Chicago", "WY": "America/Denver",
+}
+
+# Informal state spellings seen in queries, in addition to names and USPS codes
+STATE_ALIASES = {
+    "mass": "MA", "calif": "CA", "cali": "CA", "fla": "FL", "penn": "PA", "penna": "PA", "tex": "TX",
+    "ariz": "AZ", "colo": "CO", "conn": "CT", "ill": "IL", "mich": "MI", "minn": "MN", "wisc": "WI",
+    "wash": "WA", "ore": "OR", "d c": "DC",
+}
+
+# Nicknames for gazetteer cities
+CITY_ALIASES = {
+    "nyc": "new york", "new york city": "new york", "sf": "san francisco", "philly": "philadelphia",
+    "vegas": "las vegas", "nola": "new orleans", "slc": "salt lake city", "okc": "oklahoma city",
+    "the bronx": "bronx",
+}
+
+# Canonical insurer -> aliases, matched as whole words (longest alias wins)
+INSURERS = {
+    "Premera Blue Cross": ["premera", "premera blue cross", "premera blue cross blue shield", "premera bcbs",
+                           "premera blue cross of alaska"],
+    "Regence BlueShield": ["regence", "regence blueshield", "regence blue shield", "regence bcbs",
+                           "regence blue cross blue shield"],
+    "Anthem Blue Cross Blue Shield": ["anthem", "anthem blue cross", "anthem blue cross blue shield", "anthem bcbs"],
+    "Blue Cross Blue Shield of Massachusetts": ["blue cross blue shield of massachusetts", "bcbs of massachusetts", "bcbsma",
+                                                "blue cross massachusetts"],
+    "Blue Cross Blue Shield": ["blue cross blue shield", "blue cross and blue shield", "blue cross", "blue shield", "bcbs"],
+    "Aetna": ["aetna", "aetna health", "aetna cvs health"],
+    "Cigna": ["cigna", "cigna healthcare", "cigna health"],
+    "UnitedHealthcare": ["unitedhealthcare", "united healthcare", "united health care", "uhc", "united health"],
+    "Kaiser Permanente": ["kaiser", "kaiser permanente", "kaiser foundation health plan"],
+    "Humana": ["humana"],
+    "Medicare": ["medicare"],
+    "Medicaid": ["medicaid", "masshealth", "medi cal", "medi-cal", "apple health"],
+    "Molina Healthcare": ["molina", "molina healthcare"],
+    "TRICARE": ["tricare"],
+    "Oscar Health": ["oscar", "oscar health"],
+    "Ambetter": ["ambetter"],
+    "Harvard Pilgrim Health Care": ["harvard pilgrim", "harvard pilgrim health care", "hphc"],
+    "Tufts Health Plan": ["tufts", "tufts health plan"],
+    "Highmark": ["highmark", "highmark bcbs", "highmark blue cross blue shield"],
+}
+
+# Blue plans are independent regional companies: a generic Blue alias only
+# means these when nothing names the region ("blue cross of idaho")
+REGIONAL_INSURERS = {"Blue Cross Blue Shield", "Anthem Blue Cross Blue Shield"}
+REGIONAL_BLUE_PREFIXES = {"independence", "empire", "horizon", "carefirst", "wellmark", "excellus", "capital",
+                          "florida", "arkansas"}
+
+# Words that never change which insurer is meant
+_INSURER_NOISE = {"insurance", "inc", "co", "company", "corp", "corporation", "the", "plan", "plans",
+                  "ppo", "hmo", "epo", "pos", "hdhp"}
+
+_NULL_VALUES = {"", "n/a", "na", "null", "none", "unknown"}
+
+
+def clean_text(text):
+    """Lowercase, punctuation-free, single-spaced"""
+    text = str(text or "").lower().replace("’", "'").replace("&", " and ")
+    text = re.sub(r"[^\w\s'/-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _phrase_regex(phrases):
+    ordered = sorted(phrases, key=len, reverse=True)
+    return re.compile(r"(?<![\w/-])(" + "|".join(re.escape(p) for p in ordered) + r")(?![\w/-])")
+
+
+_specialty_lookup = {phrase: canonical for canonical, phrases in SPECIALTIES.items() for phrase in phrases}
+_specialty_re = _phrase_regex(_specialty_lookup)
+
+_insurer_lookup = {alias: canonical for canonical, aliases in INSURERS.items() for alias in aliases}
+_insurer_re = _phrase_regex(_insurer_lookup)
+
+_state_lookup = {abbrev.lower(): abbrev for abbrev in US_STATES}
+_state_lookup.update({name.lower(): abbrev for abbrev, name in US_STATES.items()})
+_state_lookup.update(STATE_ALIASES)
+
+_state_names = {name.lower() for name in US_STATES.values()}
+
+_zip_re = re.compile(r"^\d{5}(?:-\d{4})?$")
+_address_state_re = re.compile(r",\s*([A-Z]{2})\s+\d{5}(?:-\d{4})?\b|,\s*([A-Z]{2})\s*$")
+
+_gazetteer = None
+
+
+def city_key(city):
+    """Comparable form of a city name ("St. Louis" == "saint louis")"""
+    key = clean_text(city).replace("-", " ").replace("'", "")
+    key = CITY_ALIASES.get(key, key)
+    return re.sub(r"^(?:saint|st) ", "st ", key)
+
+
+def load_gazetteer():
+    """Map city_key -> list of gazetteer rows, most populous first"""
+    global _gazetteer
+    if _gazetteer is None:
+        gazetteer = {}
+        with open(GAZETTEER_PATH, newline="") as f:
+            for row in csv.DictReader(f):
+                row["lat"], row["lon"] = float(row["lat"]), float(row["lon"])
+                gazetteer.setdefault(city_key(row["city"]), []).append(row)
+        _gazetteer = gazetteer
+    return _gazetteer
+
+
+def lookup_city(city, state=None):
+    """Gazetteer row for a city (optionally within a state), or None"""
+    rows = load_gazetteer().get(city_key(city), [])
+    for row in rows:
+        if state is None or row["state"] == state:
+            return row
+    return None
+
+
+def find_specialty(text):
+    """First specialty mentioned anywhere in free text, as its canonical name"""
+    match = _specialty_re.search(clean_text(text))
+    return _specialty_lookup[match.group(1)] if match else None
+
+
+def _state_prefix(words):
+    """Number of trailing words that name a state, or 0"""
+    for size in (3, 2, 1):
+        if len(words) >= size and " ".join(words[-size:]) in _state_names:
+            return size
+    return 0
+
+
+def _state_suffix(words):
+    """Number of leading words that name a state (optionally after "of"), or 0"""
+    start = 1 if words[:1] == ["of"] else 0
+    for size in (3, 2, 1):
+        if len(words) >= start + size and " ".join(words[start:start + size]) in _state_names:
+            return start + size
+    return 0
+
+
+def _title(text):
+    return " ".join(w if w in ("of", "and") else w.title() for w in text.split())
+
+
+def find_insurer(text):
+    """
+    First insurer mentioned anywhere in free text, as its canonical name. A
+    regional Blue plan ("blue shield of california", "independence blue
+    cross") is returned by its own name, not the generic one.
+    """
+    text = clean_text(text)
+    match = _insurer_re.search(text)
+    if not match:
+        return None
+    name, canonical = match.group(1), _insurer_lookup[match.group(1)]
+    if canonical not in REGIONAL_INSURERS:
+        return canonical
+    before, after = text[:match.start()].split(), text[match.end():].split()
+    if before and before[-1] in REGIONAL_BLUE_PREFIXES:
+        return _title(f"{before[-1]} {name}")
+    prefix, suffix = _state_prefix(before), _state_suffix(after)
+    if prefix or suffix:
+        return _title(" ".join(before[len(before) - prefix:] + [name] + after[:suffix]))
+    return canonical
+
+
+def normalize_specialty(doctor_type):
+    """Canonical specialty name, or the cleaned input when unknown"""
+    text = clean_text(doctor_type)
+    if text in _NULL_VALUES:
+        return None
+    specialty = find_specialty(text)
+    if specialty:
+        return specialty
+    return text
+
+
+def split_state(text):
+    """Split a cleaned location into (city text, state code) using its trailing words"""
+    words = text.split()
+    for size in (4, 3, 2, 1):
+        if len(words) >= size:
+            tail = " ".join(words[-size:])
+            if tail in _state_lookup:
+                return " ".join(words[:-size]), _state_lookup[tail]
+    return text, None
+
+
+def normalize_location(location):
+    """
+    Canonical "City, ST" for a free-text location
+
+    Returns a 5-digit ZIP as-is, a bare state code for state-only input, and
+    a title-cased best effort for cities not in the gazetteer.
+    """
+    text = clean_text(location)
+    if text in _NULL_VALUES:
+        return None
+    if _zip_re.match(text):
+        return text[:5]
+
+    # A bare city name ("new york", "washington") is a city, not a state
+    row = lookup_city(text)
+    if row:
+        return f"{row['city']}, {row['state']}"
+
+    city, state = split_state(text)
+    if not city:
+        return state
+    row = lookup_city(city, state)
+    if row:
+        return f"{row['city']}, {row['state']}"
+    if state:
+        return f"{city.title()}, {state}"
+    return text.title()
+
+
+def normalize_insurer(insurer):
+    """
+    Canonical insurer name, or the cleaned, title-cased input when unknown.
+    A regional Blue plan only matches when its whole name is a known alias;
+    anything left over ("of California", "Independence") keeps the input.
+    """
+    text = clean_text(insurer)
+    if text in _NULL_VALUES:
+        return None
+    words = " ".join(w for w in text.split() if w not in _INSURER_NOISE)
+    match = _insurer_re.search(words)
+    if match:
+        canonical = _insurer_lookup[match.group(1)]
+        if canonical not in REGIONAL_INSURERS or match.group(0) == words:
+            return canonical
+    return _title(words) or None
+
+
+def location_state(text):
+    """State code for a street address ("..., Boston, MA 02115") or free-text location"""
+    match = _address_state_re.search(str(text or "").strip())
+    if match:
+        state = match.group(1) or match.group(2)
+        if state in US_STATES:
+            return state
+    canonical = normalize_location(text)
+    if canonical and canonical[-2:] in US_STATES:
+        return canonical[-2:]
+    return None
+
+
+def location_timezone(*texts):
+    """IANA time zone inferred from the first address/location that names a state"""
+    for text in texts:
+        state = location_state(text)
+        if state:
+            return STATE_TIMEZONES[state]
+    return None
+
+
+def canonical_search_key(doctor_type, location, insurer):
+    """Cache key shared by every spelling of the same (specialty, location, insurer) need"""
+    return "|".join([
+        normalize_specialty(doctor_type) or "",
+        (normalize_location(location) or "").lower(),
+        (normalize_insurer(insurer) or "").lower(),
+    ])
@@ -0,0 +1,354 @@
+"""
+Plan rules: drop providers a patient's plan won't cover before calling them.
+
+Two sources of knowledge, applied to the whole candidate list between the
+search and dialing:
+
+  - a rules table per insurer and plan type (PPO/HMO/EPO/POS): whether
+    specialists need a referral, and whether out-of-network care is
+    covered at all. Defaults are in PLAN_RULES; PLAN_RULES_PATH (JSON list
+    of rules in the same shape) adds insurer- or employer-group-specific
+    ones, which take precedence
+  - what past calls taught us about each clinic: "we're not in network
+    with that plan" or "we need a referral first" is remembered per
+    provider, insurer and plan type (and cleared when the clinic books
+    the same plan), for CLINIC_NETWORK_TTL_DAYS
+
+Only what is known to hold for this patient prunes a provider: rules for
+their insurer or employer group, and clinic knowledge. Rules for any
+insurer (e.g. "HMOs need a referral for specialists") are advisory, since
+plenty of HMOs are open access: affected providers are kept, flagged with
+"plan_warning" and ranked after the rest.
+
+Rules are compiled into a lookup once, and clinic knowledge for a candidate
+list is read in one query, so filtering a search costs one SQLite read.
+Pruned providers and calls refused at dispatch are counted per reason
+(calls_avoided()).
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from normalization import normalize_insurer, find_specialty
+from provider_index import provider_key
+
+PLAN_RULES_ENABLED = os.getenv("PLAN_RULES_ENABLED", "true").lower() in ("1", "true", "yes")
+PLAN_RULES_DB = os.getenv("PLAN_RULES_DB", "plan_rules.db")
+PLAN_RULES_PATH = os.getenv("PLAN_RULES_PATH")
+CLINIC_NETWORK_TTL_DAYS = float(os.getenv("CLINIC_NETWORK_TTL_DAYS", "180"))
+
+ANY = "*"
+
+# insurer / plan_type / group_prefix of ANY match everything; the most specific matching rule wins.
+#   referral: specialists (other than SELF_REFERRAL_SPECIALTIES) need a referral
+#   in_network_only: out-of-network visits aren't covered
+#   network_names: only providers whose name matches are in network (closed networks)
+# Fields decided by a rule with insurer and group_prefix both ANY only flag providers.
+PLAN_RULES = [
+    {"insurer": ANY, "plan_type": "HMO", "referral": True, "in_network_only": True},
+    {"insurer": ANY, "plan_type": "EPO", "referral": False, "in_network_only": True},
+    {"insurer": ANY, "plan_type": "POS", "referral": True, "in_network_only": False},
+    {"insurer": ANY, "plan_type": "PPO", "referral": False, "in_network_only": False},
+    {"insurer": "Kaiser Permanente", "plan_type": ANY, "in_network_only": True, "network_names": ["kaiser"]},
+]
+
+# Specialties members can book without a referral on referral plans
+SELF_REFERRAL_SPECIALTIES = {"primary care physician", "pediatrician", "obstetrician gynecologist", "urgent care"}
+
+PLAN_TYPES = ["HMO", "EPO", "POS", "PPO"]
+
+# What a clinic's decline reason tells us about its network
+_out_of_network_re = re.compile(
+    r"out[- ]of[- ]network|not (?:in|part of) (?:the |your |that )?network|"
+    r"(?:don'?t|do not|doesn'?t|does not|no longer) (?:take|accept)|not (?:accepting|taking) (?:your|that|this)",
+    re.I,
+)
+_referral_re = re.compile(r"referr", re.I)
+
+_lock = threading.Lock()
+_initialized = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clinic_network (
+    provider_key TEXT NOT NULL,
+    insurer TEXT NOT NULL,
+    plan_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    reason TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (provider_key, insurer, plan_type)
+);
+CREATE TABLE IF NOT EXISTS calls_avoided (
+    day TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, reason, stage)
+);
+"""
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(PLAN_RULES_DB, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _initialized = True
+    return conn
+
+
+def normalize_plan_type(plan_type):
+    """'Blue Select HMO' -> 'HMO'; None when the card doesn't say"""
+    text = str(plan_type or "").upper()
+    for name in PLAN_TYPES:
+        if re.search(rf"\b{name}\b", text):
+            return name
+    if "EXCLUSIVE PROVIDER" in text:
+        return "EPO"
+    if "HEALTH MAINTENANCE" in text:
+        return "HMO"
+    if "POINT OF SERVICE" in text:
+        return "POS"
+    if "PREFERRED PROVIDER" in text:
+        return "PPO"
+    return None
+
+
+def _insurer_key(insurer):
+    return (normalize_insurer(insurer) or ANY).lower()
+
+
+def load_rules(path=PLAN_RULES_PATH):
+    """
+    Compile the rules table into {(insurer, plan_type): [rules, most specific first]}
+
+    Rules from PLAN_RULES_PATH come before the defaults, so they win ties.
+    """
+    rules = list(PLAN_RULES)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            rules = json.load(f) + rules
+    compiled = {}
+    for order, rule in enumerate(rules):
+        insurer = ANY if rule.get("insurer", ANY) == ANY else _insurer_key(rule["insurer"])
+        plan_type = normalize_plan_type(rule.get("plan_type")) or ANY
+        specificity = (rule.get("group_prefix", ANY) != ANY) * 4 + (insurer != ANY) * 2 + (plan_type != ANY)
+        compiled.setdefault((insurer, plan_type), []).append((-specificity, order, rule))
+    for entries in compiled.values():
+        entries.sort(key=lambda entry: entry[:2])
+    return compiled
+
+
+_rules = None
+
+
+def plan_policy(insurer, plan_type, group_number=None):
+    """
+    Referral and network constraints for a patient's plan, merged from every
+    matching rule (most specific first)
+
+    Returns:
+        dict: {"plan_type", "referral", "in_network_only", "network_names", "binding"}, where
+            binding is the set of fields decided by an insurer- or group-specific rule
+    """
+    global _rules
+    if _rules is None:
+        _rules = load_rules()
+    insurer_key, plan = _insurer_key(insurer), normalize_plan_type(plan_type)
+    group = str(group_number or "").strip().upper()
+
+    matches = []
+    for key in {(insurer_key, plan or ANY), (insurer_key, ANY), (ANY, plan or ANY), (ANY, ANY)}:
+        for specificity, order, rule in _rules.get(key, []):
+            prefix = str(rule.get("group_prefix", ANY)).upper()
+            if prefix == ANY or (group and group.startswith(prefix)):
+                matches.append((specificity, order, rule))
+    matches.sort(key=lambda entry: entry[:2])
+
+    policy = {"plan_type": plan, "referral": False, "in_network_only": False, "network_names": None, "binding": set()}
+    for field in ("referral", "in_network_only", "network_names"):
+        for _, _, rule in matches:
+            if field in rule:
+                policy[field] = rule[field]
+                if rule.get("insurer", ANY) != ANY or rule.get("group_prefix", ANY) != ANY:
+                    policy["binding"].add(field)
+                break
+    return policy
+
+
+def learn_from_outcome(doctor, insurer, plan_type, outcome):
+    """
+    Remember what a finished call revealed about the clinic's network
+    (subscribed to call outcomes next to the provider index)
+    """
+    if not isinstance(outcome, dict) or not doctor:
+        return
+    status = str(outcome.get("status") or "").lower()
+    reason = " ".join(str(outcome.get(field) or "") for field in ("reason", "notes"))
+    if status == "booked":
+        learned = "in_network"
+    elif status in ("declined", "out_of_network", "insurance_not_accepted") and _referral_re.search(reason):
+        learned = "referral_required"
+    elif status in ("out_of_network", "insurance_not_accepted") or (status == "declined" and _out_of_network_re.search(reason)):
+        learned = "out_of_network"
+    else:
+        return
+
+    insurer_key = _insurer_key(insurer)
+    if insurer_key == ANY:
+        return
+    try:
+        with _lock:
+            conn = _connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO clinic_network (provider_key, insurer, plan_type, status, reason, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (provider_key(doctor), insurer_key, normalize_plan_type(plan_type) or ANY, learned,
+                         reason.strip() or status, time.time()),
+                    )
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Clinic network knowledge unavailable: {e}")
+
+
+def clinic_network(doctors, insurer, plan_type):
+    """Known network status per provider key for this insurer and plan type (exact plan first)"""
+    keys = list({provider_key(doctor) for doctor in doctors})
+    insurer_key = _insurer_key(insurer)
+    if not keys or insurer_key == ANY:
+        return {}
+    plan = normalize_plan_type(plan_type) or ANY
+    since = time.time() - CLINIC_NETWORK_TTL_DAYS * 86400
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                f"SELECT provider_key, plan_type, status, reason FROM clinic_network "
+                f"WHERE provider_key IN ({','.join('?' * len(keys))}) AND insurer = ? AND plan_type IN (?, ?) "
+                "AND updated_at >= ?",
+                (*keys, insurer_key, plan, ANY, since),
+            ).fetchall()
+        finally:
+            conn.close()
+    known = {}
+    for key, row_plan, status, reason in sorted(rows, key=lambda row: row[1] == plan):
+        # Rows for the patient's exact plan type sort last and override plan-agnostic ones
+        known[key] = {"status": status, "reason": reason}
+    return known
+
+
+def ineligible_reason(doctor, policy, specialty, has_referral, known):
+    """
+    Why this provider may not be able to see the patient under their plan
+
+    Returns:
+        tuple: (reason or None, whether it's binding rather than advisory)
+    """
+    if known and known["status"] == "out_of_network":
+        # Plans with out-of-network benefits would still cover it, but the clinic already said no
+        return ("out_of_network" if policy["in_network_only"] else "insurance_not_accepted"), True
+    if known and known["status"] == "referral_required" and not has_referral:
+        return "referral_required", True
+    if policy["network_names"] and not (known and known["status"] == "in_network"):
+        name = f"{doctor.get('title', '')} {doctor.get('website', '')}".lower()
+        if not any(network in name for network in policy["network_names"]):
+            return "out_of_network", "network_names" in policy["binding"]
+    if policy["referral"] and not has_referral and specialty and specialty not in SELF_REFERRAL_SPECIALTIES:
+        return "referral_required", "referral" in policy["binding"]
+    return None, False
+
+
+def filter_providers(doctors, insurance_info, specialty, has_referral=False, stage="search"):
+    """
+    Split candidates into those worth calling and those the plan rules out. Providers
+    only advisory rules object to stay eligible, flagged with "plan_warning" and moved
+    after the unflagged ones (otherwise in their original order).
+
+    Args:
+        doctors (list): Providers from search_doctors
+        insurance_info (dict): insurance_company, plan_type and group_number
+        specialty (str): What the patient is booking (free text is fine)
+        has_referral (bool): The patient already has a referral
+        stage (str): Where the filter ran, for the calls-avoided counters
+
+    Returns:
+        tuple: (eligible doctors, excluded doctors annotated with "ineligible_reason")
+    """
+    if not PLAN_RULES_ENABLED or not doctors:
+        return doctors, []
+    insurer = insurance_info.get("insurance_company")
+    policy = plan_policy(insurer, insurance_info.get("plan_type"), insurance_info.get("group_number"))
+    specialty = find_specialty(specialty) if specialty else None
+    try:
+        known = clinic_network(doctors, insurer, insurance_info.get("plan_type"))
+    except sqlite3.Error as e:
+        print(f"Clinic network knowledge unavailable, using plan rules only: {e}")
+        known = {}
+
+    eligible, flagged, excluded = [], [], []
+    for doctor in doctors:
+        reason, binding = ineligible_reason(doctor, policy, specialty, has_referral, known.get(provider_key(doctor)))
+        if reason and binding:
+            doctor["ineligible_reason"] = reason
+            excluded.append(doctor)
+        elif reason:
+            doctor["plan_warning"] = reason
+            flagged.append(doctor)
+        else:
+            eligible.append(doctor)
+    if excluded:
+        record_avoided([doctor["ineligible_reason"] for doctor in excluded], stage)
+    return eligible + flagged, excluded
+
+
+def record_avoided(reasons, stage):
+    """Count providers pruned (stage "search") or calls refused ("dispatch"), per reason"""
+    day = time.strftime("%Y-%m-%d")
+    counts = {}
+    for reason in reasons:
+        counts[reason] = counts.get(reason, 0) + 1
+    try:
+        with _lock:
+            conn = _connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO calls_avoided (day, reason, stage, count) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (day, reason, stage) DO UPDATE SET count = count + excluded.count",
+                        [(day, reason, stage, count) for reason, count in counts.items()],
+                    )
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Calls-avoided counter unavailable: {e}")
+
+
+def calls_avoided(days=30):
+    """Pruned providers and refused calls per reason and stage over the last `days` days"""
+    since = time.strftime("%Y-%m-%d", time.localtime(time.time() - days * 86400))
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                "SELECT reason, stage, SUM(count) FROM calls_avoided WHERE day >= ? GROUP BY reason, stage",
+                (since,),
+            ).fetchall()
+            known = conn.execute("SELECT status, COUNT(*) FROM clinic_network GROUP BY status").fetchall()
+        finally:
+            conn.close()
+    by_reason = {}
+    for reason, stage, count in rows:
+        by_reason.setdefault(reason, {})[stage] = count
+    return {
+        "days": days,
+        "total": sum(count for _, _, count in rows),
+        "by_reason": by_reason,
+        "clinics_known": dict(known),
+    }
@@ -0,0 +1,269 @@
+"""
+Background prewarming of provider search results.
+
+Every interactive search is logged (canonical key, hit or miss) in SQLite.
+Off-peak (PREWARM_HOURS in PREWARM_TIMEZONE), CachePrewarmer mines that
+history for the PREWARM_TOP_N most searched (specialty, location, insurer)
+combinations and refreshes their provider lists upstream, with a TTL long
+enough (PREWARM_TTL) to cover the next business day, so the first patient
+of the day is served warm.
+
+Refreshes are capped at PREWARM_DAILY_SEARCHES upstream SerpAPI searches
+per day and spaced out; combinations still warm for longer than
+PREWARM_MIN_REMAINING are skipped. report() shows the hit rate with and
+without the hits that prewarming provided.
+
+Every uvicorn worker runs a CachePrewarmer, but only one refreshes at a
+time: the run lock, the day's budget and which keys are prewarmed live in
+the shared store (SHARED_CACHE_URL, or PREWARM_DB when that's off), so N
+workers spend one budget and a restart doesn't reset it.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from cache import SQLiteStore
+from call_scheduler import parse_range
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() in ("1", "true", "yes")
+PREWARM_DB = os.getenv("PREWARM_DB", "prewarm.db")
+PREWARM_TOP_N = int(os.getenv("PREWARM_TOP_N", "50"))
+PREWARM_HISTORY_DAYS = float(os.getenv("PREWARM_HISTORY_DAYS", "7"))
+# Same-day range in office-hours format, e.g. "2 AM-5 AM" or "1:00-14:00"
+PREWARM_HOURS = os.getenv("PREWARM_HOURS", "2 AM-5 AM")
+PREWARM_TIMEZONE = os.getenv("PREWARM_TIMEZONE", "America/New_York")
+PREWARM_DAILY_SEARCHES = int(os.getenv("PREWARM_DAILY_SEARCHES", "150"))
+PREWARM_TTL = int(os.getenv("PREWARM_TTL", "86400"))
+PREWARM_MIN_REMAINING = int(os.getenv("PREWARM_MIN_REMAINING", "43200"))
+PREWARM_SPACING_SECONDS = float(os.getenv("PREWARM_SPACING_SECONDS", "2"))
+PREWARM_CHECK_SECONDS = float(os.getenv("PREWARM_CHECK_SECONDS", "600"))
+# Longest a refresh run may hold the run lock before another worker can take over
+PREWARM_LOCK_TTL = float(os.getenv("PREWARM_LOCK_TTL", "3600"))
+
+_lock = threading.Lock()
+_initialized = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cache_key TEXT NOT NULL,
+    doctor_type TEXT,
+    location TEXT,
+    insurer TEXT,
+    hit INTEGER NOT NULL,
+    warm INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS search_history_created ON search_history (created_at);
+"""
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(PREWARM_DB, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _initialized = True
+    return conn
+
+
+def record_search(cache_key, doctor_type, location, insurer, hit, warm=False):
+    """Log one interactive search; warm means the hit was served by a prewarmed entry"""
+    try:
+        with _lock:
+            conn = _connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT INTO search_history (cache_key, doctor_type, location, insurer, hit, warm, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (cache_key, doctor_type, location, insurer, int(hit), int(warm), time.time()),
+                    )
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Search history unavailable: {e}")
+
+
+def top_searches(since, limit=PREWARM_TOP_N):
+    """Most searched combinations since `since`: [(cache_key, doctor_type, location, insurer, count)]"""
+    with _lock:
+        conn = _connect()
+        try:
+            return conn.execute(
+                "SELECT cache_key, doctor_type, location, insurer, COUNT(*) AS searches FROM search_history "
+                "WHERE created_at >= ? GROUP BY cache_key ORDER BY searches DESC LIMIT ?",
+                (since, limit),
+            ).fetchall()
+        finally:
+            conn.close()
+
+
+def prune_history(before):
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM search_history WHERE created_at < ?", (before,))
+        finally:
+            conn.close()
+
+
+def hit_rates(since):
+    """Interactive hit rate, and what it would have been without prewarmed entries"""
+    with _lock:
+        conn = _connect()
+        try:
+            total, hits, warm = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hit), 0), COALESCE(SUM(warm), 0) FROM search_history WHERE created_at >= ?",
+                (since,),
+            ).fetchone()
+        finally:
+            conn.close()
+    return {
+        "searches": total,
+        "hits": hits,
+        "warm_hits": warm,
+        "hit_rate": round(hits / total, 3) if total else 0.0,
+        "hit_rate_without_prewarm": round((hits - warm) / total, 3) if total else 0.0,
+        "hit_rate_improvement": round(warm / total, 3) if total else 0.0,
+    }
+
+
+class CachePrewarmer:
+    """Refreshes the most popular searches off-peak within a daily upstream budget"""
+
+    def __init__(self, cache, refresh, searches_per_refresh=3, store=None):
+        """
+        Args:
+            cache (TieredCache): The search cache being warmed
+            refresh (callable): Blocking (doctor_type, location, insurer) -> doctors; runs the
+                search upstream and stores it in the cache with PREWARM_TTL
+            searches_per_refresh (int): Upstream searches one refresh costs (result pages)
+            store: Shared store for the run lock, budget and prewarmed keys; PREWARM_DB when None
+        """
+        self.cache = cache
+        self.refresh = refresh
+        self.searches_per_refresh = searches_per_refresh
+        self.store = store if store is not None else SQLiteStore(PREWARM_DB)
+        self.tz = ZoneInfo(PREWARM_TIMEZONE)
+        self.window = parse_range(PREWARM_HOURS)
+        self.stats = {"runs": 0, "refreshed": 0, "skipped_warm": 0, "skipped_busy": 0, "failed": 0, "last_run": None}
+        self._task = None
+        self._running = asyncio.Lock()
+
+    def start(self):
+        if self._task is None and PREWARM_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    def off_peak(self, now=None):
+        if not self.window:
+            return False
+        local = datetime.fromtimestamp(now or time.time(), self.tz)
+        minute = local.hour * 60 + local.minute
+        return self.window[0] <= minute < self.window[1]
+
+    def _budget_key(self, day):
+        return f"prewarm:budget:{day.isoformat()}"
+
+    def searches_used(self, day=None):
+        """Upstream searches prewarming has spent on `day` (today), across workers"""
+        entry = self.store.get(self._budget_key(day or datetime.now(self.tz).date()))
+        return entry[0] if entry else 0
+
+    def is_warm(self, cache_key):
+        """Whether a cache hit for this key is being served by a prewarmed entry"""
+        try:
+            entry = self.store.get(f"prewarm:warm:{cache_key}")
+        except Exception as e:
+            print(f"Prewarm state unavailable: {e}")
+            return False
+        return bool(entry and entry[0] > time.time())
+
+    def record(self, cache_key, doctor_type, location, insurer, hit):
+        """Log an interactive search (called by search_doctors)"""
+        if not hit:
+            # A miss replaces any prewarmed entry that was evicted early
+            try:
+                self.store.set(f"prewarm:warm:{cache_key}", 0, 1)
+            except Exception as e:
+                print(f"Prewarm state unavailable: {e}")
+        record_search(cache_key, doctor_type, location, insurer, hit, warm=hit and self.is_warm(cache_key))
+
+    async def _run(self):
+        while True:
+            try:
+                if self.off_peak():
+                    await self.run_once()
+            except Exception as e:
+                print(f"Cache prewarm failed: {e}")
+            await asyncio.sleep(PREWARM_CHECK_SECONDS)
+
+    async def run_once(self):
+        """
+        Refresh the top searches that are not warm for long enough, within today's budget.
+        Returns 0 without refreshing if another worker holds the run lock.
+        """
+        async with self._running:
+            owner = uuid.uuid4().hex
+            if not await asyncio.to_thread(self.store.acquire, "prewarm:run", owner, PREWARM_LOCK_TTL):
+                self.stats["skipped_busy"] += 1
+                return 0
+            try:
+                return await self._refresh_top()
+            finally:
+                await asyncio.to_thread(self.store.release, "prewarm:run", owner)
+
+    async def _refresh_top(self):
+        # The budget is only read and written under the run lock
+        today = datetime.now(self.tz).date()
+        used = await asyncio.to_thread(self.searches_used, today)
+        now = time.time()
+        self.stats["runs"] += 1
+        self.stats["last_run"] = now
+        since = now - PREWARM_HISTORY_DAYS * 86400
+        await asyncio.to_thread(prune_history, since - PREWARM_HISTORY_DAYS * 86400)
+
+        refreshed = 0
+        for cache_key, doctor_type, location, insurer, _ in await asyncio.to_thread(top_searches, since):
+            if used + self.searches_per_refresh > PREWARM_DAILY_SEARCHES:
+                print(f"Prewarm budget used up for today ({used} searches)")
+                break
+            remaining = await asyncio.to_thread(self.cache.expires_in, cache_key)
+            if remaining and remaining > PREWARM_MIN_REMAINING:
+                self.stats["skipped_warm"] += 1
+                continue
+            # Spent before the search runs, so a crash mid-refresh can't overspend
+            used += self.searches_per_refresh
+            await asyncio.to_thread(self.store.set, self._budget_key(today), used, 2 * 86400)
+            try:
+                doctors = await asyncio.to_thread(self.refresh, doctor_type, location, insurer)
+            except Exception as e:
+                print(f"Prewarm of {cache_key} failed: {e}")
+                self.stats["failed"] += 1
+                continue
+            if doctors:
+                await asyncio.to_thread(self.store.set, f"prewarm:warm:{cache_key}", time.time() + PREWARM_TTL, PREWARM_TTL)
+                self.stats["refreshed"] += 1
+                refreshed += 1
+            await asyncio.sleep(PREWARM_SPACING_SECONDS)
+
+        print(f"Prewarmed {refreshed} searches ({used}/{PREWARM_DAILY_SEARCHES} upstream searches used today)")
+        return refreshed
+
+    def report(self, since_hours=24):
+        since = time.time() - since_hours * 3600
+        return {
+            **hit_rates(since),
+            "searches_used_today": self.searches_used(),
+            "daily_search_budget": PREWARM_DAILY_SEARCHES,
+            "top_n": PREWARM_TOP_N,
+            "off_peak_hours": f"{PREWARM_HOURS} {PREWARM_TIMEZONE}",
+            **self.stats,
+        }
@@ -0,0 +1,123 @@
+"""
+Opt-in per-request sampling profiler.
+
+A request is profiled when it carries the profiling header or is picked by
+the sampling rate. While it runs, a background thread samples the stack of
+the thread serving it every few milliseconds and aggregates them into
+collapsed stacks ("frame;frame;frame count"), which flamegraph.pl,
+speedscope and inferno all read directly.
+
+Note that async endpoints share the event loop thread, so samples taken
+while the request awaits may include other requests' frames.
+"""
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "100"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "4"))
+
+_profiles = OrderedDict()
+_lock = threading.Lock()
+_active = 0
+
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed interval"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_MS / 1000.0):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def should_profile(headers):
+    """Decide whether this request is profiled (header or sampling rate)"""
+    if _active >= PROFILE_MAX_CONCURRENT:
+        return False
+    if headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile():
+    global _active
+    with _lock:
+        _active += 1
+    return SamplingProfiler(threading.get_ident()).start(), time.perf_counter()
+
+
+def finish_profile(request_id, profiler, started, method, path, status_code):
+    """Stop the profiler and keep the result, evicting the oldest beyond the limit"""
+    global _active
+    profiler.stop()
+    record = {
+        "request_id": request_id,
+        "method": method,
+        "path": path,
+        "status_code": status_code,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "interval_ms": profiler.interval * 1000,
+        "samples": profiler.samples,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "stacks": dict(profiler.stacks),
+    }
+    with _lock:
+        _active -= 1
+        _profiles[request_id] = record
+        while len(_profiles) > PROFILE_MAX_STORED:
+            _profiles.popitem(last=False)
+    return record
+
+
+def new_request_id(headers):
+    return headers.get("X-Request-ID") or uuid.uuid4().hex
+
+
+def list_profiles():
+    with _lock:
+        return [
+            {key: value for key, value in record.items() if key != "stacks"}
+            for record in reversed(_profiles.values())
+        ]
+
+
+def get_profile(request_id):
+    with _lock:
+        return _profiles.get(request_id)
+
+
+def collapsed_stacks(record):
+    """Render a profile in the collapsed-stack text format"""
+    return "\n".join(f"{stack} {count}" for stack, count in sorted(record["stacks"].items()))
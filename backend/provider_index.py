@@ -0,0 +1,220 @@
+"""
+Provider outcome index.
+
+Learns from call results which clinics answer, accept the patient's
+insurer and actually book, so the clinics most likely to book quickly are
+called first. Stats are kept per provider (NPI, else phone number) and per
+insurer in SQLite, as exponentially time-decayed counters so that
+yesterday's "we don't take Premera" weighs more than last year's booking.
+
+Each provider also has an all-insurer row ("*") for answer rate and call
+duration, which don't depend on the insurer.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from normalization import normalize_insurer
+
+PROVIDER_INDEX_DB = os.getenv("PROVIDER_INDEX_DB", "provider_index.db")
+HALF_LIFE_DAYS = float(os.getenv("PROVIDER_INDEX_HALF_LIFE_DAYS", "14"))
+DEFAULT_CALL_SECONDS = float(os.getenv("DEFAULT_CALL_SECONDS", "180"))
+
+ANY_INSURER = "*"
+
+# Call result statuses, from simulated calls and agent outcome events
+NOT_ANSWERED = {"voicemail", "busy", "no_answer", "failed", "error", "invalid_number"}
+NOT_ACCEPTING = {"declined", "not_accepting", "insurance_not_accepted", "out_of_network", "do_not_call"}
+BOOKED = {"success", "booked"}
+
+# Beta priors (successes, failures) so unseen clinics rank by a sensible default
+ANSWER_PRIOR = (3.0, 2.0)
+ACCEPT_PRIOR = (1.0, 1.0)
+BOOK_PRIOR = (2.0, 2.0)
+# Pseudo-calls of DEFAULT_CALL_SECONDS mixed into the duration average, so a
+# few short "we don't take your insurance" calls don't look cheap
+DURATION_PRIOR_CALLS = 3.0
+
+_lock = threading.Lock()
+_initialized = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS provider_stats (
+    provider_key TEXT NOT NULL,
+    insurer TEXT NOT NULL,
+    attempts REAL NOT NULL DEFAULT 0,
+    answered REAL NOT NULL DEFAULT 0,
+    accepted REAL NOT NULL DEFAULT 0,
+    booked REAL NOT NULL DEFAULT 0,
+    duration_sum REAL NOT NULL DEFAULT 0,
+    duration_count REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (provider_key, insurer)
+)
+"""
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(PROVIDER_INDEX_DB, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(SCHEMA)
+        _initialized = True
+    return conn
+
+
+def provider_key(doctor):
+    """Stable identity for a provider: NPI, else 10-digit phone, else title+address"""
+    if doctor.get("npi"):
+        return f"npi:{doctor['npi']}"
+    digits = re.sub(r"\D", "", str(doctor.get("phone") or ""))
+    if len(digits) >= 10:
+        return f"tel:{digits[-10:]}"
+    return f"name:{str(doctor.get('title', '')).lower()}|{str(doctor.get('address', '')).lower()}"
+
+
+def _insurer_key(insurer):
+    return (normalize_insurer(insurer) or ANY_INSURER).lower()
+
+
+def _decay(age_seconds):
+    return 0.5 ** (age_seconds / (HALF_LIFE_DAYS * 86400))
+
+
+def _update(conn, key, insurer, answered, accepted, booked, duration, now):
+    row = conn.execute(
+        "SELECT attempts, answered, accepted, booked, duration_sum, duration_count, updated_at "
+        "FROM provider_stats WHERE provider_key = ? AND insurer = ?",
+        (key, insurer),
+    ).fetchone()
+
+    stats = [0.0] * 6
+    if row:
+        factor = _decay(now - row[6])
+        stats = [value * factor for value in row[:6]]
+
+    stats[0] += 1
+    stats[1] += answered
+    stats[2] += accepted
+    stats[3] += booked
+    if duration:
+        stats[4] += duration
+        stats[5] += 1
+
+    conn.execute(
+        "INSERT OR REPLACE INTO provider_stats "
+        "(provider_key, insurer, attempts, answered, accepted, booked, duration_sum, duration_count, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (key, insurer, *stats, now),
+    )
+
+
+def record_call_result(doctor, insurer, result):
+    """
+    Fold one call result into the index
+
+    Args:
+        doctor (dict): Provider as returned by search_doctors
+        insurer (str): Patient's insurance company
+        result (dict): Call result with a "status" and optional "duration_seconds"
+    """
+    if not isinstance(result, dict) or not result.get("status"):
+        return
+
+    status = str(result["status"]).lower()
+    answered = 0.0 if status in NOT_ANSWERED else 1.0
+    accepted = 1.0 if answered and status not in NOT_ACCEPTING else 0.0
+    booked = 1.0 if status in BOOKED else 0.0
+    duration = float(result.get("duration_seconds") or 0)
+    key = provider_key(doctor)
+    now = time.time()
+
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                _update(conn, key, ANY_INSURER, answered, accepted, booked, duration, now)
+                insurer_key = _insurer_key(insurer)
+                if insurer_key != ANY_INSURER:
+                    _update(conn, key, insurer_key, answered, accepted, booked, duration, now)
+        finally:
+            conn.close()
+
+
+def _rate(successes, trials, prior):
+    return (successes + prior[0]) / (trials + prior[0] + prior[1])
+
+
+def provider_stats(doctors, insurer):
+    """Decayed stats for each doctor as {provider_key: {"*": row, insurer: row}}"""
+    keys = list({provider_key(doctor) for doctor in doctors})
+    if not keys:
+        return {}
+
+    insurer_key = _insurer_key(insurer)
+    now = time.time()
+    stats = {}
+    with _lock:
+        conn = _connect()
+        try:
+            placeholders = ",".join("?" * len(keys))
+            rows = conn.execute(
+                "SELECT provider_key, insurer, attempts, answered, accepted, booked, duration_sum, "
+                f"duration_count, updated_at FROM provider_stats WHERE provider_key IN ({placeholders}) "
+                "AND insurer IN (?, ?)",
+                (*keys, ANY_INSURER, insurer_key),
+            ).fetchall()
+        finally:
+            conn.close()
+
+    for key, row_insurer, *values, updated_at in rows:
+        factor = _decay(now - updated_at)
+        stats.setdefault(key, {})[row_insurer] = dict(zip(
+            ["attempts", "answered", "accepted", "booked", "duration_sum", "duration_count"],
+            [value * factor for value in values],
+        ))
+    return stats
+
+
+def expected_seconds_to_booking(stats, insurer):
+    """
+    Expected dialing time until a booking with this provider:
+    average call duration / P(answer) * P(accept | answer) * P(book | accept)
+    """
+    overall = stats.get(ANY_INSURER, {})
+    specific = stats.get(_insurer_key(insurer)) or overall
+
+    answer_rate = _rate(overall.get("answered", 0), overall.get("attempts", 0), ANSWER_PRIOR)
+    accept_rate = _rate(specific.get("accepted", 0), specific.get("answered", 0), ACCEPT_PRIOR)
+    book_rate = _rate(specific.get("booked", 0), specific.get("accepted", 0), BOOK_PRIOR)
+
+    avg_duration = (
+        (overall.get("duration_sum", 0) + DEFAULT_CALL_SECONDS * DURATION_PRIOR_CALLS)
+        / (overall.get("duration_count", 0) + DURATION_PRIOR_CALLS)
+    )
+
+    return avg_duration / (answer_rate * accept_rate * book_rate)
+
+
+def rank_providers(doctors, insurer):
+    """
+    Order search results by expected time-to-booking (fastest first).
+    Ties, including never-called clinics, keep their search order.
+    """
+    try:
+        stats = provider_stats(doctors, insurer)
+    except sqlite3.Error as e:
+        print(f"Provider index unavailable, keeping search order: {e}")
+        return doctors
+
+    ranked = []
+    for position, doctor in enumerate(doctors):
+        seconds = expected_seconds_to_booking(stats.get(provider_key(doctor), {}), insurer)
+        doctor["expected_minutes_to_booking"] = round(seconds / 60, 1)
+        ranked.append((seconds, position, doctor))
+
+    ranked.sort(key=lambda item: (item[0], item[1]))
+    return [doctor for _, _, doctor in ranked]
@@ -0,0 +1,137 @@
+"""
+Free-text query parsing for /parse-query.
+
+Common queries ("I need an otolaryngologist in Seattle, WA next week") are
+parsed with deterministic rules: a specialty vocabulary, "in City, ST"
+location patterns and date phrases. Only queries the rules cannot resolve
+(no specialty or no location) fall back to the LLM. Results are cached by
+normalized query text, shared across workers.
+"""
+import os
+import re
+
+from cache import TTLCache, TieredCache, shared_store
+from normalization import US_STATES, find_specialty, find_insurer, lookup_city, normalize_location
+
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "86400"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+
+query_cache = TieredCache("query", TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL), shared_store())
+
+_state_alternatives = "|".join(
+    sorted([re.escape(name.lower()) for name in US_STATES.values()] + [abbrev.lower() for abbrev in US_STATES],
+           key=len, reverse=True)
+)
+_prepositions = r"\b(?:in|near|around|at|for)\s+"
+_location_re = re.compile(
+    _prepositions + r"((?:(?!" + _prepositions + r")[a-z .'-])+?)\s*,?\s+(" + _state_alternatives + r")\b"
+)
+_preposition_re = re.compile(_prepositions)
+_zip_re = re.compile(r"\b(\d{5})(?:-\d{4})?\b")
+
+_weekdays = "monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+_months = ("jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+           "sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+_times_of_day = r"(?:\s+(?:morning|afternoon|evening))?"
+_date_patterns = [
+    re.compile(r"\b\d{4}-\d{2}-\d{2}\b"),
+    re.compile(r"\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b"),
+    re.compile(r"\b(?:" + _months + r")\.?\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s+\d{4})?\b"),
+    re.compile(r"\b(?:(?:this|next|on)\s+)?(?:" + _weekdays + r")s?" + _times_of_day + r"\b"),
+    re.compile(r"\b(?:today|tonight|tomorrow|asap|as soon as possible|(?:this|next) (?:week|weekend|month))"
+               + _times_of_day + r"\b"),
+    re.compile(r"\bin\s+(?:a|an|one|two|three|four|\d+)\s+(?:days?|weeks?|months?)\b"),
+]
+
+
+def normalize_query(query):
+    """Cache key for a query: lowercase, punctuation-insensitive, single-spaced"""
+    text = query.lower().replace("’", "'")
+    text = re.sub(r"[^\w\s,/'-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip(" ,")
+
+
+def find_gazetteer_city(text):
+    """City-only locations ("a dermatologist in Boston") resolved through the gazetteer"""
+    for preposition in reversed(list(_preposition_re.finditer(text))):
+        words = text[preposition.end():].split()
+        for size in (3, 2, 1):
+            row = lookup_city(" ".join(words[:size])) if len(words) >= size else None
+            if row:
+                return f"{row['city']}, {row['state']}"
+    return None
+
+
+def find_location(text):
+    # Try every preposition so matches may overlap; the last one wins,
+    # e.g. "a doctor in network in Seattle, WA"
+    matches = [_location_re.match(text, p.start()) for p in _preposition_re.finditer(text)]
+    matches = [m for m in matches if m]
+    if matches:
+        return normalize_location(f"{matches[-1].group(1)}, {matches[-1].group(2)}")
+    zip_match = _zip_re.search(text)
+    if zip_match:
+        return zip_match.group(1)
+    return find_gazetteer_city(text)
+
+
+def find_date(text):
+    for pattern in _date_patterns:
+        match = pattern.search(text)
+        if match:
+            return match.group(0)
+    return None
+
+
+def parse_query_rules(query):
+    """
+    Parse a query with the rule-based fast path
+
+    Returns:
+        tuple: (structured query dict, ambiguous flag). The query is ambiguous
+        when the specialty or location could not be resolved.
+    """
+    text = normalize_query(query)
+    doctor_type = find_specialty(text)
+    location = find_location(text)
+    parsed = {
+        "original_query": query,
+        "doctor_type": doctor_type or "N/A",
+        "location": location or "N/A",
+        "date": find_date(text) or "N/A",
+        "insurance_provider": find_insurer(text) or "N/A",
+    }
+    return parsed, not (doctor_type and location)
+
+
+def parse_query(query, llm_fallback=None):
+    """
+    Parse a free-text query, using the cache, then rules, then the LLM
+
+    Args:
+        query (str): Free-text patient query
+        llm_fallback (callable): Takes the query, returns a structured dict or {}
+
+    Returns:
+        dict: Structured query plus "parse_source" (cache, rules or llm)
+    """
+    key = normalize_query(query)
+    cached = query_cache.get(key)
+    if cached is not None:
+        return dict(cached, original_query=query, parse_source="cache")
+
+    parsed, ambiguous = parse_query_rules(query)
+    source = "rules"
+
+    if ambiguous and llm_fallback:
+        llm_parsed = llm_fallback(query)
+        if not llm_parsed:
+            # Don't cache a degraded answer; the next attempt may reach the LLM
+            return dict(parsed, parse_source="rules")
+        for field in ["doctor_type", "location", "date", "insurance_provider"]:
+            if parsed[field] == "N/A" and llm_parsed.get(field):
+                parsed[field] = llm_parsed[field]
+        source = "llm"
+
+    query_cache.set(key, parsed)
+    return dict(parsed, parse_source=source)
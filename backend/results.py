@@ -0,0 +1,140 @@
+"""
+Server-side provider result sets with cursor pagination.
+
+upload-insurance resolves the full provider list (all search pages, distance
+and time-to-booking ranked) once and stores it under a result id; clients
+page through it with GET /results/{result_id} instead of re-running card
+extraction and the search. Pages can be filtered (distance, rating,
+dialable numbers, text) and re-sorted server-side.
+
+Result sets are immutable snapshots, so a cursor is just an offset into the
+filtered and sorted view it was issued for; it carries a fingerprint of
+that view and is rejected if used with different filters or sorting.
+"""
+import base64
+import hashlib
+import json
+import os
+import time
+import uuid
+
+RESULT_TTL = int(os.getenv("RESULT_TTL", "21600"))
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "5"))
+RESULT_MAX_PAGE_SIZE = int(os.getenv("RESULT_MAX_PAGE_SIZE", "50"))
+
+# sort name -> (key, reverse); missing values always sort last
+SORTS = {
+    "rank": None,
+    "distance": ("distance_miles", False),
+    "rating": ("rating", True),
+    "reviews": ("reviews", True),
+    "time_to_booking": ("expected_minutes_to_booking", False),
+    "name": ("title", False),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def store_results(cache, doctors, query):
+    """Store a resolved provider list; returns its result id"""
+    result_id = uuid.uuid4().hex
+    cache.set(result_id, {
+        "result_id": result_id,
+        "created_at": time.time(),
+        "query": query,
+        "doctors": doctors,
+    }, ttl=RESULT_TTL)
+    return result_id
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_view(doctors, sort="rank", max_distance_miles=None, min_rating=None, dialable=None, q=None):
+    """Filtered and sorted copy of a stored provider list"""
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of {', '.join(SORTS)}")
+    text = (q or "").strip().lower()
+
+    view = []
+    for doctor in doctors:
+        if max_distance_miles is not None:
+            distance = _number(doctor.get("distance_miles"))
+            if distance is None or distance > max_distance_miles:
+                continue
+        if min_rating is not None:
+            rating = _number(doctor.get("rating"))
+            if rating is None or rating < min_rating:
+                continue
+        if dialable is not None and bool(doctor.get("dialable")) != dialable:
+            continue
+        if text and not any(text in str(doctor.get(field) or "").lower() for field in ("title", "address", "type")):
+            continue
+        view.append(doctor)
+
+    if SORTS[sort]:
+        field, reverse = SORTS[sort]
+        if field == "title":
+            value = lambda d: str(d.get(field) or "").lower() or None
+        else:
+            value = lambda d: _number(d.get(field))
+        present = [d for d in view if value(d) is not None]
+        present.sort(key=value, reverse=reverse)
+        view = present + [d for d in view if value(d) is None]
+    return view
+
+
+def _fingerprint(view_args):
+    return hashlib.sha256(json.dumps(view_args, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def encode_cursor(offset, view_args):
+    raw = json.dumps({"offset": offset, "view": _fingerprint(view_args)}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, view_args):
+    """Offset a cursor points at; raises InvalidCursor if it's malformed or for another view"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(data["offset"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if offset < 0 or data.get("view") != _fingerprint(view_args):
+        raise InvalidCursor("Cursor was issued for different filters or sorting")
+    return offset
+
+
+def page_results(entry, cursor=None, limit=RESULT_PAGE_SIZE, sort="rank", max_distance_miles=None,
+                 min_rating=None, dialable=None, q=None):
+    """
+    One page of a stored result set
+
+    Args:
+        entry (dict): Stored result set (see store_results)
+        cursor (str): next_cursor from the previous page, or None for the first page
+        limit (int): Page size, capped at RESULT_MAX_PAGE_SIZE
+        sort, max_distance_miles, min_rating, dialable, q: View options (see apply_view)
+
+    Returns:
+        dict: {"result_id", "doctors", "total", "next_cursor", "query"}
+    """
+    limit = max(1, min(limit, RESULT_MAX_PAGE_SIZE))
+    view_args = {"sort": sort, "max_distance_miles": max_distance_miles, "min_rating": min_rating,
+                 "dialable": dialable, "q": (q or "").strip().lower() or None}
+    offset = decode_cursor(cursor, view_args) if cursor else 0
+    view = apply_view(entry["doctors"], **view_args)
+    end = offset + limit
+    return {
+        "result_id": entry["result_id"],
+        "doctors": view[offset:end],
+        "total": len(view),
+        "next_cursor": encode_cursor(end, view_args) if end < len(view) else None,
+        "query": entry.get("query"),
+    }
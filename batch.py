@@ -0,0 +1,269 @@
+"""
+Batch mode for the main.py CLI: find doctors (and optionally call them)
+for a whole intake file.
+
+The intake file is CSV or JSONL with one patient per row:
+
+    id, patient_name, card_image, specialty, location, preferred_dates
+
+(id defaults to the row number; card_image is relative to the intake file).
+Each record runs through
+
+    extract (insurance card) -> search (doctors) -> dispatch (optional calls)
+
+as a pipeline. Every stage has its own workers and a bounded queue in
+front of it, so Llama extractions, SerpAPI searches and call dispatches
+overlap while memory stays flat however large the file is. Identical
+searches (same insurer, location and specialty) run once while they're
+among the last BATCH_SEARCH_MEMO distinct ones.
+
+Progress goes to an append-only checkpoint file, one JSON line per stage
+a record finishes. Running again with the same checkpoint skips finished
+records and resumes the others (including failed ones) after their last
+finished stage, so an overnight run survives a crash or a Ctrl-C; a
+search-only run can later be resumed with dispatch turned on. A record
+only counts as dispatched once a call was actually placed. Results go
+to the output JSONL.
+"""
+import asyncio
+import csv
+import json
+import os
+import time
+from collections import OrderedDict
+
+BATCH_EXTRACT_WORKERS = int(os.getenv("BATCH_EXTRACT_WORKERS", "4"))
+BATCH_SEARCH_WORKERS = int(os.getenv("BATCH_SEARCH_WORKERS", "4"))
+BATCH_DISPATCH_WORKERS = int(os.getenv("BATCH_DISPATCH_WORKERS", "2"))
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "32"))
+BATCH_SEARCH_MEMO = int(os.getenv("BATCH_SEARCH_MEMO", "256"))
+BATCH_RETRIES = int(os.getenv("BATCH_RETRIES", "2"))
+BATCH_PROGRESS_EVERY = int(os.getenv("BATCH_PROGRESS_EVERY", "25"))
+
+
+def read_records(path):
+    """Yield (key, record) for each patient in a CSV or JSONL intake file"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".json")):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for index, row in enumerate(rows):
+            record = {key.strip(): value.strip() if isinstance(value, str) else value
+                      for key, value in row.items() if key}
+            image = record.get("card_image")
+            if image and not os.path.isabs(image):
+                record["card_image"] = os.path.join(base, image)
+            yield str(record.get("id") or index), record
+
+
+class Checkpoint:
+    """Last finished stage (and its data) per record, persisted as JSON lines"""
+
+    def __init__(self, path):
+        self.path = path
+        self.progress = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line from a crash mid-write
+                        continue
+                    self.progress[entry["key"]] = entry
+        self._file = open(path, "a")
+
+    def save(self, key, stage, data):
+        entry = {"key": key, "stage": stage, "data": data, "at": time.time()}
+        self.progress[key] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+async def with_retries(fn, *args):
+    """Run a stage function (blocking ones in a thread), retrying with backoff"""
+    for attempt in range(BATCH_RETRIES + 1):
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                return await fn(*args)
+            return await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            if attempt == BATCH_RETRIES:
+                raise
+            print(f"{fn.__name__} failed ({e}), retrying...")
+            await asyncio.sleep(2 ** attempt)
+
+
+async def run_batch(input_path, extract, search, dispatch=None, checkpoint_path=None,
+                    output_path=None, calls_per_patient=1):
+    """
+    Process every record in the intake file
+
+    Args:
+        input_path (str): CSV or JSONL intake file
+        extract (callable): card image path -> insurance details (get_insurance_card_data)
+        search (callable): (insurer, location, specialty) -> doctors (search_doctors)
+        dispatch (callable): Async (doctor, patient_info, insurance_info) -> call result
+            (make_appointment_call); None to search only
+        calls_per_patient (int): Doctors to call per patient when dispatching
+
+    Returns:
+        dict: Counts per final status, records skipped as already done, and throughput
+    """
+    stem = os.path.splitext(input_path)[0]
+    checkpoint = Checkpoint(checkpoint_path or f"{stem}.checkpoint.jsonl")
+    output = open(output_path or f"{stem}.results.jsonl", "a")
+    extract_queue = asyncio.Queue(BATCH_QUEUE_SIZE)
+    search_queue = asyncio.Queue(BATCH_QUEUE_SIZE)
+    dispatch_queue = asyncio.Queue(BATCH_QUEUE_SIZE)
+    searches = OrderedDict()
+    stats = {"records": 0, "skipped": 0}
+    distinct_searches = 0
+    started = time.perf_counter()
+
+    def finish(job, status, error=None):
+        data = job["data"]
+        result = {
+            "key": job["key"],
+            "status": status,
+            "patient_name": job["record"].get("patient_name"),
+            "insurance": data.get("insurance"),
+            "doctors": data.get("doctors"),
+            "calls": data.get("calls"),
+        }
+        if error:
+            result["error"] = error
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        stats[status] = stats.get(status, 0) + 1
+        finished = sum(count for name, count in stats.items() if name not in ("records", "skipped"))
+        if finished % BATCH_PROGRESS_EVERY == 0:
+            rate = finished / (time.perf_counter() - started)
+            print(f"Batch progress: {finished} records finished ({rate:.2f}/s), "
+                  f"queued extract/search/dispatch: {extract_queue.qsize()}/{search_queue.qsize()}/{dispatch_queue.qsize()}")
+
+    async def find_doctors(insurer, location, specialty):
+        """One search per distinct (insurer, location, specialty) in the batch"""
+        nonlocal distinct_searches
+        query = tuple((value or "").strip().lower() for value in (insurer, location, specialty))
+        future = searches.get(query)
+        if future is None:
+            future = searches[query] = asyncio.ensure_future(with_retries(search, insurer, location, specialty))
+            distinct_searches += 1
+            # Forget the least recently used finished searches; in-flight ones stay shared
+            while len(searches) > BATCH_SEARCH_MEMO:
+                oldest = next((key for key, pending in searches.items() if pending.done()), None)
+                if oldest is None:
+                    break
+                del searches[oldest]
+        else:
+            searches.move_to_end(query)
+        try:
+            return [dict(doctor) for doctor in await future]
+        except Exception:
+            if searches.get(query) is future:
+                del searches[query]
+            raise
+
+    async def extract_stage(job):
+        image = job["record"].get("card_image")
+        if not image or not os.path.exists(image):
+            return finish(job, "failed", f"card image not found: {image}")
+        insurance = await with_retries(extract, image)
+        if not insurance or not insurance.get("insurance_company"):
+            return finish(job, "failed", "could not read the insurance card")
+        job["data"] = {"insurance": insurance}
+        checkpoint.save(job["key"], "extracted", job["data"])
+        await search_queue.put(job)
+
+    async def search_stage(job):
+        record, insurance = job["record"], job["data"]["insurance"]
+        doctors = await find_doctors(insurance.get("insurance_company"), record.get("location"), record.get("specialty"))
+        job["data"]["doctors"] = doctors
+        checkpoint.save(job["key"], "searched", job["data"])
+        if not doctors:
+            return finish(job, "no_doctors")
+        if dispatch is None:
+            return finish(job, "searched")
+        await dispatch_queue.put(job)
+
+    async def dispatch_stage(job):
+        record, data = job["record"], job["data"]
+        insurance = data["insurance"]
+        patient_info = {
+            "name": record.get("patient_name") or insurance.get("dependent_name") or insurance.get("insured_name"),
+            "appointment_type": f"{record.get('specialty')} consultation",
+            "preferred_times": record.get("preferred_dates") or "Flexible with scheduling",
+        }
+        insurance_info = {
+            "insurance_company": insurance.get("insurance_company"),
+            "member_id": insurance.get("member_id"),
+            "plan_type": insurance.get("plan_type") or "General",
+        }
+        callable_doctors = [d for d in data["doctors"] if d.get("phone") not in (None, "", "N/A")]
+        if not callable_doctors:
+            return finish(job, "no_doctors")
+        data["calls"] = []
+        for doctor in callable_doctors[:calls_per_patient]:
+            result = await dispatch(doctor, patient_info, insurance_info)
+            data["calls"].append({"doctor": doctor.get("title"), "result": result})
+        if not any(call["result"] and call["result"].get("call_id") for call in data["calls"]):
+            # Nothing was dialed; not checkpointed, so a resumed run tries again
+            reasons = sorted({(call["result"] or {}).get("status") or "no result" for call in data["calls"]})
+            return finish(job, "failed", f"no call placed: {', '.join(reasons)}")
+        checkpoint.save(job["key"], "dispatched", data)
+        finish(job, "dispatched")
+
+    async def worker(queue, stage):
+        while True:
+            job = await queue.get()
+            try:
+                await stage(job)
+            except Exception as e:
+                # Not checkpointed as done, so a resumed run retries it
+                print(f"Record {job['key']} failed in {stage.__name__}: {e}")
+                finish(job, "failed", f"{stage.__name__}: {e}")
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker(extract_queue, extract_stage)) for _ in range(BATCH_EXTRACT_WORKERS)]
+    workers += [asyncio.create_task(worker(search_queue, search_stage)) for _ in range(BATCH_SEARCH_WORKERS)]
+    if dispatch is not None:
+        workers += [asyncio.create_task(worker(dispatch_queue, dispatch_stage)) for _ in range(BATCH_DISPATCH_WORKERS)]
+
+    try:
+        for key, record in read_records(input_path):
+            stats["records"] += 1
+            progress = checkpoint.progress.get(key, {})
+            stage = progress.get("stage")
+            job = {"key": key, "record": record, "data": dict(progress.get("data") or {})}
+            if stage == "dispatched" or (stage == "searched" and dispatch is None):
+                stats["skipped"] += 1
+            elif stage == "searched":
+                await dispatch_queue.put(job)
+            elif stage == "extracted":
+                await search_queue.put(job)
+            else:
+                await extract_queue.put(job)
+        # Jobs only move forward, so each stage drains before the next
+        await extract_queue.join()
+        await search_queue.join()
+        await dispatch_queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        checkpoint.close()
+        output.close()
+
+    elapsed = time.perf_counter() - started
+    processed = stats["records"] - stats["skipped"]
+    stats["elapsed_seconds"] = round(elapsed, 1)
+    stats["records_per_second"] = round(processed / elapsed, 2) if elapsed else 0.0
+    stats["distinct_searches"] = distinct_searches
+    return stats
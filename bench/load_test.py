@@ -0,0 +1,282 @@
+"""
+Load and latency benchmark for the MediCall backend.
+
+Starts the local upstream stand-ins (bench/standins.py), boots the backend
+with uvicorn pointed at them, and drives the API at a fixed concurrency.
+
+Examples:
+  python bench/load_test.py --scenario upload --concurrency 8 --requests 200
+  python bench/load_test.py --scenario all --save-baseline bench/baseline.json
+  python bench/load_test.py --scenario all --compare bench/baseline.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from standins import start_standins, backend_env
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+
+# A minimal valid JPEG header is enough; the Llama stand-in ignores the image
+FAKE_IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 4096 + b"\xff\xd9"
+
+DOCTOR = {"title": "Clinic 1", "phone": "(206) 555-2100", "address": "1 Main St", "website": "N/A"}
+PATIENT = {"name": "Jane Doe", "appointment_type": "pediatrician consultation", "preferred_times": "Next week"}
+INSURANCE = {"insurance_company": "Premera Blue Cross", "member_id": "XYZ123456789", "plan_type": "PPO"}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def read_rss_kb(pid):
+    """Resident set size of a process in KB (Linux /proc)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+class RssSampler:
+    """Samples RSS of the backend process tree in the background"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            pids = [self.pid] + child_pids(self.pid)
+            self.samples.append(sum(read_rss_kb(p) for p in pids))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_backend(env, port, workers):
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+           "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    process = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited early: {process.stderr.read().decode()[-2000:]}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                return process
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("Backend did not become healthy within 60s")
+
+
+def upload_request(base_url):
+    query = {
+        "original_query": "I need a pediatrician in Boston, MA",
+        "doctor_type": "pediatrician",
+        "location": "Boston, MA",
+        "date": "next week",
+        "insurance_provider": "N/A",
+    }
+    return requests.post(
+        f"{base_url}/upload-insurance",
+        files={"file": ("card.jpeg", FAKE_IMAGE, "image/jpeg")},
+        data={"query_data": json.dumps(query), "make_call": "false"},
+        timeout=120,
+    )
+
+
+def call_request(base_url):
+    return requests.post(
+        f"{base_url}/make-appointment-call",
+        json={"doctor_info": DOCTOR, "patient_info": PATIENT, "insurance_info": INSURANCE},
+        timeout=120,
+    )
+
+
+def batch_request(base_url, batch_size=3):
+    doctors = [dict(DOCTOR, title=f"Clinic {i}") for i in range(batch_size)]
+    return requests.post(
+        f"{base_url}/batch-call-doctors",
+        json={"doctors_list": doctors, "patient_info": PATIENT, "insurance_info": INSURANCE},
+        timeout=600,
+    )
+
+
+SCENARIOS = {
+    "upload": upload_request,
+    "call": call_request,
+    "batch": batch_request,
+}
+
+
+def run_scenario(name, base_url, concurrency, total, backend_pid):
+    send = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = send(base_url).ok
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    print(f"▶️  {name}: {total} requests at concurrency {concurrency}")
+    with RssSampler(backend_pid) as rss:
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(total)))
+        wall = time.perf_counter() - wall_start
+
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(total / wall, 3) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "rss_peak_mb": round(max(rss.samples or [0]) / 1024, 1),
+        "rss_mean_mb": round(sum(rss.samples) / len(rss.samples) / 1024, 1) if rss.samples else 0.0,
+    }
+    print(f"   {json.dumps(result)}")
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions against a saved baseline"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput_rps']} < {previous['throughput_rps']}")
+        for key in ["p50_ms", "p95_ms", "p99_ms", "rss_peak_mb"]:
+            if current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {current[key]} > {previous[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MediCall backend load benchmark")
+    parser.add_argument("--scenario", choices=list(SCENARIOS) + ["all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--serp-latency", default="lognormal:5.3,0.4")
+    parser.add_argument("--llama-latency", default="normal:1500,300")
+    parser.add_argument("--livekit-latency", default="normal:80,20")
+    parser.add_argument("--serp-error-rate", type=float, default=0.0)
+    parser.add_argument("--llama-error-rate", type=float, default=0.0)
+    parser.add_argument("--livekit-error-rate", type=float, default=0.0)
+    parser.add_argument("--save-baseline", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare results against this baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    standins = start_standins(
+        serp_latency=args.serp_latency,
+        llama_latency=args.llama_latency,
+        livekit_latency=args.livekit_latency,
+        serp_error_rate=args.serp_error_rate,
+        llama_error_rate=args.llama_error_rate,
+        livekit_error_rate=args.livekit_error_rate,
+    )
+
+    env = dict(os.environ)
+    env.update(backend_env(standins))
+    port = free_port()
+    backend = start_backend(env, port, args.workers)
+    base_url = f"http://127.0.0.1:{port}"
+
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = {}
+    try:
+        for name in scenarios:
+            results[name] = run_scenario(name, base_url, args.concurrency, args.requests, backend.pid)
+    finally:
+        backend.terminate()
+        backend.wait(timeout=10)
+        for standin in standins.values():
+            standin.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": vars(args),
+        "upstreams": {name: s.stats for name, s in standins.items()},
+        "results": results,
+    }
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for line in regressions:
+                print(f"   - {line}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Cardinality report for search-key normalization.
+
+Counts how many distinct SerpAPI queries a set of (doctor_type, location,
+insurance_provider) requests produce with raw strings versus canonical
+search keys. Input is JSONL with those three fields per line.
+
+  python bench/normalization_report.py --input bench/sample_queries.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from normalization import canonical_search_key
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_queries.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search key cardinality report")
+    parser.add_argument("--input", default=DEFAULT_INPUT)
+    parser.add_argument("--show-groups", action="store_true", help="Print the raw variants behind each key")
+    args = parser.parse_args()
+
+    with open(args.input) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    raw_keys = set()
+    groups = defaultdict(set)
+    for row in rows:
+        raw = (row.get("doctor_type", ""), row.get("location", ""), row.get("insurance_provider", ""))
+        raw_keys.add(raw)
+        groups[canonical_search_key(*raw)].add(raw)
+
+    reduction = 1 - len(groups) / len(raw_keys) if raw_keys else 0.0
+    print(f"Queries:              {len(rows)}")
+    print(f"Distinct raw keys:    {len(raw_keys)}")
+    print(f"Distinct canonical:   {len(groups)}")
+    print(f"Cardinality reduction: {reduction:.1%}")
+    # Every query after the first for a key can be served from cache
+    print(f"Best-case hit rate:   {1 - len(groups) / len(rows):.1%}" if rows else "")
+
+    if args.show_groups:
+        for key, variants in sorted(groups.items(), key=lambda item: -len(item[1])):
+            print(f"\n{key}  ({len(variants)} variants)")
+            for variant in sorted(variants):
+                print(f"   {variant}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Scripted receptionist simulator for end-to-end conversation benchmarks.
+
+Plays receptionist turns against the Assistant agent from agent.py (with
+the real call script from callout.generate_call_script and the real
+report_outcome tool) using AgentSession.run in text mode, and models the
+voice legs around it:
+
+  - receptionist: "scripted" plays the lines of each scenario in
+    bench/receptionist_scenarios.jsonl; "llm" has an OpenAI-compatible
+    model role-play the scenario's persona
+  - agent LLM: "mock" is a local OpenAI-compatible stand-in with a
+    rule-based receptionist-call policy and a latency distribution;
+    "env" uses the real LLAMA_MODEL / LLAMA_OPENAI_BASE_URL / LLAMA_OPENAI_API_KEY
+  - STT and TTS are latency models (final-transcript and time-to-first-byte
+    distributions) plus speaking rates for how long each side talks
+
+Reports turns per booking, total call duration and per-turn response latency
+(end of receptionist speech to first agent audio) across the corpus.
+
+  python bench/receptionist_sim.py
+  python bench/receptionist_sim.py --agent-llm env --runs 3 --save bench/conversation_report.json
+  python bench/receptionist_sim.py --receptionist llm --category member_id_spelling
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from standins import StandIn, parse_latency
+from load_test import percentile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "receptionist_scenarios.jsonl")
+
+PATIENT = {
+    "name": "Jane Doe",
+    "date_of_birth": "April 12, 1990",
+    "phone": "(206) 555-0142",
+    "appointment_type": "new patient consultation",
+    "preferred_times": "Weekdays, flexible",
+}
+INSURANCE = {
+    "insurance_company": "Premera Blue Cross",
+    "member_id": "XYZ123456789",
+    "group_number": "1000234",
+    "plan_type": "PPO",
+}
+
+_slot_re = re.compile(
+    r"((?:next\s+)?(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday))\s+at\s+(\d{1,2}(?::\d{2})?\s*[ap]\.?m)",
+    re.I,
+)
+_confirmation_re = re.compile(r"confirmation(?:\s+number)?(?:\s+is)?\s+([A-Z]{2}\d{3,})")
+
+DECLINE_PHRASES = ["don't take", "do not take", "not accepting", "no availability", "fully booked", "waiting list", "can't book"]
+BOOKED_PHRASES = ["you're all set", "confirmed", "booked", "done,"]
+VOICEMAIL_PHRASES = ["voicemail", "after the tone", "leave your name"]
+
+
+def _text(content):
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _fact(prompt, key):
+    match = re.search(rf"'{key}': '([^']*)'", prompt)
+    return match.group(1) if match else ""
+
+
+def spell(value):
+    return ", ".join(value)
+
+
+class MockAgentLLM(StandIn):
+    """
+    OpenAI-compatible chat completions stand-in that plays the agent's side of
+    a booking call with simple rules, streamed back as SSE chunks
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__("agent-llm", **kwargs)
+
+    def route(self, method, path, query, body):
+        if not path.endswith("/chat/completions"):
+            return 404, "application/json", b"{}"
+        request = json.loads(body or b"{}")
+        kind, value = self.reply(request.get("messages", []))
+
+        if kind == "tool":
+            delta = {"role": "assistant", "tool_calls": [{
+                "index": 0,
+                "id": f"call_{random.randint(0, 1_000_000)}",
+                "type": "function",
+                "function": {"name": "report_outcome", "arguments": json.dumps(value)},
+            }]}
+            finish = "tool_calls"
+        else:
+            delta = {"role": "assistant", "content": value}
+            finish = "stop"
+
+        chunks = [
+            {"choices": [{"index": 0, "delta": delta, "finish_reason": None}]},
+            {"choices": [{"index": 0, "delta": {}, "finish_reason": finish}]},
+            {"choices": [], "usage": {"prompt_tokens": 900, "completion_tokens": 30, "total_tokens": 930}},
+        ]
+        payload = "".join(
+            "data: " + json.dumps({"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                                   "model": "mock", **chunk}) + "\n\n"
+            for chunk in chunks
+        ) + "data: [DONE]\n\n"
+        return 200, "text/event-stream", payload.encode()
+
+    def reply(self, messages):
+        """Next agent move: ("text", reply) or ("tool", report_outcome arguments)"""
+        prompt = " ".join(_text(m.get("content")) for m in messages if m.get("role") in ("system", "developer"))
+        said = [_text(m.get("content")) for m in messages if m.get("role") == "user"]
+        reported = any(m.get("tool_calls") for m in messages if m.get("role") == "assistant")
+        last = messages[-1] if messages else {}
+        name = _fact(prompt, "name") or "the patient"
+        member_id = _fact(prompt, "member_id")
+
+        if last.get("role") == "tool":
+            return "text", "Thank you so much for your help. Have a great day, goodbye."
+
+        line = said[-1] if said else ""
+        lowered = line.lower()
+
+        if not reported:
+            if any(p in lowered for p in VOICEMAIL_PHRASES):
+                return "tool", {"outcome": "voicemail"}
+            if any(p in lowered for p in DECLINE_PHRASES):
+                return "tool", {"outcome": "declined", "reason": line}
+            if any(p in lowered for p in BOOKED_PHRASES):
+                slots = [m for text in said for m in _slot_re.findall(text)]
+                date, at = slots[-1] if slots else ("", "")
+                confirmation = _confirmation_re.search(line)
+                return "tool", {
+                    "outcome": "booked",
+                    "appointment_date": date,
+                    "appointment_time": at,
+                    "confirmation_number": confirmation.group(1) if confirmation else "",
+                }
+        elif any(p in lowered for p in ["bye", "take care", "good day"]):
+            return "text", "Thank you, goodbye."
+
+        if "spell" in lowered:
+            return "text", f"Of course. The member ID is {spell(member_id)}."
+        if "read that back" in lowered or "is that right" in lowered:
+            return "text", f"Almost, the last digit is a nine. It's {spell(member_id)}."
+        slot = _slot_re.search(line)
+        if slot:
+            return "text", f"Yes, {slot.group(1)} at {slot.group(2)} works well. Please book it for {name}."
+        if "new to our practice" in lowered or "new patient" in lowered:
+            return "text", f"Yes, {name} would be a new patient."
+
+        answers = []
+        if "name" in lowered:
+            answers.append(f"The patient's name is {name}.")
+        if "date of birth" in lowered:
+            answers.append(f"Her date of birth is {_fact(prompt, 'date_of_birth')}.")
+        if "member id" in lowered:
+            answers.append(f"The member ID is {member_id}.")
+        if "group number" in lowered:
+            answers.append(f"The group number is {_fact(prompt, 'group_number')}.")
+        if "ppo" in lowered or "hmo" in lowered:
+            answers.append(f"It's a {_fact(prompt, 'plan_type')} plan.")
+        elif "insurance" in lowered or "carrier" in lowered:
+            answers.append(f"She has {_fact(prompt, 'insurance_company')}.")
+        if "callback number" in lowered or "phone" in lowered:
+            answers.append(f"The best callback number is {_fact(prompt, 'phone')}.")
+        if answers:
+            return "text", " ".join(answers)
+
+        if "hold" in lowered or "transfer" in lowered or "one moment" in lowered:
+            return "text", "Sure, I'll hold."
+        return "text", f"Hi, my name is Alex. I'm calling to schedule a new patient appointment for {name}."
+
+
+class RecordingReporter:
+    """Stands in for call_outcomes.OutcomeReporter and keeps the reported outcome"""
+
+    def __init__(self):
+        self.final = None
+        self.details = {}
+
+    async def report(self, event, **details):
+        if self.final:
+            return False
+        self.final = event
+        self.details = {key: value for key, value in details.items() if value}
+        return True
+
+
+class ScriptedReceptionist:
+    def __init__(self, scenario):
+        self.lines = list(scenario["lines"])
+
+    async def next_turn(self, agent_reply):
+        return self.lines.pop(0) if self.lines else None
+
+
+class LLMReceptionist:
+    """Role-plays the scenario persona with an OpenAI-compatible model"""
+
+    def __init__(self, scenario, max_turns=12):
+        from openai import AsyncOpenAI
+
+        self.client = AsyncOpenAI(
+            base_url=os.getenv("RECEPTIONIST_LLM_BASE_URL", os.getenv("LLAMA_OPENAI_BASE_URL")),
+            api_key=os.getenv("RECEPTIONIST_LLM_API_KEY", os.getenv("LLAMA_OPENAI_API_KEY")),
+        )
+        self.model = os.getenv("RECEPTIONIST_LLM_MODEL", os.getenv("LLAMA_MODEL"))
+        self.max_turns = max_turns
+        self.messages = [{
+            "role": "system",
+            "content": (
+                f"You are the receptionist answering the phone at {scenario['clinic']}. {scenario['persona']} "
+                "Reply with one or two short spoken sentences. When the call is over, reply exactly [HANGUP]."
+            ),
+        }]
+
+    async def next_turn(self, agent_reply):
+        if len(self.messages) > 2 * self.max_turns:
+            return None
+        self.messages.append({"role": "user", "content": agent_reply or "(the phone rings and you pick up)"})
+        response = await self.client.chat.completions.create(model=self.model, messages=self.messages)
+        line = (response.choices[0].message.content or "").strip()
+        self.messages.append({"role": "assistant", "content": line})
+        if not line or "[HANGUP]" in line:
+            return None
+        return {"say": line}
+
+
+def normalize_spoken(text):
+    return re.sub(r"\s+", " ", re.sub(r"[,.\-]", " ", text.upper())).strip()
+
+
+def speech_seconds(text, words_per_minute):
+    return len(text.split()) / (words_per_minute / 60.0)
+
+
+class Simulator:
+    def __init__(self, args):
+        self.args = args
+        self.stt_latency = parse_latency(args.stt_latency)
+        self.tts_latency = parse_latency(args.tts_latency)
+        self.mock = None
+
+    def agent_llm(self):
+        from livekit.plugins import openai
+
+        if self.mock:
+            return openai.LLM(model="mock", base_url=f"{self.mock.url}/v1", api_key="mock")
+        return openai.LLM(
+            model=os.getenv("LLAMA_MODEL"),
+            base_url=os.getenv("LLAMA_OPENAI_BASE_URL"),
+            api_key=os.getenv("LLAMA_OPENAI_API_KEY"),
+        )
+
+    async def run_scenario(self, scenario):
+        from livekit.agents import AgentSession
+        from agent import Assistant
+        from callout import generate_call_script
+
+        doctor = {"title": scenario["clinic"], "phone": "(206) 555-0100", "address": "1 Main St, Seattle, WA"}
+        reporter = RecordingReporter()
+        receptionist = LLMReceptionist(scenario) if self.args.receptionist == "llm" else ScriptedReceptionist(scenario)
+        turns, missed, duration = [], [], 0.0
+        agent_reply = ""
+
+        async with AgentSession(llm=self.agent_llm()) as session:
+            await session.start(Assistant(script=generate_call_script(doctor, PATIENT, INSURANCE), reporter=reporter))
+
+            for _ in range(self.args.max_turns):
+                turn = await receptionist.next_turn(agent_reply)
+                if turn is None:
+                    break
+
+                started = time.perf_counter()
+                result = await session.run(user_input=turn["say"])
+                llm_s = time.perf_counter() - started
+
+                agent_reply = " ".join(
+                    event.item.text_content or ""
+                    for event in result.events
+                    if event.type == "message" and event.item.role == "assistant"
+                )
+                for expected in turn.get("expect", []):
+                    if normalize_spoken(expected) not in normalize_spoken(agent_reply):
+                        missed.append({"line": turn["say"], "expected": expected, "reply": agent_reply})
+
+                # End of receptionist speech -> first agent audio
+                latency = self.args.endpointing_ms / 1000 + self.stt_latency() + llm_s + self.tts_latency()
+                duration += (
+                    turn.get("hold_s", 0)
+                    + speech_seconds(turn["say"], self.args.receptionist_wpm)
+                    + latency
+                    + speech_seconds(agent_reply, self.args.agent_wpm)
+                )
+                turns.append({"latency_s": latency, "llm_s": llm_s})
+
+        return {
+            "id": scenario["id"],
+            "category": scenario["category"],
+            "expected_outcome": scenario.get("expected_outcome"),
+            "outcome": reporter.final,
+            "details": reporter.details,
+            "turns": len(turns),
+            "call_duration_s": round(duration, 1),
+            "turn_latency_s": [round(t["latency_s"], 3) for t in turns],
+            "missed_expectations": missed,
+        }
+
+    async def run(self, scenarios):
+        if self.args.agent_llm == "mock":
+            self.mock = MockAgentLLM(latency=self.args.llm_latency).start()
+        try:
+            results = []
+            for run in range(self.args.runs):
+                for scenario in scenarios:
+                    result = await self.run_scenario(scenario)
+                    result["run"] = run
+                    results.append(result)
+                    print(f"{result['id']:<28} {str(result['outcome']):<10} turns={result['turns']:<3} "
+                          f"duration={result['call_duration_s']:>6.1f}s missed={len(result['missed_expectations'])}")
+            return results
+        finally:
+            if self.mock:
+                self.mock.stop()
+
+
+def summarize(results):
+    """Turns per booking, call duration and per-turn latency, overall and per category"""
+    def block(rows):
+        booked = [r for r in rows if r["outcome"] == "booked"]
+        latencies = [lat for r in rows for lat in r["turn_latency_s"]]
+        durations = [r["call_duration_s"] for r in rows]
+        return {
+            "calls": len(rows),
+            "bookings": len(booked),
+            "outcome_accuracy": round(sum(1 for r in rows if r["outcome"] == r["expected_outcome"]) / len(rows), 3) if rows else 0.0,
+            "turns_per_booking": round(sum(r["turns"] for r in rows) / len(booked), 1) if booked else None,
+            "call_duration_s": {"p50": round(percentile(durations, 50), 1), "p95": round(percentile(durations, 95), 1)},
+            "turn_latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000),
+                "p95": round(percentile(latencies, 95) * 1000),
+                "p99": round(percentile(latencies, 99) * 1000),
+            },
+            "missed_expectations": sum(len(r["missed_expectations"]) for r in rows),
+        }
+
+    categories = sorted({r["category"] for r in results})
+    return {
+        "overall": block(results),
+        "by_category": {c: block([r for r in results if r["category"] == c]) for c in categories},
+    }
+
+
+def load_scenarios(path, category=None):
+    with open(path) as f:
+        scenarios = [json.loads(line) for line in f if line.strip()]
+    return [s for s in scenarios if not category or s["category"] == category]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receptionist conversation benchmark for the calling agent")
+    parser.add_argument("--scenarios", default=SCENARIOS_PATH)
+    parser.add_argument("--category", help="Only run scenarios of this category")
+    parser.add_argument("--runs", type=int, default=1, help="Passes over the scenario corpus")
+    parser.add_argument("--receptionist", choices=["scripted", "llm"], default="scripted")
+    parser.add_argument("--agent-llm", choices=["mock", "env"], default="mock")
+    parser.add_argument("--llm-latency", default="lognormal:6.2,0.3", help="Mock agent LLM time to first token (ms)")
+    parser.add_argument("--stt-latency", default="normal:300,80", help="Final transcript delay after speech ends (ms)")
+    parser.add_argument("--tts-latency", default="normal:250,60", help="TTS time to first audio (ms)")
+    parser.add_argument("--endpointing-ms", type=float, default=500, help="Silence before the turn is considered over")
+    parser.add_argument("--receptionist-wpm", type=float, default=170)
+    parser.add_argument("--agent-wpm", type=float, default=160)
+    parser.add_argument("--max-turns", type=int, default=16)
+    parser.add_argument("--save", help="Write per-call results and the summary to this JSON file")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios, args.category)
+    results = asyncio.run(Simulator(args).run(scenarios))
+    summary = summarize(results)
+    print(json.dumps(summary, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"summary": summary, "calls": results}, f, indent=2)
+        print(f"Report written to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
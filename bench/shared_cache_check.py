@@ -0,0 +1,111 @@
+"""
+Checks that several uvicorn workers make one upstream call per cache key.
+
+Boots the backend with --workers N against the stand-ins, once per shared
+store (SQLite in WAL mode, and Redis played by RedisStandIn), and sends the
+same upload-insurance request from many clients at once. The SerpAPI and
+Llama calls those requests cause must equal the calls of one cold request
+for a different key; without the shared tier they grow with the workers.
+Card extractions are shared for the check (EXTRACTION_CACHE_SHARED).
+
+  python bench/shared_cache_check.py --workers 4 --clients 16
+  python bench/shared_cache_check.py --store redis
+"""
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from standins import RedisStandIn, start_standins, backend_env
+from load_test import FAKE_IMAGE, free_port, start_backend
+
+UPSTREAMS = ("serpapi", "llama")
+
+
+def upload(base_url, location, image):
+    query = {
+        "original_query": f"I need a pediatrician in {location}",
+        "doctor_type": "pediatrician",
+        "location": location,
+        "date": "next week",
+        "insurance_provider": "N/A",
+    }
+    return requests.post(
+        f"{base_url}/upload-insurance",
+        files={"file": ("card.jpeg", image, "image/jpeg")},
+        data={"query_data": json.dumps(query), "make_call": "false"},
+        timeout=120,
+    )
+
+
+def upstream_calls(standins):
+    return {name: standins[name].stats["requests"] for name in UPSTREAMS}
+
+
+def check_store(store, args):
+    """Run the check against one store; returns True if it passed"""
+    standins = start_standins(serp_latency=args.serp_latency, llama_latency=args.llama_latency)
+    redis = RedisStandIn().start() if store == "redis" else None
+    tmpdir = tempfile.mkdtemp(prefix="shared-cache-check-")
+
+    env = dict(os.environ)
+    env.update(backend_env(standins))
+    env["SHARED_CACHE_URL"] = redis.url if redis else f"sqlite:///{tmpdir}/shared_cache.db"
+    env["EXTRACTION_CACHE_SHARED"] = "true"
+    port = free_port()
+    backend = start_backend(env, port, args.workers)
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        with ThreadPoolExecutor(args.clients) as pool:
+            responses = list(pool.map(lambda _: upload(base_url, "Boston, MA", FAKE_IMAGE), range(args.clients)))
+        failed = sorted({r.status_code for r in responses if not r.ok})
+        concurrent = upstream_calls(standins)
+
+        # One cold request for another search key and another card image
+        upload(base_url, "Seattle, WA", FAKE_IMAGE + b"\x00")
+        single = {name: calls - concurrent[name] for name, calls in upstream_calls(standins).items()}
+    finally:
+        backend.terminate()
+        backend.wait(timeout=10)
+        for standin in standins.values():
+            standin.stop()
+        if redis:
+            redis.stop()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    passed = not failed and concurrent == single
+    print(f"{'✅' if passed else '❌'} {store}: {args.clients} identical requests over {args.workers} workers made "
+          f"{concurrent} upstream calls; one cold request makes {single}"
+          + (f" (HTTP errors: {failed})" if failed else ""))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared cache tier check: one upstream call per key across workers")
+    parser.add_argument("--store", choices=["sqlite", "redis", "all"], default="all")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent identical requests")
+    # Slow enough upstreams that every worker sees the key as missing at once
+    parser.add_argument("--serp-latency", default="fixed:300")
+    parser.add_argument("--llama-latency", default="fixed:1000")
+    args = parser.parse_args()
+
+    stores = ["sqlite", "redis"] if args.store == "all" else [args.store]
+    if "redis" in stores and importlib.util.find_spec("redis") is None:
+        print("⚠️  Skipping redis: the backend's Redis client (pip install redis) is not installed")
+        stores.remove("redis")
+
+    results = [check_store(store, args) for store in stores]
+    sys.exit(0 if results and all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
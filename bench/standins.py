@@ -0,0 +1,389 @@
+"""
+Local stand-ins for the upstream services the backend talks to.
+
+Each stand-in is a small threaded HTTP server with a configurable latency
+distribution and error rate:
+
+  - SerpAPI local results   GET  /search
+  - Llama chat completions  POST /v1/chat/completions
+  - LiveKit agent dispatch  POST /twirp/livekit.AgentDispatchService/CreateAgentDispatch
+
+plus RedisStandIn, a small in-memory Redis (RESP over TCP) covering the
+commands the backend's shared cache tier uses (SHARED_CACHE_URL=redis://...).
+
+Latency specs are strings in milliseconds:
+  "fixed:50", "uniform:20,80", "normal:60,15", "lognormal:4.0,0.5"
+
+Run standalone:
+  python bench/standins.py --serp-latency lognormal:5.5,0.4 --llama-latency normal:1800,300
+"""
+import argparse
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def parse_latency(spec):
+    """Turn a latency spec string into a function returning seconds"""
+    if not spec:
+        return lambda: 0.0
+
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+
+    if kind == "fixed":
+        return lambda: values[0] / 1000.0
+    if kind == "uniform":
+        low, high = values
+        return lambda: random.uniform(low, high) / 1000.0
+    if kind == "normal":
+        mean, stddev = values
+        return lambda: max(0.0, random.gauss(mean, stddev)) / 1000.0
+    if kind == "lognormal":
+        mu, sigma = values
+        return lambda: random.lognormvariate(mu, sigma) / 1000.0
+
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def fake_places(query, start, count=20):
+    """Deterministic SerpAPI-like places for a query/page"""
+    rng = random.Random(f"{query}|{start}")
+    places = []
+    for i in range(count):
+        n = start + i
+        places.append({
+            "position": n + 1,
+            "title": f"Clinic {n + 1} ({query[:24]})",
+            "phone": f"({rng.randint(201, 989)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+            "address": f"{rng.randint(1, 9999)} Main St",
+            "hours": "Open ⋅ Closes 5 PM",
+            "operating_hours": {
+                day: "8 AM–5 PM" for day in ["monday", "tuesday", "wednesday", "thursday", "friday"]
+            },
+            "links": {"website": f"https://clinic{n + 1}.example.com"},
+        })
+    return places
+
+
+FAKE_CARD = {
+    "member_id": "XYZ123456789",
+    "group_number": "1000234",
+    "insured_name": "Jane Doe",
+    "dependent_name": None,
+    "insurance_company": "Premera Blue Cross",
+    "plan_type": "PPO",
+    "customer_service_number": "(800) 722-1471",
+    "rx_bin": "610014",
+    "rx_pcn": "PREMERA",
+}
+
+
+class StandIn:
+    """A single stand-in server with its own latency/error behaviour and counters"""
+
+    def __init__(self, name, latency="fixed:0", error_rate=0.0, port=0):
+        self.name = name
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.stats = {"requests": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, error):
+        with self._lock:
+            self.stats["requests"] += 1
+            if error:
+                self.stats["errors"] += 1
+
+    def route(self, method, path, query, body):
+        """Return (status, content_type, payload bytes). Overridden per stand-in."""
+        return 404, "application/json", b"{}"
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+
+                if parsed.path == "/__stats":
+                    self._send(200, "application/json", json.dumps(standin.stats).encode())
+                    return
+
+                time.sleep(standin.latency())
+                failed = random.random() < standin.error_rate
+                standin.count(failed)
+
+                if failed:
+                    self._send(500, "application/json", b'{"error": "injected failure"}')
+                    return
+
+                status, content_type, payload = standin.route(method, parsed.path, parse_qs(parsed.query), body)
+                self._send(status, content_type, payload)
+
+            def _send(self, status, content_type, payload):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        return Handler
+
+
+class SerpStandIn(StandIn):
+    def __init__(self, results_per_page=20, **kwargs):
+        super().__init__("serpapi", **kwargs)
+        self.results_per_page = results_per_page
+
+    def route(self, method, path, query, body):
+        if path != "/search":
+            return 404, "application/json", b"{}"
+        q = query.get("q", [""])[0]
+        start = int(query.get("start", ["0"])[0])
+        payload = {"local_results": fake_places(q, start, self.results_per_page)}
+        return 200, "application/json", json.dumps(payload).encode()
+
+
+class LlamaStandIn(StandIn):
+    def __init__(self, **kwargs):
+        super().__init__("llama", **kwargs)
+
+    def route(self, method, path, query, body):
+        if path != "/v1/chat/completions":
+            return 404, "application/json", b"{}"
+        payload = {
+            "id": f"stand-in-{random.randint(0, 1_000_000)}",
+            "completion_message": {
+                "role": "assistant",
+                "stop_reason": "stop",
+                "content": {"type": "text", "text": json.dumps(FAKE_CARD)},
+            },
+            "metrics": [
+                {"metric": "num_prompt_tokens", "value": 1450, "unit": "tokens"},
+                {"metric": "num_completion_tokens", "value": 96, "unit": "tokens"},
+                {"metric": "num_total_tokens", "value": 1546, "unit": "tokens"},
+            ],
+        }
+        return 200, "application/json", json.dumps(payload).encode()
+
+
+class LiveKitDispatchStandIn(StandIn):
+    """Accepts Twirp agent dispatch calls and records them"""
+
+    def __init__(self, **kwargs):
+        super().__init__("livekit", **kwargs)
+        self.dispatches = []
+
+    def route(self, method, path, query, body):
+        if not path.startswith("/twirp/livekit.AgentDispatchService/"):
+            return 404, "application/json", b"{}"
+        with self._lock:
+            self.dispatches.append({"time": time.time(), "bytes": len(body)})
+        # An empty protobuf body decodes to a default AgentDispatch message
+        return 200, "application/protobuf", b""
+
+
+class RedisStandIn:
+    """
+    In-memory Redis speaking RESP: PING, GET, SET (EX/PX/NX), TTL, DEL, EXISTS,
+    SELECT, CLIENT and the compare-and-delete EVAL the cache's lock release
+    sends. Enough for redis-py and the backend's RedisStore, not a general Redis.
+    """
+
+    def __init__(self, port=0):
+        self.name = "redis"
+        self.stats = {"requests": 0, "errors": 0}
+        self._data = {}
+        self._lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        """Run one command; returns a RESP reply as bytes"""
+        command, args = args[0].decode().upper(), args[1:]
+        with self._lock:
+            self.stats["requests"] += 1
+            if command == "PING":
+                return b"+PONG\r\n"
+            if command in ("SELECT", "CLIENT"):
+                return b"+OK\r\n"
+            if command == "GET":
+                entry = self._live(args[0])
+                return _bulk(entry[0] if entry else None)
+            if command == "SET":
+                key, value, options = args[0], args[1], [a.decode().upper() for a in args[2:]]
+                expires_at = None
+                for i, option in enumerate(options):
+                    if option == "EX":
+                        expires_at = time.time() + int(options[i + 1])
+                    elif option == "PX":
+                        expires_at = time.time() + int(options[i + 1]) / 1000.0
+                if "NX" in options and self._live(key):
+                    return _bulk(None)
+                self._data[key] = (value, expires_at)
+                return b"+OK\r\n"
+            if command == "TTL":
+                entry = self._live(args[0])
+                if not entry:
+                    return b":-2\r\n"
+                return b":-1\r\n" if entry[1] is None else f":{max(0, round(entry[1] - time.time()))}\r\n".encode()
+            if command in ("DEL", "EXISTS"):
+                found = [key for key in args if self._live(key)]
+                if command == "DEL":
+                    for key in found:
+                        del self._data[key]
+                return f":{len(found)}\r\n".encode()
+            if command == "EVAL" and b"redis.call('del'" in args[0]:
+                # The lock release script: delete KEYS[1] only if it holds ARGV[1]
+                key, owner = args[2], args[3]
+                entry = self._live(key)
+                if entry and entry[0] == owner:
+                    del self._data[key]
+                    return b":1\r\n"
+                return b":0\r\n"
+            self.stats["errors"] += 1
+            return f"-ERR unsupported command '{command}'\r\n".encode()
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    if not line.startswith(b"*"):
+                        # Inline command (e.g. redis-cli PING over telnet)
+                        args = line.split()
+                    else:
+                        args = []
+                        for _ in range(int(line[1:])):
+                            length = int(self.rfile.readline()[1:])
+                            args.append(self.rfile.read(length + 2)[:-2])
+                    if args:
+                        self.wfile.write(standin.execute(args))
+
+        return Handler
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$" + str(len(value)).encode() + b"\r\n" + value + b"\r\n"
+
+
+def start_standins(serp_latency="fixed:0", llama_latency="fixed:0", livekit_latency="fixed:0",
+                   serp_error_rate=0.0, llama_error_rate=0.0, livekit_error_rate=0.0):
+    """Start all three stand-ins and return them keyed by name"""
+    return {
+        "serpapi": SerpStandIn(latency=serp_latency, error_rate=serp_error_rate).start(),
+        "llama": LlamaStandIn(latency=llama_latency, error_rate=llama_error_rate).start(),
+        "livekit": LiveKitDispatchStandIn(latency=livekit_latency, error_rate=livekit_error_rate).start(),
+    }
+
+
+def backend_env(standins):
+    """Environment variables that point the backend at the stand-ins"""
+    return {
+        "SERP_API_KEY": "stand-in",
+        "SERP_API_URL": f"{standins['serpapi'].url}/search",
+        "LLAMA_API_KEY": "stand-in",
+        "LLAMA_API_URL": f"{standins['llama'].url}/v1/chat/completions",
+        "LIVEKIT_URL": standins["livekit"].url,
+        "LIVEKIT_API_KEY": "stand-in",
+        "LIVEKIT_API_SECRET": "stand-in-secret-stand-in-secret-0000",
+        # No agent runs behind the dispatch stand-in to report outcomes, so
+        # release each call's capacity slot as soon as it is dispatched
+        "CALL_OUTCOME_TIMEOUT": "0",
+        # Start every run cold instead of reusing the last run's shared cache file
+        "SHARED_CACHE_URL": "none",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local upstream stand-ins")
+    parser.add_argument("--serp-latency", default="lognormal:5.3,0.4")
+    parser.add_argument("--llama-latency", default="normal:1500,300")
+    parser.add_argument("--livekit-latency", default="normal:80,20")
+    parser.add_argument("--serp-error-rate", type=float, default=0.0)
+    parser.add_argument("--llama-error-rate", type=float, default=0.0)
+    parser.add_argument("--livekit-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    standins = start_standins(
+        serp_latency=args.serp_latency,
+        llama_latency=args.llama_latency,
+        livekit_latency=args.livekit_latency,
+        serp_error_rate=args.serp_error_rate,
+        llama_error_rate=args.llama_error_rate,
+        livekit_error_rate=args.livekit_error_rate,
+    )
+
+    print("Stand-ins running. Export these before starting the backend:")
+    for key, value in backend_env(standins).items():
+        print(f"export {key}={value}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for standin in standins.values():
+            standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Cold-start benchmark for the API backend.
+
+Imports backend/main.py in fresh interpreters and reports import time and
+peak RSS, for the current lazy calling path and for an "eager" variant that
+pre-imports the livekit voice stack the way calloutbound.py used to.
+
+  python bench/startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+
+VOICE_STACK = """
+from livekit import agents
+from livekit.agents import AgentSession, Agent, RoomInputOptions
+from livekit.plugins import openai, noise_cancellation, silero
+from livekit.plugins.turn_detector.multilingual import MultilingualModel
+"""
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+{preload}
+import main
+import_s = time.perf_counter() - start
+dispatch_start = time.perf_counter()
+from livekit import api
+dispatch_s = time.perf_counter() - dispatch_start
+print(json.dumps({{
+    "import_s": import_s,
+    "dispatch_import_s": dispatch_s,
+    "voice_stack_loaded": "livekit.agents" in sys.modules,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+
+def probe(preload):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(preload=preload)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    # The backend prints startup warnings; the probe result is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    return {
+        "import_ms_median": round(statistics.median(s["import_s"] for s in samples) * 1000, 1),
+        "dispatch_import_ms_median": round(statistics.median(s["dispatch_import_s"] for s in samples) * 1000, 1),
+        "max_rss_mb_median": round(statistics.median(s["max_rss_mb"] for s in samples), 1),
+        "voice_stack_loaded": samples[0]["voice_stack_loaded"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {
+        "lazy": summarize([probe("") for _ in range(args.runs)]),
+        "eager": summarize([probe(VOICE_STACK) for _ in range(args.runs)]),
+    }
+
+    lazy, eager = results["lazy"], results["eager"]
+    results["saved"] = {
+        "import_ms": round(eager["import_ms_median"] - lazy["import_ms_median"], 1),
+        "rss_mb": round(eager["max_rss_mb_median"] - lazy["max_rss_mb_median"], 1),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""
+Local telephony stand-in for load-testing concurrent outbound calls.
+
+Replaces the LiveKit agent dispatch + SIP participant flow so the calling
+path can be load-tested without SIP trunks or phone numbers:
+
+  - TelephonyStandIn serves the Twirp endpoints used by
+    calloutbound.create_outbound_call (AgentDispatchService/CreateDispatch)
+    and agent.entrypoint (SIP/CreateSIPParticipant). Each dispatch is handed
+    to the harness as a job. CreateSIPParticipant rings for a sampled time,
+    then answers (a person or voicemail) or fails with the SIP status a real
+    trunk returns for busy / no answer.
+  - The harness runs those jobs inside this process the way one agent worker
+    process would: it dials through the real livekit.api client, then streams
+    synthetic 20 ms caller audio through a frame processor (Silero VAD, or
+    an RMS energy detector) alongside synthetic agent speech, in real time.
+
+Concurrency is ramped level by level while event loop lag, CPU and RSS are
+sampled, to find where one worker process saturates.
+
+  python bench/telephony_standin.py --levels 1,4,8,16,32 --talk-time normal:20000,5000
+  python bench/telephony_standin.py --processor silero --outcomes answered=0.6,voicemail=0.3,busy=0.1
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from standins import StandIn, parse_latency
+from load_test import percentile, read_rss_kb
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+# SIP final responses for calls that are never answered
+SIP_FAILURES = {
+    "busy": ("486", "Busy Here"),
+    "no_answer": ("480", "Temporarily Unavailable"),
+    "failed": ("503", "Service Unavailable"),
+}
+
+
+def parse_distribution(spec):
+    """'answered=0.7,voicemail=0.2,busy=0.1' -> [(name, cumulative probability)]"""
+    weights = []
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        weights.append((name.strip(), float(value)))
+    total = sum(weight for _, weight in weights)
+    cumulative, running = [], 0.0
+    for name, weight in weights:
+        running += weight / total
+        cumulative.append((name, running))
+    return cumulative
+
+
+def sample(distribution):
+    roll = random.random()
+    for name, threshold in distribution:
+        if roll <= threshold:
+            return name
+    return distribution[-1][0]
+
+
+def _varint(data, i):
+    value, shift = 0, 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, i
+
+
+def proto_strings(body):
+    """Top-level string fields of a protobuf message as {field number: str}"""
+    fields, i = {}, 0
+    try:
+        while i < len(body):
+            key, i = _varint(body, i)
+            number, wire_type = key >> 3, key & 7
+            if wire_type == 0:
+                _, i = _varint(body, i)
+            elif wire_type == 1:
+                i += 8
+            elif wire_type == 5:
+                i += 4
+            elif wire_type == 2:
+                length, i = _varint(body, i)
+                try:
+                    fields[number] = body[i:i + length].decode("utf-8")
+                except UnicodeDecodeError:
+                    pass
+                i += length
+            else:
+                break
+    except IndexError:
+        pass
+    return fields
+
+
+class TelephonyStandIn(StandIn):
+    """Twirp agent dispatch + SIP participant stand-in with simulated call outcomes"""
+
+    def __init__(self, outcomes="answered=0.7,voicemail=0.15,busy=0.1,no_answer=0.05",
+                 ring_time="uniform:2000,6000", on_dispatch=None, **kwargs):
+        super().__init__("telephony", **kwargs)
+        self.outcomes = parse_distribution(outcomes)
+        self.ring_time = parse_latency(ring_time)
+        self.on_dispatch = on_dispatch
+        self.calls = {}
+
+    def route(self, method, path, query, body):
+        if path.startswith("/twirp/livekit.AgentDispatchService/"):
+            # CreateAgentDispatchRequest: agent_name = 1, room = 2, metadata = 3
+            fields = proto_strings(body)
+            room, metadata = fields.get(2, ""), fields.get(3, "")
+            with self._lock:
+                self.calls[room] = {"dispatched_at": time.time(), "metadata": metadata}
+            if self.on_dispatch:
+                self.on_dispatch(room, metadata)
+            return 200, "application/protobuf", b""
+
+        if path == "/twirp/livekit.SIP/CreateSIPParticipant":
+            # CreateSIPParticipantRequest: sip_trunk_id = 1, sip_call_to = 2, room_name = 3
+            fields = proto_strings(body)
+            room = fields.get(3, "")
+            outcome = sample(self.outcomes)
+            ring = self.ring_time() if outcome != "failed" else 0.0
+            time.sleep(ring)
+            with self._lock:
+                call = self.calls.setdefault(room, {})
+                call.update({"sip_call_to": fields.get(2), "outcome": outcome, "ring_s": ring})
+
+            if outcome in SIP_FAILURES:
+                code, status = SIP_FAILURES[outcome]
+                error = {
+                    "code": "unavailable",
+                    "msg": f"sip call failed: {status}",
+                    "meta": {"sip_status_code": code, "sip_status": status},
+                }
+                return 503, "application/json", json.dumps(error).encode()
+            # An empty body decodes to a default SIPParticipantInfo
+            return 200, "application/protobuf", b""
+
+        return 404, "application/json", b"{}"
+
+
+def synthetic_speech(seconds, seed=0):
+    """Speech-like 16 kHz frames: voiced harmonics with a syllable envelope and pauses"""
+    rng = random.Random(seed)
+    frames, t = [], 0
+    pitch = rng.uniform(110, 220)
+    for _ in range(int(seconds * 1000 / FRAME_MS)):
+        frame = array("h", [0]) * FRAME_SAMPLES
+        # ~4 syllables per second, with a pause every couple of seconds
+        phrase = (t / SAMPLE_RATE) % 2.5
+        if phrase < 2.0:
+            for n in range(FRAME_SAMPLES):
+                x = (t + n) / SAMPLE_RATE
+                envelope = max(0.0, math.sin(math.pi * 4 * x)) ** 2
+                voiced = sum(math.sin(2 * math.pi * pitch * k * x) / k for k in (1, 2, 3))
+                frame[n] = int(6000 * envelope * voiced + rng.gauss(0, 150))
+        else:
+            for n in range(FRAME_SAMPLES):
+                frame[n] = int(rng.gauss(0, 150))
+        frames.append(frame)
+        t += FRAME_SAMPLES
+    return frames
+
+
+def voicemail_greeting(seconds):
+    """A spoken greeting followed by the 1 kHz beep"""
+    frames = synthetic_speech(max(1.0, seconds - 0.5), seed=7)
+    for i in range(int(500 / FRAME_MS)):
+        offset = i * FRAME_SAMPLES
+        frames.append(array("h", [
+            int(8000 * math.sin(2 * math.pi * 1000 * (offset + n) / SAMPLE_RATE)) for n in range(FRAME_SAMPLES)
+        ]))
+    return frames
+
+
+class EnergyVAD:
+    """RMS energy voice activity detector; the cheap default frame processor"""
+
+    def __init__(self, threshold=1000, hangover_frames=15):
+        self.threshold = threshold
+        self.hangover_frames = hangover_frames
+        self.quiet = 0
+        self.speaking = False
+        self.turns = 0
+
+    def push(self, frame):
+        rms = math.sqrt(sum(s * s for s in frame) / len(frame))
+        if rms >= self.threshold:
+            if not self.speaking:
+                self.turns += 1
+            self.speaking, self.quiet = True, 0
+        elif self.speaking:
+            self.quiet += 1
+            if self.quiet > self.hangover_frames:
+                self.speaking = False
+
+    async def aclose(self):
+        pass
+
+
+class SileroVADProcessor:
+    """Runs frames through a Silero VAD stream, as the agent's session does"""
+
+    def __init__(self, vad):
+        from livekit import rtc
+
+        self._rtc = rtc
+        self.stream = vad.stream()
+        self.turns = 0
+        self._task = asyncio.create_task(self._consume())
+
+    async def _consume(self):
+        async for event in self.stream:
+            if event.type.name == "START_OF_SPEECH":
+                self.turns += 1
+
+    def push(self, frame):
+        self.stream.push_frame(self._rtc.AudioFrame(
+            data=frame.tobytes(), sample_rate=SAMPLE_RATE, num_channels=1, samples_per_channel=FRAME_SAMPLES,
+        ))
+
+    async def aclose(self):
+        await self.stream.aclose()
+        self._task.cancel()
+
+
+class Harness:
+    """Runs dispatched calls as jobs in this process and samples its load"""
+
+    def __init__(self, args):
+        self.args = args
+        self.talk_time = parse_latency(args.talk_time)
+        self.speech = synthetic_speech(10.0, seed=1)
+        self.agent_speech = synthetic_speech(6.0, seed=2)
+        self.greeting = voicemail_greeting(args.voicemail_seconds)
+        self.vad = None
+        if args.processor == "silero":
+            from livekit.plugins import silero
+            self.vad = silero.VAD.load()
+        self.loop = None
+        self.jobs = []
+        self.results = []
+        self.frames = {"total": 0, "late": 0}
+
+    def new_processor(self):
+        return SileroVADProcessor(self.vad) if self.vad else EnergyVAD()
+
+    def on_dispatch(self, room, metadata):
+        """Called from the stand-in's HTTP thread for every accepted dispatch"""
+        self.loop.call_soon_threadsafe(lambda: self.jobs.append(asyncio.ensure_future(self.run_job(room, metadata))))
+
+    async def stream(self, frames, seconds, processor=None):
+        """Play frames in real time for `seconds`, optionally through a processor"""
+        start = self.loop.time()
+        interval = FRAME_MS / 1000
+        for i in range(int(seconds / interval)):
+            frame = frames[i % len(frames)]
+            if processor:
+                processor.push(frame)
+            else:
+                frame.tobytes()
+            self.frames["total"] += 1
+            delay = start + (i + 1) * interval - self.loop.time()
+            if delay < -interval:
+                self.frames["late"] += 1
+            await asyncio.sleep(max(0.0, delay))
+
+    async def run_job(self, room, metadata):
+        """One call as agent.entrypoint places it: dial, wait for answer, converse"""
+        from livekit import api
+        from call_outcomes import OutcomeReporter, sip_failure_event
+
+        dial_info = json.loads(metadata or "{}")
+        reporter = OutcomeReporter(dial_info.get("call_id"), url=self.args.outcome_url) if self.args.outcome_url else None
+        result = {"room": room, "dispatched_at": time.perf_counter()}
+        lkapi = api.LiveKitAPI()
+        try:
+            await lkapi.sip.create_sip_participant(api.CreateSIPParticipantRequest(
+                room_name=room,
+                sip_trunk_id="ST_standin",
+                sip_call_to=dial_info.get("phone_number", ""),
+                participant_identity=dial_info.get("phone_number", ""),
+                wait_until_answered=True,
+            ))
+        except api.TwirpError as e:
+            result["outcome"] = sip_failure_event(e.metadata.get("sip_status_code"))
+            if reporter:
+                await reporter.report(result["outcome"], reason=e.message)
+            self.results.append(result)
+            return
+        finally:
+            await lkapi.aclose()
+
+        result["answered_after_s"] = time.perf_counter() - result["dispatched_at"]
+        if reporter:
+            await reporter.report("answered")
+
+        processor = self.new_processor()
+        try:
+            if self.standin.calls.get(room, {}).get("outcome") == "voicemail":
+                await self.stream(self.greeting, len(self.greeting) * FRAME_MS / 1000, processor)
+                await self.stream(self.agent_speech, 5.0)
+                result["outcome"] = "voicemail"
+            else:
+                await asyncio.gather(
+                    self.stream(self.speech, self.talk_time(), processor),
+                    self.stream(self.agent_speech, self.talk_time()),
+                )
+                result["outcome"] = "booked"
+        finally:
+            await processor.aclose()
+        result["turns"] = processor.turns
+        if reporter:
+            await reporter.report(result["outcome"])
+        self.results.append(result)
+
+    async def sample_load(self, stop, lag_ms, rss_kb, interval=0.05):
+        """Event loop lag: how late a short sleep wakes up"""
+        last_rss = 0.0
+        while not stop.is_set():
+            start = self.loop.time()
+            await asyncio.sleep(interval)
+            lag_ms.append(max(0.0, (self.loop.time() - start - interval) * 1000))
+            if start - last_rss >= 1.0:
+                rss_kb.append(read_rss_kb(os.getpid()))
+                last_rss = start
+
+    async def run_level(self, concurrency):
+        from calloutbound import create_outbound_call
+
+        self.jobs, self.results = [], []
+        self.frames = {"total": 0, "late": 0}
+        lag_ms, rss_kb = [], []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(self.sample_load(stop, lag_ms, rss_kb))
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        dispatches = await asyncio.gather(*(
+            create_outbound_call(f"+1206555{i:04d}", "Stand-in call script") for i in range(concurrency)
+        ))
+        expected = sum(1 for d in dispatches if d and d.get("status") == "dispatched")
+        while len(self.jobs) < expected:
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*self.jobs, return_exceptions=True)
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+        stop.set()
+        await sampler
+
+        outcomes = {}
+        for result in self.results:
+            outcomes[result.get("outcome", "error")] = outcomes.get(result.get("outcome", "error"), 0) + 1
+        answered = [r["answered_after_s"] for r in self.results if "answered_after_s" in r]
+        return {
+            "concurrency": concurrency,
+            "wall_s": round(wall, 1),
+            "cpu_cores": round(cpu / wall, 3) if wall else 0.0,
+            "loop_lag_ms": {
+                "p50": round(percentile(lag_ms, 50), 1),
+                "p99": round(percentile(lag_ms, 99), 1),
+                "max": round(max(lag_ms, default=0.0), 1),
+            },
+            "late_frame_ratio": round(self.frames["late"] / self.frames["total"], 4) if self.frames["total"] else 0.0,
+            "max_rss_mb": round(max(rss_kb, default=0) / 1024, 1),
+            "dial_to_answer_p50_s": round(percentile(answered, 50), 2),
+            "outcomes": outcomes,
+        }
+
+    def saturated(self, level):
+        return (
+            level["loop_lag_ms"]["p99"] > self.args.max_lag_ms
+            or level["cpu_cores"] > self.args.max_cpu
+            or level["late_frame_ratio"] > self.args.max_late_frames
+        )
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.standin = TelephonyStandIn(
+            outcomes=self.args.outcomes,
+            ring_time=self.args.ring_time,
+            latency=self.args.api_latency,
+            on_dispatch=self.on_dispatch,
+        ).start()
+        os.environ.update({
+            "LIVEKIT_URL": self.standin.url,
+            "LIVEKIT_API_KEY": "stand-in",
+            "LIVEKIT_API_SECRET": "stand-in-secret-stand-in-secret-0000",
+        })
+
+        levels, saturation = [], None
+        try:
+            for concurrency in [int(c) for c in self.args.levels.split(",")]:
+                level = await self.run_level(concurrency)
+                levels.append(level)
+                print(json.dumps(level))
+                if self.saturated(level):
+                    saturation = concurrency
+                    break
+        finally:
+            self.standin.stop()
+
+        sustained = [level["concurrency"] for level in levels if not self.saturated(level)]
+        return {
+            "processor": self.args.processor,
+            "levels": levels,
+            "max_sustained_concurrency": max(sustained, default=0),
+            "saturated_at": saturation,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent outbound call load test against a telephony stand-in")
+    parser.add_argument("--levels", default="1,2,4,8,16,32,64", help="Concurrent calls per level")
+    parser.add_argument("--outcomes", default="answered=0.7,voicemail=0.15,busy=0.1,no_answer=0.05")
+    parser.add_argument("--ring-time", default="uniform:2000,6000")
+    parser.add_argument("--talk-time", default="normal:30000,8000")
+    parser.add_argument("--voicemail-seconds", type=float, default=8.0)
+    parser.add_argument("--api-latency", default="normal:40,10", help="Twirp API latency before ringing")
+    parser.add_argument("--processor", choices=["energy", "silero"], default="energy")
+    parser.add_argument("--outcome-url", help="Also report outcomes to this backend webhook")
+    parser.add_argument("--max-lag-ms", type=float, default=50.0, help="Saturation: event loop lag p99")
+    parser.add_argument("--max-cpu", type=float, default=0.9, help="Saturation: CPU cores used")
+    parser.add_argument("--max-late-frames", type=float, default=0.01, help="Saturation: share of late audio frames")
+    parser.add_argument("--save", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = asyncio.run(Harness(args).run())
+    print(f"\nOne worker process sustained {report['max_sustained_concurrency']} concurrent calls"
+          + (f"; saturated at {report['saturated_at']}" if report["saturated_at"] else ""))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
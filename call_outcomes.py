@@ -0,0 +1,99 @@
+"""
+Call outcome reporting from the agent to the backend.
+
+Each dispatched call carries a call_id in its job metadata. The agent
+reports what happens on the call (answered, booked, declined, voicemail,
+hung up, ...) as structured events, both to the backend's /call-outcomes
+webhook and as a room data message on the "call-outcome" topic, so the
+backend reacts the moment the outcome is known instead of polling.
+"""
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+
+OUTCOME_WEBHOOK_URL = os.getenv("OUTCOME_WEBHOOK_URL", "http://localhost:8000/call-outcomes")
+OUTCOME_WEBHOOK_SECRET = os.getenv("OUTCOME_WEBHOOK_SECRET")
+OUTCOME_WEBHOOK_RETRIES = int(os.getenv("OUTCOME_WEBHOOK_RETRIES", "3"))
+OUTCOME_TOPIC = "call-outcome"
+
+# Outcomes the LLM may report with the report_outcome tool
+REPORTABLE_OUTCOMES = ["booked", "declined", "voicemail", "invalid_number", "do_not_call"]
+TERMINAL_EVENTS = {"booked", "declined", "voicemail", "invalid_number", "do_not_call", "no_answer", "busy", "hung_up", "failed"}
+
+OUTCOME_INSTRUCTIONS = """
+
+        **Reporting the Outcome:**
+        As soon as the outcome of the call is clear, call the report_outcome tool exactly once:
+        - "booked" with the appointment date, time and any confirmation number once the appointment is confirmed
+        - "declined" with the reason if they are not accepting new patients, don't take the insurance, or can't book
+        - "voicemail" if you reached voicemail or an answering service
+        - "invalid_number" with the reason if you reached a fax machine, a "number not in service" recording or a wrong number
+        - "do_not_call" if they ask not to be called again
+        """
+
+
+class OutcomeReporter:
+    """
+    Posts outcome events for one call; only the first terminal event counts.
+    A "metrics" event carries per-call agent metrics and can follow the outcome.
+    """
+
+    def __init__(self, call_id, room=None, url=OUTCOME_WEBHOOK_URL):
+        self.call_id = call_id
+        self.room = room
+        self.url = url
+        self.final = None
+
+    async def report(self, event, **details):
+        """Send one event; returns False if the call already has a final outcome"""
+        if event in TERMINAL_EVENTS:
+            if self.final:
+                return False
+            self.final = event
+
+        payload = {"call_id": self.call_id, "event": event, "timestamp": time.time()}
+        payload.update({key: value for key, value in details.items() if value})
+        print(f"Reporting call outcome: {payload}")
+        await asyncio.gather(self._post(payload), self._publish(payload))
+        return True
+
+    async def _post(self, payload):
+        if not self.call_id or not self.url:
+            return
+        headers = {"X-Outcome-Secret": OUTCOME_WEBHOOK_SECRET} if OUTCOME_WEBHOOK_SECRET else {}
+        for attempt in range(OUTCOME_WEBHOOK_RETRIES):
+            try:
+                async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as http:
+                    async with http.post(self.url, json=payload, headers=headers) as response:
+                        if response.status < 500:
+                            if response.status >= 400:
+                                print(f"Outcome webhook rejected {payload['event']}: {response.status} {await response.text()}")
+                            return
+                        print(f"Outcome webhook returned {response.status}, retrying...")
+            except Exception as e:
+                print(f"Outcome webhook error (attempt {attempt + 1}): {e}")
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def _publish(self, payload):
+        if self.room is None or not self.room.isconnected():
+            return
+        try:
+            await self.room.local_participant.publish_data(json.dumps(payload), reliable=True, topic=OUTCOME_TOPIC)
+        except Exception as e:
+            print(f"Could not publish call outcome to the room: {e}")
+
+
+def sip_failure_event(sip_status_code):
+    """Outcome event for a SIP call that was never answered"""
+    code = str(sip_status_code or "")
+    if code in ("486", "600"):
+        return "busy"
+    if code in ("408", "480", "487"):
+        return "no_answer"
+    if code in ("404", "410", "484", "604"):
+        # Number doesn't exist / is no longer in service
+        return "invalid_number"
+    return "failed"
@@ -5,8 +5,13 @@ import json
 import time
 from datetime import datetime
 from calloutbound import create_outbound_call
+from dial_validation import check_number
 
-async def make_appointment_call(doctor_info, patient_info, insurance_info):
+# Development only: dial this number instead of the clinic's. Outcomes of
+# such test calls are not learned from (see test_call in the result).
+CALLOUT_TEST_NUMBER = os.getenv("CALLOUT_TEST_NUMBER")
+
+async def make_appointment_call(doctor_info, patient_info, insurance_info, call_id=None):
     """
     Make a phone call to schedule an appointment with a doctor
     
@@ -14,6 +19,7 @@ async def make_appointment_call(doctor_info, patient_info, insurance_info):
         doctor_info (dict): Doctor's information including name, phone, address
         patient_info (dict): Patient information including name, preferred dates
         insurance_info (dict): Insurance details from the card
+        call_id (str): Id the call was queued under; generated at dispatch when not given
     
     Returns:
         dict: Call result with status and details
@@ -22,14 +28,25 @@ async def make_appointment_call(doctor_info, patient_info, insurance_info):
     phone_number = doctor_info.get('phone', '')
     doctor_name = doctor_info.get('title', 'Unknown Doctor')
     doctor_address = doctor_info.get('address', 'Unknown Address')
+
+    # Don't tie up a worker and a SIP channel on a number that can't reach the clinic
+    number = check_number(phone_number, doctor_info)
+    if not number["ok"]:
+        print(f"🚫 Not calling {doctor_name} at {phone_number}: {number['reason']}")
+        return {
+            "status": "invalid_number",
+            "message": f"Not dialed: {number['reason']}",
+            "phone_number": phone_number,
+            "call_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+    phone_number = number["e164"]
+    if CALLOUT_TEST_NUMBER:
+        print(f"🧪 CALLOUT_TEST_NUMBER is set: dialing {CALLOUT_TEST_NUMBER} instead of {phone_number}")
+        phone_number = CALLOUT_TEST_NUMBER
     
     print(f"📞 Initiating call to {doctor_name}")
     print(f"📍 Location: {doctor_address}")
-    print(f"☎️  Phone: {phone_number}")
-    
-    # Simulate call initiation
-    print("🔄 Dialing...")
-    time.sleep(2)
+    print(f"☎️  Phone: {phone_number}" + (f" ext. {number['extension']}" if number["extension"] else ""))
     
     # Here you would integrate with a service like Twilio, Bland AI, or similar
     # For now, we'll simulate the call process
@@ -39,7 +56,9 @@ async def make_appointment_call(doctor_info, patient_info, insurance_info):
     # Simulate call execution
     # call_result = simulate_call_execution(phone_number, call_script)
     print(call_script)
-    call_result = await integrate_with_calling_service("+14259002789", call_script)
+    call_result = await integrate_with_calling_service(phone_number, call_script, call_id, number["extension"])
+    if call_result and CALLOUT_TEST_NUMBER:
+        call_result["test_call"] = True
 
     return call_result
 
@@ -139,7 +158,7 @@ def simulate_call_execution(phone_number, script):
     
     return result
 
-async def integrate_with_calling_service(phone_number, script):
+async def integrate_with_calling_service(phone_number, script, call_id=None, extension=None):
     """
     Integration with actual calling services
     """
@@ -147,7 +166,7 @@ async def integrate_with_calling_service(phone_number, script):
     try:
         # Call the create_outbound_call function
         print("📞 Integrating with calling service...")
-        result = await create_outbound_call(phone_number, script)
+        result = await create_outbound_call(phone_number, script, call_id, extension)
 
         return result
     except Exception as e:
@@ -1,38 +1,41 @@
 import asyncio
 import json
-import os
 import random
+import uuid
 from dotenv import load_dotenv
 
-from livekit import agents
-from livekit.agents import AgentSession, Agent, RoomInputOptions
-from livekit.plugins import (
-    openai,
-    noise_cancellation,
-    silero,
-)
-from livekit.plugins.turn_detector.multilingual import MultilingualModel
-from livekit import api
-import json
+# Only the dispatch client is needed here, and it is imported inside
+# create_outbound_call so that importing this module (e.g. from the API
+# backend) never loads the livekit voice stack (agents, plugins, turn
+# detector). The worker in agent.py imports those itself.
 
 load_dotenv()
 
 
 
 
-async def create_outbound_call(phone_number: str, script: str):
+async def create_outbound_call(phone_number: str, script: str, call_id: str = None, extension: str = None):
     """
     Create an outbound call using agent dispatch.
     
     Args:
         phone_number (str): The phone number to call
+        call_id (str): Id to report outcomes under; generated when not given
+        extension (str): Extension the agent keys in once the call connects
+
+    Returns:
+        dict: {"status": "dispatched", "call_id", "room"}; the agent reports the
+        call's outcome for call_id to the backend's /call-outcomes webhook
     """
+    from livekit import api
+
     print(f"Creating outbound call for phone number: {phone_number} with script: {script}")
     lkapi = api.LiveKitAPI()
     
     try:
         room_name = f"outbound-{''.join(str(random.randint(0, 9)) for _ in range(10))}"
-        metadata_json = json.dumps({"phone_number": phone_number, "script": script})
+        call_id = call_id or uuid.uuid4().hex
+        metadata_json = json.dumps({"phone_number": phone_number, "extension": extension, "script": script, "call_id": call_id})
 
         print(f"Attempting to dispatch agent for phone number: {phone_number} in room: {room_name}")
         print(f"Dispatch metadata: {metadata_json}")
@@ -50,9 +53,11 @@ async def create_outbound_call(phone_number: str, script: str):
             )
         )
         print(f"Agent dispatch successful for room: {room_name}")
+        return {"status": "dispatched", "call_id": call_id, "room": room_name}
     except api.TwirpError as e:
         print(f"Error dispatching agent: {e.message}")
         print(f"Code: {e.code}, Metadata: {e.metadata}")
+        return {"status": "failed", "message": f"Error dispatching agent: {e.message}"}
     finally:
         # Properly close the client session to avoid unclosed session warnings
         await lkapi.aclose()
@@ -0,0 +1,171 @@
+"""
+Bounded conversation context for long calls.
+
+Every LLM turn re-sends the call script plus the whole transcript, so on
+long calls (transfers, holds, repeated questions) the prompt and the turn
+latency keep growing. ContextBudget keeps the chat context under
+CONTEXT_TOKEN_BUDGET tokens of history:
+
+  - system/developer messages (the script from generate_call_script) stay
+    pinned at the top
+  - key facts seen anywhere in the call (offered slots, confirmation
+    numbers, who the agent is talking to, transfers, what was already
+    provided) are kept in one pinned "call facts" message
+  - the most recent turns are kept verbatim; older turns are dropped and
+    condensed into a few short lines in the facts message
+
+Condensing is extractive (no extra LLM call), so it adds no latency.
+Function calls stay with their outputs.
+"""
+import os
+import re
+
+from livekit.agents import llm
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))
+CONTEXT_MIN_RECENT_TURNS = int(os.getenv("CONTEXT_MIN_RECENT_TURNS", "4"))
+CONTEXT_SUMMARY_LINES = int(os.getenv("CONTEXT_SUMMARY_LINES", "6"))
+# Most recent values kept per fact, so the facts message stays bounded too
+CONTEXT_MAX_FACT_VALUES = int(os.getenv("CONTEXT_MAX_FACT_VALUES", "6"))
+
+FACTS_MESSAGE_ID = "medicall.call_facts"
+
+_slot_re = re.compile(
+    r"\b((?:next\s+)?(?:mon|tues|wednes|thurs|fri|satur|sun)day(?:,?\s+\w+\s+\d{1,2})?)\s+at\s+(\d{1,2}(?::\d{2})?\s*[ap]\.?m)",
+    re.I,
+)
+_confirmation_re = re.compile(r"\bconfirmation(?:\s+(?:number|code|#))?(?:\s+is)?:?\s+([A-Z0-9-]{4,})", re.I)
+_staff_re = re.compile(r"\b(?:this is|my name is|speaking is)\s+([A-Z][a-z]+)")
+_transfer_re = re.compile(r"\btransfer(?:ring)?\s+you\s+to\s+([\w\s]+?)(?:[.,]|$)", re.I)
+
+PROVIDED = {
+    "member ID": ["member id", "member number"],
+    "date of birth": ["date of birth", "born on"],
+    "insurance": ["insurance", "premera", "aetna", "cigna", "united", "kaiser", "blue cross"],
+    "callback number": ["callback", "call back number", "phone number"],
+}
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) plus per-message overhead"""
+    return len(text or "") // 4 + 4
+
+
+def _item_text(item):
+    if item.type == "message":
+        return item.text_content or ""
+    if item.type == "function_call":
+        return f"{item.name}({item.arguments})"
+    if item.type == "function_call_output":
+        return item.output or ""
+    return ""
+
+
+class ContextBudget:
+    """Per-call context trimmer; call apply() before each LLM turn"""
+
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, min_recent_turns=CONTEXT_MIN_RECENT_TURNS):
+        self.budget = budget
+        self.min_recent_turns = min_recent_turns
+        self.facts = {"slots": [], "confirmation_numbers": [], "spoke_with": [], "transfers": [], "provided": []}
+        self.condensed = []
+        self._seen = set()
+        self.stats = {"turns_condensed": 0, "last_history_tokens": 0, "max_history_tokens": 0}
+
+    def _learn(self, item):
+        """Pull key facts out of one chat item (once per item)"""
+        if item.id in self._seen or item.type != "message":
+            return
+        self._seen.add(item.id)
+        text = _item_text(item)
+
+        def add(key, value):
+            value = value.strip()
+            if value and value not in self.facts[key]:
+                self.facts[key] = (self.facts[key] + [value])[-CONTEXT_MAX_FACT_VALUES:]
+
+        for day, at in _slot_re.findall(text):
+            add("slots", f"{day} at {at}")
+        for number in _confirmation_re.findall(text):
+            add("confirmation_numbers", number)
+        if item.role == "user":
+            for name in _staff_re.findall(text):
+                add("spoke_with", name)
+            for target in _transfer_re.findall(text):
+                add("transfers", target)
+        elif item.role == "assistant":
+            lowered = text.lower()
+            for label, keywords in PROVIDED.items():
+                if any(k in lowered for k in keywords):
+                    add("provided", label)
+
+    def _condense(self, turn):
+        """One short line per dropped turn"""
+        for item in turn:
+            if item.type == "message" and item.role in ("user", "assistant"):
+                who = "Receptionist" if item.role == "user" else "You"
+                text = " ".join(_item_text(item).split())
+                self.condensed.append(f"{who}: {text[:120]}{'...' if len(text) > 120 else ''}")
+            elif item.type == "function_call":
+                self.condensed.append(f"You called {item.name}")
+        self.condensed = self.condensed[-CONTEXT_SUMMARY_LINES:]
+
+    def facts_text(self):
+        labels = {
+            "slots": "Appointment slots mentioned",
+            "confirmation_numbers": "Confirmation numbers",
+            "spoke_with": "Spoke with",
+            "transfers": "Transferred to",
+            "provided": "Already provided (don't repeat unless asked)",
+        }
+        lines = [f"- {labels[key]}: {', '.join(values)}" for key, values in self.facts.items() if values]
+        if self.condensed:
+            lines.append("- Earlier in the call (condensed):")
+            lines.extend(f"    {line}" for line in self.condensed)
+        if not lines:
+            return ""
+        return "Call facts so far:\n" + "\n".join(lines)
+
+    def apply(self, chat_ctx):
+        """
+        Trimmed copy of chat_ctx within the token budget
+
+        Returns:
+            llm.ChatContext: The context to use for this and later turns
+        """
+        pinned, turns = [], []
+        for item in chat_ctx.items:
+            if item.id == FACTS_MESSAGE_ID:
+                continue
+            self._learn(item)
+            if item.type == "message" and item.role in ("system", "developer"):
+                pinned.append(item)
+            elif (item.type == "message" and item.role == "user") or not turns:
+                turns.append([item])
+            else:
+                # Assistant replies and function calls/outputs belong to the current turn
+                turns[-1].append(item)
+
+        kept, used = [], 0
+        for index, turn in enumerate(reversed(turns)):
+            cost = sum(estimate_tokens(_item_text(item)) for item in turn)
+            if index >= self.min_recent_turns and used + cost > self.budget:
+                dropped = turns[:len(turns) - index]
+                for old in dropped:
+                    self._condense(old)
+                self.stats["turns_condensed"] += len(dropped)
+                break
+            kept.insert(0, turn)
+            used += cost
+
+        items = list(pinned)
+        facts = self.facts_text()
+        if facts:
+            items.append(llm.ChatMessage(id=FACTS_MESSAGE_ID, role="system", content=[facts]))
+            used += estimate_tokens(facts)
+        for turn in kept:
+            items.extend(turn)
+
+        self.stats["last_history_tokens"] = used
+        self.stats["max_history_tokens"] = max(self.stats["max_history_tokens"], used)
+        return llm.ChatContext(items)
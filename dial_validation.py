@@ -0,0 +1,237 @@
+"""
+Pre-dial validation of clinic phone numbers.
+
+Every dial holds an agent worker and a SIP channel for a full ring cycle,
+so numbers are checked before a call is queued:
+
+  - normalized to E.164 (+1NXXNXXXXXX); extensions ("x204", "ext. 204")
+    are split off
+  - rejected by NANP rules: area code and exchange must start with 2-9 and
+    not be N11 (411, 911, ...), no reserved/unassigned area codes (37X,
+    96X, N9X), no 555-01XX fictional numbers, no 900/976 premium numbers
+  - rejected if the number is in the known-bad filter: numbers earlier
+    calls found to be fax lines, disconnected or not in service, or that
+    asked not to be called again
+  - rejected if it's a hospital's main switchboard: the listing is a
+    hospital (SerpAPI place type) rather than a practice or department in
+    one, or the same number is listed for several providers in one search
+    (DIAL_REJECT_SWITCHBOARDS)
+
+The known-bad filter is a Bloom filter in one small file (DIAL_FILTER_PATH,
+~180 KB for 100k numbers at a 0.1% false-positive rate). Call outcomes add
+to it automatically; worker processes pick up each other's additions when
+the file changes. Seed it with an existing do-not-call list with
+
+    python dial_validation.py add numbers.txt
+"""
+import fcntl
+import hashlib
+import math
+import os
+import re
+import sys
+import threading
+
+DIAL_VALIDATION_ENABLED = os.getenv("DIAL_VALIDATION_ENABLED", "true").lower() in ("1", "true", "yes")
+DIAL_FILTER_PATH = os.getenv("DIAL_FILTER_PATH", "bad_numbers.bloom")
+DIAL_FILTER_CAPACITY = int(os.getenv("DIAL_FILTER_CAPACITY", "100000"))
+DIAL_FILTER_ERROR_RATE = float(os.getenv("DIAL_FILTER_ERROR_RATE", "0.001"))
+DIAL_REJECT_SWITCHBOARDS = os.getenv("DIAL_REJECT_SWITCHBOARDS", "true").lower() in ("1", "true", "yes")
+# A number listed for this many providers in one search is a shared switchboard
+DIAL_SHARED_NUMBER_LIMIT = int(os.getenv("DIAL_SHARED_NUMBER_LIMIT", "3"))
+
+# Outcome events that mean a number should never be dialed again
+BAD_NUMBER_OUTCOMES = {"invalid_number", "do_not_call"}
+
+PREMIUM_AREA_CODES = {"900"}
+PREMIUM_EXCHANGES = {"976"}
+
+HOSPITAL_TYPES = ("hospital", "medical center", "health system")
+# Listings under a hospital type that still reach a practice's own front desk
+PRACTICE_WORDS = {"clinic", "clinics", "practice", "department", "office", "associates", "group", "institute",
+                  "dr", "md", "dds", "pc", "pllc"}
+
+_extension_re = re.compile(r"\s*(?:x|ext\.?|extension|#)\s*(\d{1,6})\s*$", re.I)
+
+
+def split_extension(raw):
+    """'(206) 555-0142 ext. 12' -> ('(206) 555-0142', '12')"""
+    text = str(raw or "").strip()
+    match = _extension_re.search(text)
+    if match:
+        return text[:match.start()], match.group(1)
+    return text, None
+
+
+def nanp_problem(digits):
+    """Why a 10-digit NANP number can't be a clinic line, or None if it can"""
+    npa, nxx, line = digits[:3], digits[3:6], digits[6:]
+    if npa[0] in "01":
+        return "area code starts with 0 or 1"
+    if npa[1:] == "11":
+        return "area code is an N11 service code"
+    if npa[1] == "9" or npa[:2] in ("37", "96"):
+        return "reserved area code"
+    if nxx[0] in "01":
+        return "exchange starts with 0 or 1"
+    if nxx[1:] == "11":
+        return "exchange is an N11 service code"
+    if nxx == "555" and line.startswith("01"):
+        return "fictional 555-01XX number"
+    if npa in PREMIUM_AREA_CODES or nxx in PREMIUM_EXCHANGES:
+        return "premium-rate number"
+    if len(set(digits)) == 1:
+        return "placeholder number"
+    return None
+
+
+def normalize_e164(raw):
+    """
+    E.164 form of a US/Canada number
+
+    Returns:
+        tuple: (e164 or None, extension or None, reason the number is invalid or None)
+    """
+    number, extension = split_extension(raw)
+    if not number or number.upper() == "N/A":
+        return None, None, "no phone number"
+    digits = re.sub(r"\D", "", number)
+    if number.lstrip().startswith("+") and not digits.startswith("1"):
+        return None, extension, "not a NANP number"
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    if len(digits) != 10:
+        return None, extension, f"{len(digits)} digits"
+    problem = nanp_problem(digits)
+    if problem:
+        return None, extension, problem
+    return f"+1{digits}", extension, None
+
+
+def switchboard_problem(provider):
+    """Why a provider listing's number is a hospital's main switchboard, or None"""
+    if not DIAL_REJECT_SWITCHBOARDS or not provider:
+        return None
+    place_type = str(provider.get("type") or "").lower()
+    title = str(provider.get("title") or "").lower()
+    if any(kind in place_type for kind in HOSPITAL_TYPES):
+        if not set(re.findall(r"[a-z]+", title)) & PRACTICE_WORDS:
+            return "main hospital switchboard"
+    return None
+
+
+def shared_numbers(providers, limit=DIAL_SHARED_NUMBER_LIMIT):
+    """E.164 numbers listed for `limit` or more of these providers (shared switchboards)"""
+    counts = {}
+    for provider in providers:
+        e164, _, _ = normalize_e164(provider.get("phone"))
+        if e164:
+            counts[e164] = counts.get(e164, 0) + 1
+    return {number for number, count in counts.items() if count >= limit} if DIAL_REJECT_SWITCHBOARDS else set()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter persisted to one file, shared by worker processes"""
+
+    def __init__(self, path, capacity=DIAL_FILTER_CAPACITY, error_rate=DIAL_FILTER_ERROR_RATE):
+        self.path = path
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._data = bytearray((self.bits + 7) // 8)
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.sha256(item.encode()).digest()
+        a, b = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:16], "big") | 1
+        return [(a + i * b) % self.bits for i in range(self.hashes)]
+
+    def _reload(self):
+        """Pick up additions made by other processes"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if len(data) == len(self._data):
+            self._data = bytearray(data)
+        else:
+            print(f"Ignoring {self.path}: sized for a different capacity/error rate")
+        self._mtime = mtime
+
+    def __contains__(self, item):
+        with self._lock:
+            self._reload()
+            return all(self._data[p // 8] & (1 << (p % 8)) for p in self._positions(item))
+
+    def add_many(self, items):
+        """Add items and persist, merging with whatever other processes wrote meanwhile"""
+        with self._lock, open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._reload()
+            for item in items:
+                for p in self._positions(item):
+                    self._data[p // 8] |= 1 << (p % 8)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(self._data)
+            os.replace(tmp, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def add(self, item):
+        self.add_many([item])
+
+
+_filter = None
+
+
+def known_bad_numbers():
+    global _filter
+    if _filter is None:
+        _filter = BloomFilter(DIAL_FILTER_PATH)
+    return _filter
+
+
+def check_number(raw, provider=None):
+    """
+    Whether a number is worth dialing
+
+    Args:
+        raw (str): Phone number as listed
+        provider (dict): The provider listing it belongs to, to catch hospital switchboards
+
+    Returns:
+        dict: {"ok", "e164", "extension", "reason"}
+    """
+    e164, extension, reason = normalize_e164(raw)
+    if not DIAL_VALIDATION_ENABLED and reason != "no phone number":
+        return {"ok": True, "e164": e164 or str(raw), "extension": extension, "reason": None}
+    if e164 and e164 in known_bad_numbers():
+        reason = "previously found to be a fax, disconnected or do-not-call number"
+    elif e164 and not extension:
+        # A switchboard number with an extension reaches the practice directly
+        reason = switchboard_problem(provider)
+    return {"ok": reason is None, "e164": e164, "extension": extension, "reason": reason}
+
+
+def mark_bad(raw, outcome=None):
+    """Never dial this number again (called for BAD_NUMBER_OUTCOMES)"""
+    e164, _, _ = normalize_e164(raw)
+    if e164:
+        known_bad_numbers().add(e164)
+        print(f"🚫 {e164} added to the known-bad number filter ({outcome or 'manual'})")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "add":
+        print("Usage: python dial_validation.py add numbers.txt")
+        sys.exit(1)
+    with open(sys.argv[2]) as f:
+        numbers = [normalize_e164(line)[0] for line in f if line.strip()]
+    valid = [number for number in numbers if number]
+    known_bad_numbers().add_many(valid)
+    print(f"Added {len(valid)} numbers to {DIAL_FILTER_PATH} ({len(numbers) - len(valid)} skipped as invalid)")
@@ -12,6 +12,7 @@ export default function InsuranceUpload({ onBookingComplete }: InsuranceUploadPr
   const [customerQuery, setCustomerQuery] = useState('');
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [makeCall, setMakeCall] = useState(false);
+  const [hasReferral, setHasReferral] = useState(false);
 
   const handleDragOver = useCallback((e: React.DragEvent) => {
     e.preventDefault();
@@ -58,7 +59,7 @@ export default function InsuranceUpload({ onBookingComplete }: InsuranceUploadPr
       const blob = selectedFile.slice(0, selectedFile.size, selectedFile.type);
       const formData = new FormData();
       formData.append('file', blob, selectedFile.name);
-      formData.append('query_data', JSON.stringify(structuredData));
+      formData.append('query_data', JSON.stringify({ ...structuredData, has_referral: hasReferral }));
       formData.append('make_call', makeCall.toString());
       
       const response = await fetch('http://localhost:8000/upload-insurance', {
@@ -72,6 +73,10 @@ export default function InsuranceUpload({ onBookingComplete }: InsuranceUploadPr
 
       if (result.message === "Appointment successfully found" && result.appointment_details) {
         onBookingComplete(result.appointment_details, result.insurance_details, result.call_result);
+      } else if (result.status === "all_providers_excluded") {
+        const reasons = Array.from(new Set(result.excluded_doctors.map((d: any) => d.ineligible_reason.replace(/_/g, ' '))));
+        alert(`${result.message} (${reasons.join(', ')}). If you have a referral, check the referral box and try again.`);
+        setIsProcessing(false);
       } else {
         throw new Error(result.message || "Failed to book appointment.");
       }
@@ -159,6 +164,19 @@ export default function InsuranceUpload({ onBookingComplete }: InsuranceUploadPr
                 </label>
               </div>
               
+              <div className="flex items-center space-x-3">
+                <input
+                  type="checkbox"
+                  id="has-referral"
+                  checked={hasReferral}
+                  onChange={(e) => setHasReferral(e.target.checked)}
+                  className="w-4 h-4 text-blue-600 bg-slate-700 border-slate-600 rounded focus:ring-blue-500 focus:ring-2"
+                />
+                <label htmlFor="has-referral" className="text-slate-300 text-sm">
+                  I already have a referral from my primary care doctor
+                </label>
+              </div>
+              
               <button
                 onClick={handleProcessRequest}
                 disabled={!selectedFile}
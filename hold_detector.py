@@ -0,0 +1,245 @@
+"""
+Hold detection for outbound calls.
+
+While a clinic has the agent on hold, music and looping announcements
+would otherwise run through VAD, cloud STT and possibly LLM turns, costing
+money and risking the agent talking over the hold loop. HoldDetector runs a
+cheap local monitor on the clinic's raw audio track instead:
+
+  - per 20 ms frame it only computes RMS energy; over a sliding window it
+    looks at how often the energy dips (speech pauses between words and
+    syllables, music rarely does) and how much it varies
+  - sustained music-like audio suspends the session's audio input, so
+    nothing reaches STT or the LLM; a transcript that is entirely a hold
+    announcement ("please hold, your call is important to us") shortens
+    how long the music has to last, but never suspends on its own
+  - live speech resumes the input after HOLD_RESUME_SECONDS. Recorded
+    announcements don't count: speech over a music bed (pauses that never
+    go quiet) or whose loudness envelope matches an announcement already
+    heard on this call is treated as part of the hold loop
+
+Per-call metrics (time on hold, STT seconds and cost saved, monitor CPU)
+are available from HoldDetector.metrics().
+"""
+import asyncio
+import os
+import re
+import time
+from collections import deque
+
+import numpy as np
+
+HOLD_DETECTION_ENABLED = os.getenv("HOLD_DETECTION_ENABLED", "true").lower() in ("1", "true", "yes")
+HOLD_WINDOW_SECONDS = float(os.getenv("HOLD_WINDOW_SECONDS", "3"))
+HOLD_ENTER_SECONDS = float(os.getenv("HOLD_ENTER_SECONDS", "4"))
+HOLD_RESUME_SECONDS = float(os.getenv("HOLD_RESUME_SECONDS", "1.5"))
+# Music needed to enter hold right after a hold announcement was transcribed
+HOLD_HINT_ENTER_SECONDS = float(os.getenv("HOLD_HINT_ENTER_SECONDS", "1"))
+HOLD_HINT_TTL_SECONDS = 15.0
+# Envelope correlation above which speech is a replay of a known announcement
+HOLD_ANNOUNCEMENT_MATCH = float(os.getenv("HOLD_ANNOUNCEMENT_MATCH", "0.85"))
+HOLD_SILENCE_RMS = float(os.getenv("HOLD_SILENCE_RMS", "150"))
+# gpt-4o-transcribe list price per audio minute, for the savings estimate
+HOLD_STT_COST_PER_MINUTE = float(os.getenv("HOLD_STT_COST_PER_MINUTE", "0.006"))
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.02
+
+# Phrases only hold announcements use; a returning receptionist says "thank you
+# for holding" or "next available" too, so those are not here
+HOLD_PHRASES = [
+    "please hold", "please stay on the line", "please remain on the line", "your call is important",
+    "all of our representatives", "all of our staff are", "currently assisting other",
+    "calls will be answered in the order", "will be with you shortly", "estimated wait time",
+]
+
+# Anything a person offering or discussing a slot would say
+_booking_re = re.compile(
+    r"\bappointment|\bavailable\b(?! (?:representative|agent|staff|team member|associate))|\bopening|schedul|\bbook|\bslot|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|january|february|march|april|june|july|august|"
+    r"september|october|november|december|\d{1,2}(?::\d{2})? ?(?:am|pm|a\.m|p\.m|o'?clock)|\d(?:st|nd|rd|th)\b|"
+    r"\b(?:noon|morning|afternoon|today|tomorrow|next week|hi|hello|this is|speaking)\b",
+    re.I,
+)
+
+
+def is_hold_message(text):
+    """Whether the whole turn is a hold announcement (every sentence has a hold phrase, nothing else)"""
+    lowered = (text or "").lower().strip()
+    if not lowered or _booking_re.search(lowered):
+        return False
+    sentences = [s for s in re.split(r"[.!?]+", lowered) if s.strip()]
+    return all(any(phrase in sentence for phrase in HOLD_PHRASES) for sentence in sentences)
+
+
+def mentions_hold(text):
+    """Whether any hold phrase appears in the text"""
+    lowered = (text or "").lower()
+    return any(phrase in lowered for phrase in HOLD_PHRASES)
+
+
+def classify_window(rms):
+    """'silence', 'music' or 'speech' for a window of per-frame RMS values"""
+    mean = float(np.mean(rms))
+    if mean < HOLD_SILENCE_RMS:
+        return "silence"
+    # Share of frames well below the window's loud level: pauses between words
+    dip_ratio = float(np.mean(rms < 0.25 * np.percentile(rms, 90)))
+    variation = float(np.std(rms) / mean)
+    if dip_ratio > 0.2 and variation > 0.6:
+        return "speech"
+    if dip_ratio < 0.08 and variation < 0.5:
+        return "music"
+    return "unknown"
+
+
+def _envelope(rms):
+    """Normalized log-loudness envelope of a window, for matching announcement replays"""
+    envelope = np.log1p(rms)
+    return (envelope - envelope.mean()) / (envelope.std() or 1.0)
+
+
+def envelope_similarity(a, b, max_shift=25):
+    """Best correlation of two envelopes over shifts of up to max_shift frames (announcements are sampled every second)"""
+    n = min(len(a), len(b))
+    a, b = a[-n:], b[-n:]
+    full = np.correlate(a, b, "full")
+    lags = np.arange(-(n - 1), n)
+    near = np.abs(lags) <= max_shift
+    return float(np.max(full[near] / (n - np.abs(lags[near]))))
+
+
+class HoldDetector:
+    """Suspends the session's audio input while the call is on hold"""
+
+    def __init__(self, session):
+        self.session = session
+        self.on_hold = False
+        self.window = deque(maxlen=int(HOLD_WINDOW_SECONDS / FRAME_SECONDS))
+        self._state_since = {"music": None, "live": None}
+        self._hint_at = None
+        # (time, envelope) of speech heard while on hold or just before it started
+        self.announcements = deque(maxlen=40)
+        self._recent_speech = deque(maxlen=10)
+        self._last_remembered = 0.0
+        self._hold_started = None
+        self._frames_since_check = 0
+        self._task = None
+        self.hold_seconds = 0.0
+        self.holds = 0
+        self.monitor_cpu_s = 0.0
+
+    def watch(self, track):
+        """Start monitoring the clinic's audio track"""
+        from livekit import rtc
+
+        if self._task is None:
+            stream = rtc.AudioStream(track, sample_rate=SAMPLE_RATE, num_channels=1)
+            self._task = asyncio.create_task(self._run(stream))
+
+    async def _run(self, stream):
+        async for event in stream:
+            started = time.process_time()
+            samples = np.frombuffer(event.frame.data, dtype=np.int16).astype(np.float32)
+            self.push(float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0)
+            self.monitor_cpu_s += time.process_time() - started
+
+    def push(self, rms):
+        """Fold one frame's RMS in; re-classify the window every ~100 ms"""
+        self.window.append(rms)
+        self._frames_since_check += 1
+        if self._frames_since_check < 5 or len(self.window) < self.window.maxlen // 2:
+            return
+        self._frames_since_check = 0
+
+        now = time.monotonic()
+        window = np.asarray(self.window)
+        label = classify_window(window)
+        if label == "speech":
+            if self._is_live(window, now):
+                label = "live"
+            self._remember(window, now)
+        for kind in self._state_since:
+            if label != kind:
+                self._state_since[kind] = None
+            elif self._state_since[kind] is None:
+                self._state_since[kind] = now
+
+        music_since, live_since = self._state_since["music"], self._state_since["live"]
+        hinted = self._hint_at and now - self._hint_at <= HOLD_HINT_TTL_SECONDS
+        enter_after = HOLD_HINT_ENTER_SECONDS if hinted else HOLD_ENTER_SECONDS
+        if not self.on_hold and music_since and now - music_since >= enter_after:
+            self.suspend("hold announcement and music" if hinted else "music")
+        elif self.on_hold and live_since and now - live_since >= HOLD_RESUME_SECONDS:
+            self.resume()
+
+    def _is_live(self, window, now):
+        """Speech-like audio that isn't a recording: quiet pauses and not a known announcement"""
+        if float(np.percentile(window, 10)) > HOLD_SILENCE_RMS:
+            # Pauses never go quiet: speech over a music bed
+            return False
+        envelope = _envelope(window)
+        # Envelopes from the last window length overlap this one and would match themselves
+        return not any(
+            envelope_similarity(envelope, known) >= HOLD_ANNOUNCEMENT_MATCH
+            for heard_at, known in self.announcements if now - heard_at > HOLD_WINDOW_SECONDS
+        )
+
+    def _remember(self, window, now):
+        """Keep speech heard while on hold (and just before) as the hold loop's announcements"""
+        if now - self._last_remembered < 1.0:
+            return
+        self._last_remembered = now
+        entry = (now, _envelope(window))
+        (self.announcements if self.on_hold else self._recent_speech).append(entry)
+
+    def on_transcript(self, text):
+        """
+        A final transcript that is entirely a hold announcement: remember how it
+        sounded, and let music that follows enter hold sooner. Never suspends by itself.
+        """
+        if not is_hold_message(text):
+            return False
+        self._hint_at = time.monotonic()
+        self.announcements.extend(self._recent_speech)
+        self._recent_speech.clear()
+        return True
+
+    def looks_like_hold(self):
+        """Whether the audio itself currently says hold (suspended, or music playing)"""
+        return self.on_hold or self._state_since["music"] is not None
+
+    def suspend(self, reason):
+        self.on_hold = True
+        self.holds += 1
+        self._hold_started = time.monotonic()
+        # Recent speech-like audio was the hold message itself
+        self._state_since["live"] = None
+        self.announcements.extend(self._recent_speech)
+        self._recent_speech.clear()
+        print(f"Hold detected ({reason}); suspending STT/LLM input")
+        self.session.interrupt()
+        self.session.input.set_audio_enabled(False)
+
+    def resume(self):
+        self.on_hold = False
+        self.hold_seconds += time.monotonic() - self._hold_started
+        self._hold_started = None
+        print("Voice detected; resuming STT/LLM input")
+        self.session.input.set_audio_enabled(True)
+
+    def metrics(self):
+        hold_seconds = self.hold_seconds
+        if self.on_hold:
+            hold_seconds += time.monotonic() - self._hold_started
+        return {
+            "holds": self.holds,
+            "hold_seconds": round(hold_seconds, 1),
+            "stt_seconds_saved": round(hold_seconds, 1),
+            "stt_cost_saved_usd": round(hold_seconds / 60 * HOLD_STT_COST_PER_MINUTE, 4),
+            "monitor_cpu_ms": round(self.monitor_cpu_s * 1000, 1),
+        }
+
+    async def aclose(self):
+        if self._task:
+            self._task.cancel()
@@ -0,0 +1,225 @@
+"""
+IVR navigation for outbound calls.
+
+Clinics often answer with an automated menu ("press 1 for appointments").
+Talking to it through the LLM wastes minutes, so the agent checks every
+completed user turn first:
+
+  - menu prompts are recognized from transcript patterns ("press 2 for
+    scheduling", "for billing, press 3") plus the usual recording cues
+    ("please listen carefully", "menu options have changed") and replays of
+    the same prompt, which a person never does word for word
+  - the best option (appointments/scheduling, then new patients, then an
+    operator) is sent as a DTMF tone straight away, with no LLM turn; other
+    recordings (announcements, hold loops) get no reply and no keypress, and
+    are left to the hold detector
+  - when a person picks up after the menu, the digits that got there are
+    stored per clinic phone number (IVR_CACHE_DB) and sent as the SIP
+    participant's dtmf on the next call, so repeat calls skip the menu
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+IVR_ENABLED = os.getenv("IVR_ENABLED", "true").lower() in ("1", "true", "yes")
+IVR_CACHE_DB = os.getenv("IVR_CACHE_DB", "ivr_paths.db")
+# Each "w" is a 0.5 s pause before a cached digit, giving the menu time to start
+IVR_DTMF_PAUSE = os.getenv("IVR_DTMF_PAUSE", "wwww")
+IVR_MAX_PATH_FAILURES = int(os.getenv("IVR_MAX_PATH_FAILURES", "2"))
+IVR_MAX_UNMATCHED_MENUS = int(os.getenv("IVR_MAX_UNMATCHED_MENUS", "2"))
+
+# Option labels worth pressing, best first
+TARGETS = [
+    ["appointment", "scheduling", "schedule", "book"],
+    ["new patient"],
+    ["front desk", "receptionist", "operator", "speak to", "speak with", "talk to", "all other", "staff member"],
+]
+AVOID = ["pharmacy", "refill", "billing", "bill", "records", "nurse line", "emergency", "lab results", "cancel"]
+
+RECORDING_CUES = [
+    "please listen carefully", "menu options have changed", "para español", "para espanol",
+    "if this is a medical emergency", "if you know your party's extension", "please select from the following",
+    "main menu", "to repeat these options",
+]
+
+DTMF_CODES = {**{str(d): d for d in range(10)}, "*": 10, "#": 11}
+
+_digit = r"(\d|star|pound|zero|one|two|three|four|five|six|seven|eight|nine)"
+_press_for_re = re.compile(rf"\b(?:press|dial|select|say)\s+{_digit}\s*,?\s*(?:for|to)\s+([^.,;]+)", re.I)
+_for_press_re = re.compile(rf"\b(?:for|to)\s+([^.,;]+?)\s*,?\s*(?:please\s+)?(?:press|dial)\s+{_digit}\b", re.I)
+# Any keypress or spoken-option prompt, even one parse_menu can't split into options
+_prompt_re = re.compile(rf"\b(?:press|dial|select|say)\s+{_digit}\b|\bmain menu\b|\bmenu options\b|\bthese options\b", re.I)
+_words = {"zero": "0", "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+          "six": "6", "seven": "7", "eight": "8", "nine": "9", "star": "*", "pound": "#"}
+
+_lock = threading.Lock()
+_initialized = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ivr_paths (
+    phone TEXT PRIMARY KEY,
+    digits TEXT NOT NULL,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(IVR_CACHE_DB, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(SCHEMA)
+        _initialized = True
+    return conn
+
+
+def phone_key(phone_number):
+    digits = re.sub(r"\D", "", str(phone_number or ""))
+    return digits[-10:] if len(digits) >= 10 else digits
+
+
+def cached_path(phone_number):
+    """Digits that reached a person on earlier calls to this number, or None"""
+    key = phone_key(phone_number)
+    if not key:
+        return None
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT digits, failures FROM ivr_paths WHERE phone = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+    if row and row[1] < IVR_MAX_PATH_FAILURES:
+        return row[0]
+    return None
+
+
+def remember_path(phone_number, digits):
+    key = phone_key(phone_number)
+    if not key or not digits:
+        return
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO ivr_paths (phone, digits, successes, failures, updated_at) VALUES (?, ?, 1, 0, ?) "
+                    "ON CONFLICT(phone) DO UPDATE SET successes = CASE WHEN digits = excluded.digits "
+                    "THEN successes + 1 ELSE 1 END, failures = 0, digits = excluded.digits, updated_at = excluded.updated_at",
+                    (key, digits, time.time()),
+                )
+        finally:
+            conn.close()
+
+
+def forget_path(phone_number):
+    """Count a call where the cached digits didn't get past the menu"""
+    key = phone_key(phone_number)
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE ivr_paths SET failures = failures + 1, updated_at = ? WHERE phone = ?",
+                    (time.time(), key),
+                )
+        finally:
+            conn.close()
+
+
+def dial_dtmf(digits):
+    """SIP participant dtmf string for a cached path: a pause before each digit"""
+    return "".join(IVR_DTMF_PAUSE + digit for digit in digits) if digits else ""
+
+
+def parse_menu(text):
+    """Menu options in a transcript as [(digit, label)]"""
+    options = []
+    for digit, label in _press_for_re.findall(text):
+        options.append((_words.get(digit.lower(), digit), label.strip().lower()))
+    for label, digit in _for_press_re.findall(text):
+        options.append((_words.get(digit.lower(), digit), label.strip().lower()))
+    return options
+
+
+def choose_option(options):
+    """The digit for the best option on the menu, or None"""
+    for keywords in TARGETS:
+        for digit, label in options:
+            if any(k in label for k in keywords) and not any(a in label for a in AVOID):
+                return digit
+    return None
+
+
+def is_menu_prompt(text):
+    """Whether a transcript asks the caller to pick an option"""
+    return bool(parse_menu(text) or _prompt_re.search(text))
+
+
+def looks_automated(text, previous=None):
+    lowered = text.lower()
+    return (
+        bool(parse_menu(text))
+        or any(cue in lowered for cue in RECORDING_CUES)
+        or (previous is not None and lowered.strip() == previous.lower().strip() and len(lowered) > 40)
+    )
+
+
+class IVRNavigator:
+    """Per-call IVR state: decides whether a user turn is a menu and which key to press"""
+
+    def __init__(self, phone_number, send_dtmf, cached_digits=None):
+        self.phone_number = phone_number
+        self.send_dtmf = send_dtmf
+        self.cached_digits = cached_digits
+        self.pressed = ""
+        self.unmatched = 0
+        self.reached_person = False
+        self.previous = None
+        self.stats = {"menus": 0, "digits_sent": 0, "llm_turns_skipped": 0}
+
+    async def handle_turn(self, text):
+        """
+        Handle a completed user turn. Returns True if it was an automated
+        prompt (handled here, no LLM reply), False if a person is speaking.
+        """
+        if self.reached_person or not text:
+            return False
+
+        previous, self.previous = self.previous, text
+        if not looks_automated(text, previous):
+            if self.pressed or self.cached_digits:
+                self.reached_person = True
+                remember_path(self.phone_number, self.cached_digits or self.pressed)
+                print(f"IVR: reached a person after '{self.cached_digits or self.pressed}'")
+            return False
+
+        self.stats["menus"] += 1
+        self.stats["llm_turns_skipped"] += 1
+        if self.cached_digits and not self.pressed:
+            # The cached path didn't get us past the menu; navigate it from here
+            forget_path(self.phone_number)
+            self.cached_digits = None
+
+        if not is_menu_prompt(text):
+            # An announcement or hold loop: nothing to press, the hold detector takes it from here
+            return True
+
+        digit = choose_option(parse_menu(text))
+        if digit is None:
+            self.unmatched += 1
+            if self.unmatched < IVR_MAX_UNMATCHED_MENUS:
+                return True
+            # A menu without a usable option twice: try the operator
+            digit, self.unmatched = "0", 0
+
+        self.pressed += digit
+        self.stats["digits_sent"] += 1
+        print(f"IVR: pressing {digit} (path so far '{self.pressed}')")
+        await self.send_dtmf(digit)
+        return True
@@ -1,4 +1,6 @@
 from dotenv import load_dotenv
+import argparse
+import asyncio
 import requests
 import re
 import os 
@@ -6,6 +8,8 @@ import base64
 import json
 import time
 from callout import batch_call_doctors, make_appointment_call
+from batch import run_batch
+from dial_validation import normalize_e164
 load_dotenv()
 serp_api_key = os.getenv("SERP_API_KEY")
 # Replace with your actual SerpAPI key
@@ -25,14 +29,17 @@ def serp_search(query, location):
         "near": location,  # Specify near parameter
         "start": 0  # Start from first result
     }
-    response = requests.get(endpoint, params=params)
+    response = requests.get(endpoint, params=params, timeout=30)
     response.raise_for_status()
     return response.json()
 
 def extract_phone(text):
-    """Extract phone number from snippet using regex"""
-    match = re.search(r'(\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})', text)
-    return match.group(1) if match else None
+    """Extract a dialable (NANP-valid) phone number from snippet, in E.164 form"""
+    for match in re.finditer(r'(\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})', text):
+        e164, _, _ = normalize_e164(match.group(1))
+        if e164:
+            return e164
+    return None
 
 def get_multiple_pages_local_results(query, max_pages=3):
     """Get multiple pages of local results to increase the number of doctors found"""
@@ -49,7 +56,7 @@ def get_multiple_pages_local_results(query, max_pages=3):
         }
         
         try:
-            response = requests.get(endpoint, params=params)
+            response = requests.get(endpoint, params=params, timeout=30)
             response.raise_for_status()
             results = response.json()
                         
@@ -108,8 +115,8 @@ def image_to_base64(image_path):
     with open(image_path, "rb") as img:
         return base64.b64encode(img.read()).decode("utf-8")
 
-def get_insurance_card_data():
-    base64_image = image_to_base64("image3.jpeg")
+def get_insurance_card_data(image_path="image3.jpeg"):
+    base64_image = image_to_base64(image_path)
     response = requests.post(
         url="https://api.llama.com/v1/chat/completions",
         headers={
@@ -193,8 +200,10 @@ def get_insurance_card_data():
                     }
                 }
             }
-        }
+        },
+        timeout=30
     )
+    response.raise_for_status()
     response_data = response.json()
     parsed_data = {}
     # Extract and print the text content
@@ -215,7 +224,7 @@ def main():
     print("Extracting insurance details from the card...")
     print("-" * 50)
 
-    insurance_details = get_inurance_card_data()
+    insurance_details = get_insurance_card_data()
     print(f"Insurance details: {insurance_details}")
     insurance_provider = insurance_details.get("insurance_company", "")
     insurance_id = insurance_details.get("member_id", "")
@@ -251,7 +260,7 @@ def main():
     for doctor in doctors[0:1]:
         print(f"Doctor: {doctor}")
         print(f"Trying to book appointment with {doctor['title']} at {doctor['address']} for {dependent_name} with ({insurance_provider})")
-        result = make_appointment_call(doctor, patient_info, insurance_info)
+        result = asyncio.run(make_appointment_call(doctor, patient_info, insurance_info))
         print(f"Result: {result}")
         time.sleep(5)
         print("-" * 50)
@@ -264,5 +273,30 @@ def main():
     #     print(f"- {doctor_name}: {result['status']} - {result['message']}")
     
     print("Appointment booking process completed.")
+
+def batch_main(args):
+    """Process an intake file of patients (see batch.py)"""
+    print(f"Starting batch run for {args.batch}...")
+    stats = asyncio.run(run_batch(
+        args.batch,
+        extract=get_insurance_card_data,
+        search=search_doctors,
+        dispatch=make_appointment_call if args.dispatch else None,
+        checkpoint_path=args.checkpoint,
+        output_path=args.output,
+        calls_per_patient=args.calls_per_patient
+    ))
+    print(f"Batch run completed: {stats}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Find in-network doctors and book appointments")
+    parser.add_argument("--batch", metavar="INTAKE", help="CSV or JSONL of patients to process (card_image, specialty, location, preferred_dates)")
+    parser.add_argument("--checkpoint", help="Checkpoint file to resume from (default: INTAKE.checkpoint.jsonl)")
+    parser.add_argument("--output", help="Results file (default: INTAKE.results.jsonl)")
+    parser.add_argument("--dispatch", action="store_true", help="Also place appointment calls (default: extract and search only)")
+    parser.add_argument("--calls-per-patient", type=int, default=1, help="Doctors to call per patient with --dispatch")
+    args = parser.parse_args()
+    if args.batch:
+        batch_main(args)
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""
+Preemptive LLM generation on interim transcripts.
+
+Normally the LLM turn starts only after the turn detector decides the
+receptionist has finished and the final transcript arrives, so every
+reply pays STT finalization and the full LLM latency back to back.
+PreemptiveDrafter starts drafting as soon as an interim transcript has been
+stable for PREEMPT_STABLE_MS:
+
+  - the draft streams from the session's LLM in the background with the
+    current chat context plus the interim text as the user message
+  - when the turn completes, Assistant.llm_node commits the draft if the
+    turn's chat context, minus its new user message, is the one the draft
+    was started from (same history, instructions and tools) and the final
+    transcript matches the drafted text (PREEMPT_MATCH_RATIO), replaying the
+    chunks already received and streaming the rest
+  - otherwise the draft is cancelled and a normal LLM turn runs
+
+Off by default (PREEMPTIVE_GENERATION). When the installed livekit-agents
+has AgentSession(preemptive_generation=...) (1.2+), that built-in is used
+instead of PreemptiveDrafter; see use_builtin().
+
+Needs an STT that emits interim transcripts. Metrics: drafts started,
+commit rate and response latency saved per committed turn.
+"""
+import asyncio
+import difflib
+import inspect
+import os
+import re
+import time
+
+PREEMPTIVE_GENERATION = os.getenv("PREEMPTIVE_GENERATION", "false").lower() in ("1", "true", "yes")
+PREEMPT_STABLE_MS = float(os.getenv("PREEMPT_STABLE_MS", "250"))
+PREEMPT_MIN_WORDS = int(os.getenv("PREEMPT_MIN_WORDS", "3"))
+PREEMPT_MATCH_RATIO = float(os.getenv("PREEMPT_MATCH_RATIO", "0.95"))
+
+
+def normalize_transcript(text):
+    return " ".join(re.sub(r"[^\w\s']", " ", (text or "").lower()).split())
+
+
+def use_builtin():
+    """Whether AgentSession does preemptive generation itself (livekit-agents 1.2+)"""
+    from livekit.agents import AgentSession
+    return PREEMPTIVE_GENERATION and "preemptive_generation" in inspect.signature(AgentSession.__init__).parameters
+
+
+def _fingerprint(item):
+    """What the LLM sees of one chat item"""
+    if item.type == "message":
+        return item.type, item.role, item.text_content
+    if item.type == "function_call":
+        return item.type, item.call_id, item.name, item.arguments
+    if item.type == "function_call_output":
+        return item.type, item.call_id, item.output, item.is_error
+    return item.type, item.id
+
+
+def _tool_name(tool):
+    info = (getattr(tool, "info", None) or getattr(tool, "__livekit_tool_info", None)
+            or getattr(tool, "__livekit_raw_tool_info", None))
+    return getattr(info, "name", None) or getattr(tool, "__name__", repr(tool))
+
+
+def context_fingerprint(items, tools):
+    """What an LLM turn over these chat items and tools is conditioned on"""
+    return [_fingerprint(item) for item in items], sorted(_tool_name(tool) for tool in tools)
+
+
+class Draft:
+    """One speculative LLM response, buffered so it can be replayed on commit"""
+
+    def __init__(self, text, started_at, context=None):
+        self.text = text
+        self.started_at = started_at
+        # context_fingerprint() of the chat context it was drafted from, without the interim message
+        self.context = context
+        self.first_chunk_at = None
+        self.chunks = []
+        self.done = False
+        self.task = None
+        self._updated = asyncio.Event()
+
+    async def run(self, llm, chat_ctx, tools):
+        try:
+            async with llm.chat(chat_ctx=chat_ctx, tools=tools) as stream:
+                async for chunk in stream:
+                    if self.first_chunk_at is None:
+                        self.first_chunk_at = time.perf_counter()
+                    self.chunks.append(chunk)
+                    self._updated.set()
+        finally:
+            self.done = True
+            self._updated.set()
+
+    async def stream(self):
+        """Chunks received so far, then the rest as they arrive"""
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.task and not self.task.cancelled() and self.task.exception():
+                    raise self.task.exception()
+                return
+            self._updated.clear()
+            await self._updated.wait()
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+
+class PreemptiveDrafter:
+    """Starts drafts on stable interim transcripts and decides commit/discard per turn"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.draft = None
+        self._timer = None
+        self.stats = {"drafts_started": 0, "committed": 0, "discarded": 0, "latency_saved_ms": []}
+
+    def on_transcript(self, text, is_final):
+        """Feed user_input_transcribed events"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if is_final or len(normalize_transcript(text).split()) < PREEMPT_MIN_WORDS:
+            return
+        if self.draft and normalize_transcript(self.draft.text) == normalize_transcript(text):
+            return
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(PREEMPT_STABLE_MS / 1000, self._start, text)
+
+    def _start(self, text):
+        self._timer = None
+        self.discard()
+        session = self.agent.session
+        if session.llm is None:
+            return
+        chat_ctx = self.agent.chat_ctx.copy()
+        tools = list(self.agent.tools)
+        context = context_fingerprint(chat_ctx.items, tools)
+        chat_ctx.add_message(role="user", content=text)
+
+        self.draft = Draft(text, time.perf_counter(), context)
+        self.draft.task = asyncio.create_task(self.draft.run(session.llm, chat_ctx, tools))
+        self.stats["drafts_started"] += 1
+
+    def discard(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self.draft:
+            self.draft.cancel()
+            self.draft = None
+            self.stats["discarded"] += 1
+
+    def take(self, chat_ctx, tools):
+        """
+        The draft to commit for this LLM turn, or None (any stale draft is discarded).
+        Only a turn that ends with the user's message, over the same history,
+        instructions and tools the draft was started from, can use a draft.
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        draft, self.draft = self.draft, None
+        if draft is None:
+            return None
+
+        last = chat_ctx.items[-1] if chat_ctx.items else None
+        final = last.text_content if last is not None and last.type == "message" and last.role == "user" else None
+        ratio = difflib.SequenceMatcher(None, normalize_transcript(draft.text), normalize_transcript(final)).ratio() if final else 0.0
+        # Anything else that changed since the draft started (a tool result, trimmed history,
+        # new instructions) means it answered a different prompt
+        same_context = final is not None and draft.context == context_fingerprint(chat_ctx.items[:-1], tools)
+        if ratio < PREEMPT_MATCH_RATIO or not same_context or (draft.task.done() and draft.task.cancelled()):
+            draft.cancel()
+            self.stats["discarded"] += 1
+            return None
+
+        # Saved: the head start the draft had, up to its time to first token
+        now = time.perf_counter()
+        first = draft.first_chunk_at or now
+        saved = max(0.0, min(now, first) - draft.started_at)
+        self.stats["committed"] += 1
+        self.stats["latency_saved_ms"].append(round(saved * 1000))
+        return draft
+
+    def metrics(self):
+        decided = self.stats["committed"] + self.stats["discarded"]
+        saved = self.stats["latency_saved_ms"]
+        return {
+            "preemptive_drafts": self.stats["drafts_started"],
+            "preemptive_commit_rate": round(self.stats["committed"] / decided, 3) if decided else 0.0,
+            "preemptive_saved_ms_avg": round(sum(saved) / len(saved)) if saved else 0,
+            "preemptive_saved_ms_total": sum(saved),
+        }
@@ -0,0 +1,288 @@
+"""
+Load reporting and capacity for LiveKit agent workers.
+
+The default worker load is CPU only, so a node whose calls are all waiting
+on audio still looks idle while audio callbacks run late. WorkerLoad
+reports the worst of:
+
+  - active sessions / WORKER_MAX_SESSIONS (this worker process)
+  - host sessions / HOST_MAX_SESSIONS (all worker processes on the host)
+  - CPU utilization of the host or container
+  - event-loop lag in the job processes / WORKER_MAX_LAG_MS
+
+as WorkerOptions.load_fnc, and the worker marks itself full (no new jobs)
+once that reaches WORKER_LOAD_THRESHOLD.
+
+Job processes measure their event-loop lag with LagMonitor; every process
+writes its numbers to a small status file in WORKER_STATUS_DIR, which is
+how worker processes on the same host see each other's sessions and lag.
+Job status files carry the pid of the worker that started the job, and a
+worker only counts the lag of its own jobs.
+capacity_report() turns those files into a per-host report for the
+autoscaler (python worker_load.py report, or GET /capacity on
+WORKER_CAPACITY_PORT).
+
+WORKER_PROCESSES > 1 runs that many worker processes per host (see
+run_workers()), each with its own health-check port.
+"""
+import asyncio
+import atexit
+import glob
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORKER_MAX_SESSIONS = int(os.getenv("WORKER_MAX_SESSIONS", "8"))
+HOST_MAX_SESSIONS = int(os.getenv("HOST_MAX_SESSIONS", "0")) or None
+WORKER_MAX_LAG_MS = float(os.getenv("WORKER_MAX_LAG_MS", "100"))
+WORKER_LOAD_THRESHOLD = float(os.getenv("WORKER_LOAD_THRESHOLD", "0.75"))
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_HTTP_PORT_BASE = int(os.getenv("WORKER_HTTP_PORT_BASE", "8081"))
+WORKER_CAPACITY_PORT = int(os.getenv("WORKER_CAPACITY_PORT", "0")) or None
+WORKER_STATUS_DIR = os.getenv("WORKER_STATUS_DIR", "/tmp/medicall-workers")
+# Target utilization the capacity report sizes the fleet for
+WORKER_TARGET_UTILIZATION = float(os.getenv("WORKER_TARGET_UTILIZATION", "0.6"))
+
+STATUS_INTERVAL = 2.0
+# Status files older than this belong to processes that are gone
+STATUS_STALE_SECONDS = 10.0
+# Job processes exit with their job, so their lag expires sooner
+JOB_STATUS_STALE_SECONDS = 2.5 * STATUS_INTERVAL
+# Set by the worker process and inherited by its job processes
+WORKER_PID_ENV = "MEDICALL_WORKER_PID"
+
+
+def _status_path(name):
+    return os.path.join(WORKER_STATUS_DIR, f"{name}.json")
+
+
+def _write_status(name, status):
+    os.makedirs(WORKER_STATUS_DIR, exist_ok=True)
+    path = _status_path(name)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({**status, "pid": os.getpid(), "updated_at": time.time()}, f)
+    os.replace(tmp, path)
+
+
+def read_statuses(kind=None):
+    """Fresh status files (optionally only "worker" or "job" ones); stale ones are removed"""
+    statuses = []
+    for path in glob.glob(os.path.join(WORKER_STATUS_DIR, f"{kind or '*'}-*.json")):
+        try:
+            with open(path) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            continue
+        kind = os.path.basename(path).split("-", 1)[0]
+        stale_after = JOB_STATUS_STALE_SECONDS if kind == "job" else STATUS_STALE_SECONDS
+        if time.time() - status.get("updated_at", 0) > stale_after:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        status["kind"] = kind
+        statuses.append(status)
+    return statuses
+
+
+class LagMonitor:
+    """Event-loop lag of one job process: how late a periodic timer fires"""
+
+    def __init__(self, interval=0.05, window=200):
+        self.interval = interval
+        self.window = window
+        self.samples = []
+        self.worker_pid = int(os.getenv(WORKER_PID_ENV) or os.getppid())
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            atexit.register(self._remove_status)
+
+    def _remove_status(self):
+        try:
+            os.remove(_status_path(f"job-{os.getpid()}"))
+        except OSError:
+            pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_report = 0.0
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, (loop.time() - expected) * 1000))
+            del self.samples[:-self.window]
+            if loop.time() - last_report >= STATUS_INTERVAL:
+                last_report = loop.time()
+                try:
+                    _write_status(f"job-{os.getpid()}", {**self.stats(), "worker_pid": self.worker_pid})
+                except OSError as e:
+                    print(f"Could not write job load status: {e}")
+
+    def stats(self):
+        ordered = sorted(self.samples) or [0.0]
+        return {
+            "lag_p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            "lag_max_ms": round(ordered[-1], 1),
+        }
+
+
+_lag_monitor = None
+
+
+def ensure_lag_monitor():
+    """Start this job process's lag monitor (once per process); call from the entrypoint"""
+    global _lag_monitor
+    if _lag_monitor is None:
+        _lag_monitor = LagMonitor()
+        _lag_monitor.start()
+    return _lag_monitor
+
+
+class WorkerLoad:
+    """WorkerOptions.load_fnc for one worker process"""
+
+    def __init__(self, index=0):
+        self.index = index
+        # Job processes tag their lag with this worker's pid
+        os.environ[WORKER_PID_ENV] = str(os.getpid())
+        self.cpu = 0.0
+        self.last = {}
+        self._last_status = 0.0
+        self._cpu_thread = threading.Thread(target=self._sample_cpu, daemon=True, name="worker_load_cpu")
+        self._cpu_thread.start()
+
+    def _sample_cpu(self):
+        try:
+            from livekit.agents.utils.hw import get_cpu_monitor
+            monitor = get_cpu_monitor()
+        except Exception as e:
+            print(f"CPU monitor unavailable, load ignores CPU: {e}")
+            return
+        while True:
+            # Smoothed over ~2.5 s like the default load calculation
+            self.cpu = 0.8 * self.cpu + 0.2 * monitor.cpu_percent(interval=0.5)
+
+    def __call__(self, worker):
+        active = len(getattr(worker, "active_jobs", []) or [])
+        others = [s for s in read_statuses("worker") if s.get("pid") != os.getpid()]
+        host_sessions = active + sum(s.get("active_sessions", 0) for s in others)
+        jobs = [s for s in read_statuses("job") if s.get("worker_pid") == os.getpid()]
+        lag = max([s.get("lag_p95_ms", 0.0) for s in jobs] or [0.0])
+
+        parts = {
+            "sessions": active / WORKER_MAX_SESSIONS,
+            "host_sessions": host_sessions / HOST_MAX_SESSIONS if HOST_MAX_SESSIONS else 0.0,
+            "cpu": self.cpu,
+            "lag": lag / WORKER_MAX_LAG_MS,
+        }
+        load = min(1.0, max(parts.values()))
+        self.last = {
+            "index": self.index,
+            "active_sessions": active,
+            "max_sessions": WORKER_MAX_SESSIONS,
+            "cpu": round(self.cpu, 3),
+            "lag_p95_ms": lag,
+            "load": round(load, 3),
+            "limited_by": max(parts, key=parts.get),
+            "available": load < WORKER_LOAD_THRESHOLD,
+        }
+        if time.time() - self._last_status >= STATUS_INTERVAL:
+            self._last_status = time.time()
+            try:
+                _write_status(f"worker-{os.getpid()}", self.last)
+            except OSError as e:
+                print(f"Could not write worker load status: {e}")
+        return load
+
+
+def capacity_report():
+    """Sessions, spare capacity and a suggested worker count for this host"""
+    workers = read_statuses("worker")
+    sessions = sum(w.get("active_sessions", 0) for w in workers)
+    capacity = sum(w.get("max_sessions", WORKER_MAX_SESSIONS) for w in workers)
+    if HOST_MAX_SESSIONS:
+        capacity = min(capacity, HOST_MAX_SESSIONS)
+    available = [w for w in workers if w.get("available")]
+    per_worker = WORKER_MAX_SESSIONS * WORKER_TARGET_UTILIZATION
+    return {
+        "host": os.uname().nodename,
+        "workers": len(workers),
+        "available_workers": len(available),
+        "active_sessions": sessions,
+        "session_capacity": capacity,
+        "spare_sessions": sum(max(0, w.get("max_sessions", 0) - w.get("active_sessions", 0)) for w in available),
+        "max_load": max([w.get("load", 0.0) for w in workers] or [0.0]),
+        "max_lag_p95_ms": max([w.get("lag_p95_ms", 0.0) for w in workers] or [0.0]),
+        "saturated": bool(workers) and not available,
+        # Workers needed to run today's sessions at WORKER_TARGET_UTILIZATION (at least 1)
+        "desired_workers": max(1, math.ceil(sessions / per_worker)) if per_worker else len(workers),
+        "load_threshold": WORKER_LOAD_THRESHOLD,
+        "worker_details": sorted(workers, key=lambda w: w.get("index", 0)),
+    }
+
+
+class _CapacityHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/capacity":
+            self.send_error(404)
+            return
+        body = json.dumps(capacity_report()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_capacity_server(port=WORKER_CAPACITY_PORT):
+    """Serve GET /capacity from a background thread (no-op without a port)"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _CapacityHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="capacity_report").start()
+    print(f"Capacity report on http://0.0.0.0:{port}/capacity")
+    return server
+
+
+def run_workers(script, args, count=WORKER_PROCESSES):
+    """
+    Run `count` worker processes of `script` on this host and wait for them.
+    Each gets WORKER_INDEX and its own health-check port; SIGINT/SIGTERM are
+    passed on so workers drain their calls.
+    """
+    start_capacity_server()
+    processes = []
+    for index in range(count):
+        env = dict(os.environ, WORKER_INDEX=str(index), WORKER_CAPACITY_PORT="0")
+        processes.append(subprocess.Popen([sys.executable, script, *args], env=env))
+    print(f"Started {count} agent worker processes: {[p.pid for p in processes]}")
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signum)
+
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+    return max(process.wait() for process in processes)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["report"]:
+        print("Usage: python worker_load.py report")
+        sys.exit(1)
+    print(json.dumps(capacity_report(), indent=2))